@@ -0,0 +1,210 @@
+import hashlib
+import hmac
+import ipaddress
+import math
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from cache import CACHE_BACKEND, cache
+
+# Control de admisión de /login y /register.
+#
+# Cada intento consume un token del bucket de su IP y del de su email; sin tokens
+# se responde 429 con Retry-After antes de tocar la base o bcrypt. Además, como
+# mucho BCRYPT_MAX_CONCURRENT verificaciones bcrypt corren a la vez por proceso:
+# si no hay cupo se responde 429 de inmediato en vez de encolar CPU. Los pares
+# email/contraseña que acaban de fallar se recuerdan en una caché negativa y se
+# rechazan sin volver a calcular bcrypt.
+#
+# Con una caché compartida (CACHE_BACKEND compartida o resp) los límites por IP y
+# por email cuentan los intentos de todos los workers; con la de memoria, de cada
+# proceso. Detrás de un proxy de TRUSTED_PROXIES la IP es la de X-Forwarded-For.
+
+# Configuración desde .env (capacidad del bucket y tokens repuestos por minuto)
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_MINUTE = int(os.getenv("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_MINUTE = int(os.getenv("LOGIN_EMAIL_PER_MINUTE", "5"))
+BCRYPT_MAX_CONCURRENT = int(os.getenv("BCRYPT_MAX_CONCURRENT", str(os.cpu_count() or 2)))
+LOGIN_NEGATIVE_TTL = int(os.getenv("LOGIN_NEGATIVE_TTL", "300"))
+ADMISSION_MAX_ENTRIES = int(os.getenv("ADMISSION_MAX_ENTRIES", "10000"))
+# Proxies (IPs o redes CIDR, separadas por coma) cuyo X-Forwarded-For se respeta
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(red.strip(), strict=False)
+    for red in os.getenv("TRUSTED_PROXIES", "").split(",") if red.strip()
+]
+
+# La huella de la caché negativa usa una clave del proceso: lo que queda en memoria
+# no sirve para probar contraseñas fuera de línea
+_CLAVE_HUELLA = secrets.token_bytes(32)
+
+
+class MemoryBucketStore:
+    """Token buckets en memoria del proceso, acotados (LRU).
+
+    Otro almacén solo necesita implementar `tomar` y registrarse con `set_store`.
+    """
+
+    def __init__(self, max_entries: int = ADMISSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # clave -> (tokens, instante)
+        self._lock = threading.Lock()
+
+    def tomar(self, clave: str, capacidad: float, por_segundo: float) -> float:
+        """Consumir un token; devuelve 0 si se admitió o los segundos hasta el próximo token."""
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, instante = self._buckets.pop(clave, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - instante) * por_segundo)
+            espera = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / por_segundo
+            self._buckets[clave] = (tokens, ahora)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return espera
+
+
+class CacheBucketStore:
+    """Límites compartidos entre workers sobre la caché de cache.py.
+
+    Aproxima el bucket con ventanas fijas: `capacidad` intentos por ventana del
+    tiempo que tarda en reponerse el bucket completo, contados con INCR sobre una
+    clave que vence con la ventana. Si la caché no responde, cuenta el proceso.
+    """
+
+    def __init__(self):
+        self._local = MemoryBucketStore()
+
+    def tomar(self, clave: str, capacidad: float, por_segundo: float) -> float:
+        periodo = capacidad / por_segundo
+        ahora = time.time()
+        ventana = int(ahora // periodo)
+        intentos = cache().incr(f"admision:{clave}:{ventana}", ttl=periodo)
+        if intentos is None:
+            return self._local.tomar(clave, capacidad, por_segundo)
+        if intentos <= capacidad:
+            return 0.0
+        return (ventana + 1) * periodo - ahora
+
+
+class NegativeCache:
+    """Huellas de intentos fallidos recientes con vencimiento (LRU acotado)."""
+
+    def __init__(self, ttl: int = LOGIN_NEGATIVE_TTL, max_entries: int = ADMISSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contiene(self, huella: bytes) -> bool:
+        with self._lock:
+            vence = self._entradas.get(huella)
+            if vence is None:
+                return False
+            if vence < time.monotonic():
+                del self._entradas[huella]
+                return False
+            return True
+
+    def agregar(self, huella: bytes):
+        with self._lock:
+            self._entradas.pop(huella, None)
+            self._entradas[huella] = time.monotonic() + self.ttl
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+
+
+_store = MemoryBucketStore() if CACHE_BACKEND == "memoria" else CacheBucketStore()
+_negativos = NegativeCache()
+_bcrypt_cupos = threading.BoundedSemaphore(max(1, BCRYPT_MAX_CONCURRENT))
+
+
+def set_store(store):
+    """Usar otro almacén de buckets (p.ej. uno compartido entre workers)."""
+    global _store
+    _store = store
+
+
+def _rechazar(segundos: float, detail: str):
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(segundos)))},
+    )
+
+
+def _confiable(ip: str) -> bool:
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(direccion in red for red in TRUSTED_PROXIES)
+
+
+def _ip_cliente(request: Request) -> str:
+    """IP del cliente. Si la conexión viene de un proxy confiable, X-Forwarded-For se
+    recorre de derecha a izquierda hasta la primera dirección que no es un proxy
+    (lo que está más a la izquierda lo escribe el cliente y no se puede creer)."""
+    ip = request.client.host if request.client else "desconocida"
+    if not TRUSTED_PROXIES or not _confiable(ip):
+        return ip
+    saltos = [
+        salto.strip()
+        for cabecera in request.headers.getlist("x-forwarded-for")
+        for salto in cabecera.split(",") if salto.strip()
+    ]
+    for salto in reversed(saltos):
+        if not _confiable(salto):
+            return salto
+        ip = salto
+    return ip
+
+
+def admitir(request: Request, email: str = None):
+    """Consumir un intento de los buckets de la IP y del email; 429 si no quedan."""
+    espera = _store.tomar(f"ip:{_ip_cliente(request)}", LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60)
+    if espera:
+        _rechazar(espera, "Demasiados intentos desde esta dirección, intenta más tarde")
+    if email:
+        espera = _store.tomar(f"email:{email.strip().lower()}", LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE / 60)
+        if espera:
+            _rechazar(espera, "Demasiados intentos para esta cuenta, intenta más tarde")
+
+
+def _con_cupo_bcrypt(funcion, *args):
+    if not _bcrypt_cupos.acquire(blocking=False):
+        _rechazar(1, "Servidor ocupado, intenta de nuevo en un momento")
+    try:
+        return funcion(*args)
+    finally:
+        _bcrypt_cupos.release()
+
+
+def _huella(email: str, password: str, hashed_password: str) -> bytes:
+    # El hash guardado entra en la huella: si cambia la contraseña, la entrada ya no aplica
+    mensaje = "\0".join((email.strip().lower(), password, hashed_password)).encode()
+    return hmac.new(_CLAVE_HUELLA, mensaje, hashlib.sha256).digest()
+
+
+async def verificar_password(pwd_context, email: str, password: str, hashed_password: str) -> bool:
+    """bcrypt fuera del event loop, con cupo global y caché negativa de fallos."""
+    huella = _huella(email, password, hashed_password)
+    if _negativos.contiene(huella):
+        return False
+    valida = await run_in_threadpool(_con_cupo_bcrypt, pwd_context.verify, password, hashed_password)
+    if not valida:
+        _negativos.agregar(huella)
+    return valida
+
+
+async def hash_password(pwd_context, password: str) -> str:
+    return await run_in_threadpool(_con_cupo_bcrypt, pwd_context.hash, password)
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+
+from models import Aprendiz, Asistencia, Sesion
+
+# Archivo frío de asistencia por año escolar.
+#
+# Los años cerrados se exportan a Parquet (forma larga ya expandida:
+# profesora_id, aprendiz_id, fecha, presente) y se borran de las tablas calientes.
+# manifest.json registra qué años están archivados; las lecturas de sesiones.expandir
+# unen esos archivos con la tabla caliente solo cuando el rango pedido los toca.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archivo"))
+# Mes en que empieza el año escolar (1 = calendario A, enero a diciembre)
+SCHOOL_YEAR_START_MONTH = int(os.getenv("SCHOOL_YEAR_START_MONTH", "1"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+MANIFEST = "manifest.json"
+_LOTE_APRENDICES = 500
+_LOTE_BORRADO = 10000
+
+_lock = threading.Lock()
+_manifest_cache = None  # (mtime, dict)
+
+
+def _requiere_pyarrow():
+    if pa is None:
+        raise RuntimeError("El archivo de asistencia requiere el paquete pyarrow")
+
+
+def anio_escolar(fecha: date) -> int:
+    """Año escolar de una fecha (identificado por el año en que empieza)."""
+    return fecha.year if fecha.month >= SCHOOL_YEAR_START_MONTH else fecha.year - 1
+
+
+def rango_anio(anio: int) -> Tuple[date, date]:
+    """Primer y último día de un año escolar."""
+    desde = date(anio, SCHOOL_YEAR_START_MONTH, 1)
+    if SCHOOL_YEAR_START_MONTH == 1:
+        return desde, date(anio, 12, 31)
+    return desde, date.fromordinal(date(anio + 1, SCHOOL_YEAR_START_MONTH, 1).toordinal() - 1)
+
+
+def _ruta_manifest() -> str:
+    return os.path.join(ARCHIVE_DIR, MANIFEST)
+
+
+def leer_manifest() -> dict:
+    """Manifest de años archivados (cacheado mientras el archivo no cambie)."""
+    global _manifest_cache
+    ruta = _ruta_manifest()
+    try:
+        mtime = os.stat(ruta).st_mtime
+    except FileNotFoundError:
+        return {"anios": {}}
+    with _lock:
+        if _manifest_cache is not None and _manifest_cache[0] == mtime:
+            return _manifest_cache[1]
+        with open(ruta, encoding="utf-8") as f:
+            manifest = json.load(f)
+        _manifest_cache = (mtime, manifest)
+        return manifest
+
+
+def _escribir_manifest(manifest: dict):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    temporal = _ruta_manifest() + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, _ruta_manifest())
+
+
+def anios_archivados(desde: Optional[date] = None, hasta: Optional[date] = None) -> List[dict]:
+    """Entradas del manifest cuyo rango se cruza con [desde, hasta]."""
+    resultado = []
+    for entrada in leer_manifest()["anios"].values():
+        if desde and date.fromisoformat(entrada["hasta"]) < desde:
+            continue
+        if hasta and date.fromisoformat(entrada["desde"]) > hasta:
+            continue
+        resultado.append(entrada)
+    return resultado
+
+
+def _sha256(ruta: str) -> str:
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def leer_celdas(
+    aprendiz_ids: Iterable[int],
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> Iterable[Tuple[int, date, bool, int]]:
+    """Celdas archivadas (aprendiz_id, fecha, presente, profesora_id) del rango.
+
+    Solo se abren los años que se cruzan con el rango, y el filtro por aprendiz
+    y fecha se empuja al lector de Parquet (salta row groups completos).
+    """
+    entradas = anios_archivados(desde, hasta)
+    aprendiz_ids = list(set(aprendiz_ids))
+    if not entradas or not aprendiz_ids:
+        return
+    _requiere_pyarrow()
+
+    filtros = [("aprendiz_id", "in", aprendiz_ids)]
+    if desde:
+        filtros.append(("fecha", ">=", desde))
+    if hasta:
+        filtros.append(("fecha", "<=", hasta))
+    for entrada in entradas:
+        tabla = pq.read_table(
+            os.path.join(ARCHIVE_DIR, entrada["archivo"]),
+            columns=["aprendiz_id", "fecha", "presente", "profesora_id"],
+            filters=filtros
+        )
+        columnas = tabla.to_pydict()
+        yield from zip(columnas["aprendiz_id"], columnas["fecha"], columnas["presente"], columnas["profesora_id"])
+
+
+def _tabla_particionada(db: Session) -> bool:
+    if db.get_bind().dialect.name != "mysql":
+        return False
+    return bool(db.execute(text(
+        "SELECT COUNT(*) FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = 'asistencias' AND partition_name IS NOT NULL"
+    )).scalar())
+
+
+def _particion_del_anio(db: Session, anio: int) -> Optional[str]:
+    nombre = f"p{anio}"
+    existe = db.execute(text(
+        "SELECT COUNT(*) FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = 'asistencias' AND partition_name = :nombre"
+    ), {"nombre": nombre}).scalar()
+    return nombre if existe else None
+
+
+def _particion_solo_del_rango(db: Session, particion: str, desde: date, hasta: date) -> bool:
+    """Si la partición no tiene filas fuera de [desde, hasta] (p.ej. la primera
+    partición de una tabla particionada antes de existir p_old, o límites
+    calculados con otro SCHOOL_YEAR_START_MONTH)."""
+    fuera = db.execute(text(
+        f"SELECT COUNT(*) FROM asistencias PARTITION ({particion}) WHERE fecha < :desde OR fecha > :hasta"
+    ), {"desde": desde, "hasta": hasta}).scalar()
+    return not fuera
+
+
+def archivar(db: Session, anio: int) -> dict:
+    """Exportar un año escolar cerrado a Parquet y sacarlo de las tablas calientes."""
+    # Import local: sesiones importa este módulo para unir el archivo en las lecturas
+    from sesiones import expandir
+
+    _requiere_pyarrow()
+    desde, hasta = rango_anio(anio)
+    if hasta >= date.today():
+        raise ValueError(f"El año escolar {anio} no ha terminado ({desde} a {hasta})")
+    if str(anio) in leer_manifest()["anios"]:
+        raise ValueError(f"El año escolar {anio} ya está archivado")
+
+    # Forma larga ya expandida: el archivo conserva las ausencias y no depende
+    # del calendario de sesiones ni de la lista de aprendices del momento
+    esquema = pa.schema([
+        ("profesora_id", pa.int32()),
+        ("aprendiz_id", pa.int32()),
+        ("fecha", pa.date32()),
+        ("presente", pa.bool_()),
+    ])
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    nombre_archivo = f"asistencias_{anio}.parquet"
+    ruta = os.path.join(ARCHIVE_DIR, nombre_archivo)
+    temporal = ruta + ".tmp"
+    filas = 0
+    with pq.ParquetWriter(temporal, esquema, compression=ARCHIVE_COMPRESSION) as writer:
+        ultimo_id = 0
+        while True:
+            # Aprendices por lotes, ordenados: cada row group cubre un rango de aprendiz_id
+            aprendices = (
+                db.query(Aprendiz).filter(Aprendiz.id > ultimo_id).order_by(Aprendiz.id).limit(_LOTE_APRENDICES).all()
+            )
+            if not aprendices:
+                break
+            ultimo_id = aprendices[-1].id
+            columnas = {"profesora_id": [], "aprendiz_id": [], "fecha": [], "presente": []}
+            for aprendiz_id, celdas in expandir(db, aprendices, desde, hasta, incluir_archivo=False).items():
+                for fecha in sorted(celdas):
+                    presente, _, profesora_id = celdas[fecha]
+                    columnas["profesora_id"].append(profesora_id)
+                    columnas["aprendiz_id"].append(aprendiz_id)
+                    columnas["fecha"].append(fecha)
+                    columnas["presente"].append(presente)
+            if columnas["fecha"]:
+                writer.write_table(pa.table(columnas, schema=esquema))
+                filas += len(columnas["fecha"])
+            db.expunge_all()
+
+    # Verificar antes de borrar nada de la base
+    if pq.ParquetFile(temporal).metadata.num_rows != filas:
+        os.remove(temporal)
+        raise RuntimeError("El archivo Parquet no coincide con las filas exportadas")
+    os.replace(temporal, ruta)
+
+    # Sacar el año de las tablas calientes: DROP PARTITION si existe y solo tiene
+    # filas del año; si no, DELETE por lotes
+    particion = _particion_del_anio(db, anio) if _tabla_particionada(db) else None
+    if particion and not _particion_solo_del_rango(db, particion, desde, hasta):
+        print(f"⚠️ La partición {particion} tiene filas fuera de {desde} a {hasta}; se borra por lotes")
+        particion = None
+    if particion:
+        db.execute(text(f"ALTER TABLE asistencias DROP PARTITION {particion}"))
+    else:
+        while True:
+            ids = [
+                i for (i,) in db.query(Asistencia.id)
+                .filter(Asistencia.fecha >= desde, Asistencia.fecha <= hasta).limit(_LOTE_BORRADO)
+            ]
+            if not ids:
+                break
+            db.execute(delete(Asistencia).where(Asistencia.id.in_(ids)).execution_options(synchronize_session=False))
+            db.commit()
+    db.execute(
+        delete(Sesion).where(Sesion.fecha >= desde, Sesion.fecha <= hasta).execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    manifest = leer_manifest()
+    manifest = {**manifest, "anios": dict(manifest["anios"])}
+    manifest["anios"][str(anio)] = {
+        "anio": anio,
+        "archivo": nombre_archivo,
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "filas": filas,
+        "bytes": os.path.getsize(ruta),
+        "sha256": _sha256(ruta),
+        "compresion": ARCHIVE_COMPRESSION,
+        "creado": datetime.now().isoformat(timespec="seconds"),
+    }
+    _escribir_manifest(manifest)
+    return manifest["anios"][str(anio)]
+
+
+def ddl_particiones(desde_anio: int, hasta_anio: int) -> List[str]:
+    """DDL de particionado RANGE por año escolar para MySQL.
+
+    MySQL exige que la columna de partición esté en todas las claves únicas y no
+    admite claves foráneas en tablas particionadas: se quitan las FK de asistencias
+    (los borrados en cascada ya se hacen con sentencias explícitas en borrado.py)
+    y la clave primaria pasa a (id, fecha). p_old recibe todo lo anterior a
+    desde_anio, así DROP PARTITION p<desde_anio> no se lleva años más viejos.
+    """
+    inicio = rango_anio(desde_anio)[0]
+    particiones = [f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{inicio.isoformat()}'))"]
+    for anio in range(desde_anio, hasta_anio + 1):
+        siguiente = rango_anio(anio + 1)[0]
+        particiones.append(f"PARTITION p{anio} VALUES LESS THAN (TO_DAYS('{siguiente.isoformat()}'))")
+    particiones.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return [
+        "ALTER TABLE asistencias DROP PRIMARY KEY, ADD PRIMARY KEY (id, fecha)",
+        "ALTER TABLE asistencias PARTITION BY RANGE (TO_DAYS(fecha)) (\n    "
+        + ",\n    ".join(particiones) + "\n)",
+    ]
+
+
+def claves_foraneas_asistencias(db: Session) -> List[str]:
+    return [
+        nombre for (nombre,) in db.execute(text(
+            "SELECT constraint_name FROM information_schema.table_constraints "
+            "WHERE table_schema = DATABASE() AND table_name = 'asistencias' AND constraint_type = 'FOREIGN KEY'"
+        ))
+    ]
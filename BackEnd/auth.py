@@ -1,13 +1,17 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import hashlib
 import os
 import jwt
+import orjson
 from jwt.exceptions import InvalidTokenError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import delete, update
 from sqlalchemy.orm import Session
+from cache import cache
 from database import get_db
-from models import Profesora
+from models import Profesora, RefreshToken
 from passlib.context import CryptContext
 import secrets
 
@@ -20,6 +24,12 @@ if not SECRET_KEY or SECRET_KEY == 'change_this_in_production':
 SECRET_KEY = os.getenv('SECRET_KEY', 'change_this_in_production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '60'))
+# Los refresh tokens renuevan el access token sin volver a pasar por bcrypt
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', '7'))
+# La profesora de cada token se guarda en la caché compartida, etiquetada con su
+# alcance: cualquier escritura sobre ella (desactivarla, editarla) la invalida
+PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '60'))
+_CAMPOS_PRINCIPAL = ('id', 'nombre', 'email', 'is_admin', 'especialidad', 'activa', 'feed_generacion')
 
 security = HTTPBearer()
 
@@ -41,7 +51,88 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _hash_refresh_token(token: str) -> str:
+    # Token aleatorio de 256 bits: un SHA-256 basta, no hace falta un hash lento
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _refresh_invalido(detail: str = 'Refresh token inválido'):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={'WWW-Authenticate': 'Bearer'},
+    )
+
+def create_refresh_token(db: Session, profesora_id: int, familia: Optional[str] = None) -> str:
+    """Emitir un refresh token opaco (sin commit). Solo se guarda su hash."""
+    ahora = datetime.utcnow()
+    # Limpieza oportunista de los tokens vencidos de la profesora
+    db.execute(
+        delete(RefreshToken).where(RefreshToken.profesora_id == profesora_id, RefreshToken.expira < ahora)
+        .execution_options(synchronize_session=False)
+    )
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        profesora_id=profesora_id,
+        token_hash=_hash_refresh_token(token),
+        familia=familia or secrets.token_hex(16),
+        creado=ahora,
+        expira=ahora + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def revoke_refresh_tokens(db: Session, profesora_id: Optional[int] = None, familia: Optional[str] = None) -> int:
+    """Revocar los refresh tokens de una profesora o de una familia (sin commit)."""
+    query = update(RefreshToken).where(RefreshToken.revocado == False)
+    if profesora_id is not None:
+        query = query.where(RefreshToken.profesora_id == profesora_id)
+    if familia is not None:
+        query = query.where(RefreshToken.familia == familia)
+    return db.execute(query.values(revocado=True).execution_options(synchronize_session=False)).rowcount
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Cerrar la sesión de un dispositivo: revoca la familia del token (sin commit)."""
+    fila = db.query(RefreshToken.familia).filter(RefreshToken.token_hash == _hash_refresh_token(token)).first()
+    if fila is None:
+        return False
+    revoke_refresh_tokens(db, familia=fila.familia)
+    return True
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[Profesora, str]:
+    """Canjear un refresh token por uno nuevo de la misma familia (con commit).
+
+    Si el token ya se había usado se asume robado y se revoca toda la familia.
+    """
+    ahora = datetime.utcnow()
+    fila = db.query(RefreshToken).filter(RefreshToken.token_hash == _hash_refresh_token(token)).first()
+    if fila is None or fila.revocado or fila.expira < ahora:
+        raise _refresh_invalido()
+
+    # Marcar como usado de forma atómica: de dos canjes simultáneos solo uno gana
+    marcado = db.execute(
+        update(RefreshToken).where(RefreshToken.id == fila.id, RefreshToken.usado.is_(None))
+        .values(usado=ahora).execution_options(synchronize_session=False)
+    ).rowcount
+    if not marcado:
+        revoke_refresh_tokens(db, familia=fila.familia)
+        db.commit()
+        raise _refresh_invalido('Refresh token reutilizado; la sesión fue cerrada')
+
+    profesora = db.query(Profesora).filter(Profesora.id == fila.profesora_id).first()
+    if profesora is None or not profesora.activa:
+        revoke_refresh_tokens(db, profesora_id=fila.profesora_id)
+        db.commit()
+        raise _refresh_invalido('Usuario inactivo')
+
+    nuevo = create_refresh_token(db, profesora.id, fila.familia)
+    db.commit()
+    db.refresh(profesora)
+    return profesora, nuevo
+
 def verify_token(token: str) -> str:
+    return _leer_token(token)[0]
+
+def _leer_token(token: str) -> Tuple[str, Optional[int]]:
+    """Email e id de profesora del token (los tokens anteriores no traen el id)."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get('sub') or payload.get('email')
@@ -50,20 +141,50 @@ def verify_token(token: str) -> str:
                 status_code=status.HTTP_401_UNAUTHORIZED, 
                 detail='Token inválido - email no encontrado en payload'
             )
-        return email
+        profesora_id = payload.get('pid')
+        return email, profesora_id if isinstance(profesora_id, int) else None
     except InvalidTokenError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail=f'Token inválido: {str(e)}'
         ) from e
 
+def datos_principal(db: Session, profesora_id: int) -> Optional[dict]:
+    """Campos de _CAMPOS_PRINCIPAL de la profesora desde la caché compartida, o desde la base si cambió."""
+    def cargar() -> bytes:
+        user = db.query(Profesora).filter(Profesora.id == profesora_id).first()
+        datos = {campo: getattr(user, campo) for campo in _CAMPOS_PRINCIPAL} if user else None
+        # Devolver la conexión al pool principal de inmediato
+        db.commit()
+        return orjson.dumps(datos)
+
+    return orjson.loads(cache().memo(
+        f"principal:{profesora_id}", cargar, PRINCIPAL_CACHE_TTL, [f"profesora:{profesora_id}"]
+    ))
+
+def _principal(db: Session, email: str, profesora_id: int) -> Optional[Profesora]:
+    """Profesora del token desde la caché compartida, o desde la base si cambió."""
+    datos = datos_principal(db, profesora_id)
+    # Un cambio de email invalida los tokens emitidos con el anterior
+    if datos is None or datos['email'] != email:
+        return None
+    return Profesora(**datos)
+
 def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security), 
     db: Session = Depends(get_db)
 ):
+    # Sub-peticiones de /batch: el usuario ya se resolvió una vez para todo el lote
+    compartido = getattr(request.state, "usuario_compartido", None)
+    if compartido is not None:
+        return compartido
     try:
-        email = verify_token(credentials.credentials)
-        user = db.query(Profesora).filter(Profesora.email == email).first()
+        email, profesora_id = _leer_token(credentials.credentials)
+        if profesora_id is not None:
+            user = _principal(db, email, profesora_id)
+        else:
+            user = db.query(Profesora).filter(Profesora.email == email).first()
         
         if user is None:
             raise HTTPException(
@@ -80,6 +201,12 @@ def get_current_user(
                 headers={'WWW-Authenticate': 'Bearer'},
             )
         
+        # Devolver la conexión al pool principal de inmediato: los endpoints de
+        # lectura y los pesados trabajan con su propio pool y no deben retenerla
+        if user in db:
+            db.expunge(user)
+            db.commit()
+        
         return user
         
     except HTTPException:
@@ -92,10 +219,11 @@ def get_current_user(
         )
 
 def get_current_admin(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security), 
     db: Session = Depends(get_db)
 ):
-    user = get_current_user(credentials, db)
+    user = get_current_user(request, credentials, db)
     # Verificar si es admin usando el campo del modelo
     if not user.is_admin:
         raise HTTPException(
@@ -0,0 +1,107 @@
+"""Costo de serialización por fila: ruta actual vs. ruta rápida (FAST_JSON).
+
+Uso (desde BackEnd/):
+    python benchmarks/bench_serializacion.py [filas]
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from routers.clases import ClaseResponse, serialize_clase
+from serializacion import raw_json_response
+
+
+def _clases(n):
+    profesora = SimpleNamespace(
+        id=1, nombre="Profesora Demo", email="demo@tecnoacademia.com",
+        especialidad="Robótica", is_admin=False, activa=True
+    )
+    inicio = datetime(2024, 1, 15, 8, 0)
+    return [
+        SimpleNamespace(
+            id=i, profesora_id=1, titulo=f"Clase {i}",
+            fecha_inicio=inicio + timedelta(days=i), fecha_fin=inicio + timedelta(days=i, hours=2),
+            ubicacion="Centro TecnoAcademia", descripcion=None, activa=True, profesora=profesora
+        )
+        for i in range(n)
+    ]
+
+
+def _asistencias(n):
+    return [
+        {
+            "id": i, "aprendiz_id": i % 40, "fecha": datetime(2024, 2, 1).date(),
+            "presente": i % 3 != 0, "profesora_id": 1,
+            "aprendiz": {"id": i % 40, "nombre": f"Aprendiz {i % 40}", "documento": str(1000 + i % 40)}
+        }
+        for i in range(n)
+    ]
+
+
+async def _ruta_actual(field, rows):
+    """model_validate por fila + validación de response_model + json stdlib."""
+    content = [ClaseResponse.model_validate(c) for c in rows]
+    value = await serialize_response(field=field, response_content=content)
+    return JSONResponse(value).body
+
+
+async def _ruta_actual_dicts(field, rows):
+    value = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(value).body
+
+
+def _medir(nombre, fn, filas, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    total = time.perf_counter() - inicio
+    por_fila = total / (repeticiones * filas) * 1e6
+    print(f"{nombre:<45} {por_fila:8.2f} µs/fila")
+    return por_fila
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeticiones = 5
+    loop = asyncio.new_event_loop()
+
+    from routers.asistencia import AsistenciaResponse
+
+    clases = _clases(filas)
+    campo_clases = create_response_field(name="Response", type_=List[ClaseResponse])
+    antes = _medir(
+        "clases: actual (validate x2 + json)",
+        lambda: loop.run_until_complete(_ruta_actual(campo_clases, clases)), filas, repeticiones
+    )
+    despues = _medir(
+        "clases: dicts + orjson (sin validación)",
+        lambda: raw_json_response([serialize_clase(c) for c in clases]).body, filas, repeticiones
+    )
+    print(f"{'':<45} x{antes / despues:.1f}")
+
+    asistencias = _asistencias(filas)
+    campo_asist = create_response_field(name="Response", type_=List[AsistenciaResponse])
+    antes = _medir(
+        "asistencias: actual (validate + json)",
+        lambda: loop.run_until_complete(_ruta_actual_dicts(campo_asist, asistencias)), filas, repeticiones
+    )
+    despues = _medir(
+        "asistencias: dicts + orjson (sin validación)",
+        lambda: raw_json_response(asistencias).body, filas, repeticiones
+    )
+    print(f"{'':<45} x{antes / despues:.1f}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from typing import Iterable
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from models import Aprendiz, Asistencia, Clase, ExcepcionSerie, Profesora, RefreshToken, SerieClase, Sesion
+
+# Borrados por conjuntos. Las claves foráneas declaran ON DELETE CASCADE / SET NULL,
+# pero las bases creadas antes de ese cambio no las tienen: por eso los hijos se
+# borran también con sentencias explícitas, una por tabla, sin cargar filas en la sesión.
+
+
+def eliminar_aprendices(db: Session, aprendiz_ids: Iterable[int]) -> int:
+    """Borrar aprendices y todo su historial de asistencia (sin commit)."""
+    ids = list(set(aprendiz_ids))
+    if not ids:
+        return 0
+    db.execute(
+        delete(Asistencia).where(Asistencia.aprendiz_id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    resultado = db.execute(
+        delete(Aprendiz).where(Aprendiz.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+def eliminar_clases(db: Session, clase_ids: Iterable[int]) -> int:
+    """Borrar clases desvinculando a los aprendices que las referencian (sin commit)."""
+    ids = list(set(clase_ids))
+    if not ids:
+        return 0
+    db.execute(
+        update(Aprendiz).where(Aprendiz.lista_id.in_(ids)).values(lista_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    resultado = db.execute(
+        delete(Clase).where(Clase.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+def eliminar_series(db: Session, serie_ids: Iterable[int]) -> int:
+    """Borrar series recurrentes con sus excepciones (sin commit)."""
+    ids = list(set(serie_ids))
+    if not ids:
+        return 0
+    db.execute(
+        delete(ExcepcionSerie).where(ExcepcionSerie.serie_id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    resultado = db.execute(
+        delete(SerieClase).where(SerieClase.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+def eliminar_profesora_con_datos(db: Session, profesora_id: int) -> dict:
+    """Borrar una profesora con aprendices, historial, sesiones, clases, series y refresh tokens (sin commit).
+
+    Las asistencias de otros aprendices que aún llevan su profesora_id (aprendices
+    reasignados) se conservan con profesora_id NULL, como hacía el ORM.
+    """
+    aprendices = select(Aprendiz.id).where(Aprendiz.profesora_id == profesora_id)
+    clases = select(Clase.id).where(Clase.profesora_id == profesora_id)
+    opciones = {"synchronize_session": False}
+
+    asistencias = db.execute(
+        delete(Asistencia).where(Asistencia.aprendiz_id.in_(aprendices)).execution_options(**opciones)
+    ).rowcount
+    db.execute(
+        update(Asistencia).where(Asistencia.profesora_id == profesora_id).values(profesora_id=None)
+        .execution_options(**opciones)
+    )
+    db.execute(
+        update(Aprendiz).where(Aprendiz.lista_id.in_(clases)).values(lista_id=None).execution_options(**opciones)
+    )
+    total_aprendices = db.execute(
+        delete(Aprendiz).where(Aprendiz.profesora_id == profesora_id).execution_options(**opciones)
+    ).rowcount
+    total_clases = db.execute(
+        delete(Clase).where(Clase.profesora_id == profesora_id).execution_options(**opciones)
+    ).rowcount
+    series = select(SerieClase.id).where(SerieClase.profesora_id == profesora_id)
+    db.execute(delete(ExcepcionSerie).where(ExcepcionSerie.serie_id.in_(series)).execution_options(**opciones))
+    db.execute(delete(SerieClase).where(SerieClase.profesora_id == profesora_id).execution_options(**opciones))
+    db.execute(delete(Sesion).where(Sesion.profesora_id == profesora_id).execution_options(**opciones))
+    db.execute(delete(RefreshToken).where(RefreshToken.profesora_id == profesora_id).execution_options(**opciones))
+    db.execute(delete(Profesora).where(Profesora.id == profesora_id).execution_options(**opciones))
+    return {"aprendices": total_aprendices, "asistencias": asistencias, "clases": total_clases}
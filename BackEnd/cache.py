@@ -0,0 +1,539 @@
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlsplit
+
+import orjson
+
+# Caché compartida entre workers.
+#
+# Una sola interfaz (get / get_many / set / add / delete / incr) con tres backends:
+#   memoria    LRU del proceso (un solo worker, desarrollo)
+#   compartida archivo SQLite en /dev/shm: todos los workers de la máquina
+#   resp       servidor con protocolo Redis (Redis, Valkey, KeyDB o un sustituto local)
+#
+# Sobre el backend, `Cache` agrega invalidación por etiquetas: cada etiqueta es un
+# contador y cada entrada guarda los contadores de sus etiquetas al calcularse;
+# invalidar es incrementar el contador, así que una sola escritura descarta todas
+# las entradas etiquetadas en todos los workers. `memo` evita la estampida: en el
+# proceso un solo hilo recalcula cada clave y, entre procesos, un candado con
+# vencimiento deja recalcular a un worker mientras los demás esperan el resultado.
+# Si el backend falla, la caché se salta (se calcula sin guardar) en vez de fallar.
+
+# Configuración desde .env
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")  # memoria | compartida | resp
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_SHARED_PATH = os.getenv(
+    "CACHE_SHARED_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "tecnoacademia-cache.sqlite")
+)
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "ta:")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "300"))
+CACHE_TIMEOUT_MS = int(os.getenv("CACHE_TIMEOUT_MS", "250"))
+CACHE_LOCK_MS = int(os.getenv("CACHE_LOCK_MS", "10000"))  # vida máxima del candado de recálculo
+CACHE_WAIT_MS = int(os.getenv("CACHE_WAIT_MS", "3000"))  # espera máxima por el recálculo de otro
+
+_ENCUESTA = 0.025  # intervalo de consulta mientras otro worker recalcula
+
+
+class ErrorCache(Exception):
+    """El backend no respondió o respondió con error."""
+
+
+class _ErrorRespuesta(ErrorCache):
+    """Error devuelto por el servidor RESP (la conexión sigue sirviendo)."""
+
+
+# === BACKENDS ===
+
+class BackendMemoria:
+    """LRU del proceso. Los contadores (incr) van aparte y nunca se desalojan."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._datos = OrderedDict()  # clave -> (valor, vence)
+        self._contadores: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _vigente(self, clave: str):
+        if clave in self._contadores:
+            return self._contadores[clave]
+        guardado = self._datos.get(clave)
+        if guardado is None:
+            return None
+        if guardado[1] is not None and guardado[1] < time.time():
+            del self._datos[clave]
+            return None
+        self._datos.move_to_end(clave)
+        return guardado[0]
+
+    def get(self, clave: str):
+        with self._lock:
+            return self._vigente(clave)
+
+    def get_many(self, claves: List[str]) -> list:
+        with self._lock:
+            return [self._vigente(c) for c in claves]
+
+    def set(self, clave: str, valor: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._datos[clave] = (valor, time.time() + ttl if ttl else None)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def add(self, clave: str, valor: bytes, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._vigente(clave) is not None:
+                return False
+            self._datos[clave] = (valor, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, *claves: str):
+        with self._lock:
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def incr(self, clave: str, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            if ttl:
+                # Contador con vencimiento: va con las entradas y el LRU lo puede desalojar
+                actual = self._vigente(clave)
+                vence = self._datos[clave][1] if actual is not None else time.time() + ttl
+                self._datos[clave] = ((actual or 0) + 1, vence)
+                self._datos.move_to_end(clave)
+                return self._datos[clave][0]
+            self._contadores[clave] = self._contadores.get(clave, 0) + 1
+            return self._contadores[clave]
+
+
+class BackendCompartido:
+    """Archivo SQLite (WAL) compartido por los workers de una máquina.
+
+    En Linux vive en /dev/shm, así que es memoria compartida sin servidor aparte.
+    Los contadores no vencen; las entradas vencidas se purgan cada cierto número
+    de escrituras.
+    """
+
+    _PURGA_CADA = 500
+
+    def __init__(self, ruta: str = CACHE_SHARED_PATH):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._escrituras = 0
+        self._conexion().execute(
+            "CREATE TABLE IF NOT EXISTS cache (clave TEXT PRIMARY KEY, valor BLOB, vence REAL)"
+        )
+
+    def _conexion(self) -> sqlite3.Connection:
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=CACHE_TIMEOUT_MS / 1000, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=OFF")
+            self._local.conexion = conexion
+        return conexion
+
+    def _ejecutar(self, sql: str, parametros=()):
+        try:
+            return self._conexion().execute(sql, parametros)
+        except sqlite3.Error as e:
+            raise ErrorCache(str(e)) from e
+
+    def _purgar(self):
+        self._escrituras += 1
+        if self._escrituras % self._PURGA_CADA == 0:
+            self._ejecutar("DELETE FROM cache WHERE vence IS NOT NULL AND vence < ?", (time.time(),))
+
+    def get(self, clave: str):
+        return self.get_many([clave])[0]
+
+    def get_many(self, claves: List[str]) -> list:
+        filas = self._ejecutar(
+            f"SELECT clave, valor FROM cache WHERE clave IN ({','.join('?' * len(claves))})"
+            " AND (vence IS NULL OR vence >= ?)",
+            (*claves, time.time())
+        ).fetchall()
+        encontrados = dict(filas)
+        return [encontrados.get(c) for c in claves]
+
+    def set(self, clave: str, valor: bytes, ttl: Optional[float] = None):
+        self._ejecutar(
+            "INSERT OR REPLACE INTO cache (clave, valor, vence) VALUES (?, ?, ?)",
+            (clave, valor, time.time() + ttl if ttl else None)
+        )
+        self._purgar()
+
+    def add(self, clave: str, valor: bytes, ttl: Optional[float] = None) -> bool:
+        ahora = time.time()
+        # Inserta si no existe o si la fila que hay ya venció
+        cursor = self._ejecutar(
+            "INSERT INTO cache (clave, valor, vence) VALUES (?, ?, ?) "
+            "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor, vence = excluded.vence "
+            "WHERE cache.vence IS NOT NULL AND cache.vence < ?",
+            (clave, valor, ahora + ttl if ttl else None, ahora)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, *claves: str):
+        if claves:
+            self._ejecutar(f"DELETE FROM cache WHERE clave IN ({','.join('?' * len(claves))})", claves)
+
+    def incr(self, clave: str, ttl: Optional[float] = None) -> int:
+        ahora = time.time()
+        # Un contador vencido vuelve a empezar con un vencimiento nuevo
+        fila = self._ejecutar(
+            "INSERT INTO cache (clave, valor, vence) VALUES (?, 1, ?) "
+            "ON CONFLICT(clave) DO UPDATE SET "
+            "valor = CASE WHEN cache.vence < ? THEN 1 ELSE CAST(cache.valor AS INTEGER) + 1 END, "
+            "vence = CASE WHEN cache.vence < ? THEN excluded.vence ELSE cache.vence END "
+            "RETURNING valor",
+            (clave, ahora + ttl if ttl else None, ahora, ahora)
+        ).fetchone()
+        return int(fila[0])
+
+
+class BackendRESP:
+    """Cliente mínimo del protocolo Redis (RESP2) con un pool de sockets.
+
+    Solo usa GET, MGET, SET (PX/NX), DEL e INCR, así que sirve contra Redis o
+    contra cualquier sustituto local que hable el protocolo (p. ej. en pruebas).
+    """
+
+    def __init__(self, url: str = CACHE_URL, max_conexiones: int = 8):
+        partes = urlsplit(url)
+        self.host = partes.hostname or "localhost"
+        self.puerto = partes.port or 6379
+        self.password = unquote(partes.password) if partes.password else None
+        self.db = int(partes.path.strip("/") or 0)
+        self.max_conexiones = max_conexiones
+        self._libres = []
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        try:
+            sock = socket.create_connection((self.host, self.puerto), timeout=CACHE_TIMEOUT_MS / 1000)
+        except OSError as e:
+            raise ErrorCache(f"No se pudo conectar a {self.host}:{self.puerto}: {e}") from e
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conexion = (sock, sock.makefile("rb"))
+        try:
+            if self.password:
+                self._enviar(conexion, "AUTH", self.password)
+            if self.db:
+                self._enviar(conexion, "SELECT", self.db)
+        except (OSError, ErrorCache):
+            sock.close()
+            raise
+        return conexion
+
+    @staticmethod
+    def _codificar(args) -> bytes:
+        partes = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            dato = arg if isinstance(arg, bytes) else str(arg).encode()
+            partes.append(b"$%d\r\n%s\r\n" % (len(dato), dato))
+        return b"".join(partes)
+
+    def _leer(self, archivo):
+        linea = archivo.readline()
+        if not linea:
+            raise ErrorCache("Conexión cerrada por el servidor")
+        tipo, resto = linea[:1], linea[1:-2]
+        if tipo == b"+":
+            return resto.decode()
+        if tipo == b"-":
+            raise _ErrorRespuesta(resto.decode())
+        if tipo == b":":
+            return int(resto)
+        if tipo == b"$":
+            largo = int(resto)
+            return None if largo < 0 else archivo.read(largo + 2)[:-2]
+        if tipo == b"*":
+            largo = int(resto)
+            return None if largo < 0 else [self._leer(archivo) for _ in range(largo)]
+        raise ErrorCache(f"Respuesta RESP inesperada: {linea!r}")
+
+    def _enviar(self, conexion, *args):
+        sock, archivo = conexion
+        sock.sendall(self._codificar(args))
+        return self._leer(archivo)
+
+    def comando(self, *args):
+        with self._lock:
+            conexion = self._libres.pop() if self._libres else None
+        if conexion is None:
+            conexion = self._conectar()
+        try:
+            respuesta = self._enviar(conexion, *args)
+        except _ErrorRespuesta:
+            self._devolver(conexion)
+            raise
+        except (OSError, ErrorCache) as e:
+            # Error de red: la conexión puede haber quedado a mitad de una respuesta
+            conexion[0].close()
+            raise ErrorCache(str(e)) from e
+        self._devolver(conexion)
+        return respuesta
+
+    def _devolver(self, conexion):
+        with self._lock:
+            if len(self._libres) < self.max_conexiones:
+                self._libres.append(conexion)
+                return
+        conexion[0].close()
+
+    def get(self, clave: str):
+        return self.comando("GET", clave)
+
+    def get_many(self, claves: List[str]) -> list:
+        return self.comando("MGET", *claves)
+
+    def set(self, clave: str, valor: bytes, ttl: Optional[float] = None):
+        if ttl:
+            self.comando("SET", clave, valor, "PX", int(ttl * 1000))
+        else:
+            self.comando("SET", clave, valor)
+
+    def add(self, clave: str, valor: bytes, ttl: Optional[float] = None) -> bool:
+        if ttl:
+            return self.comando("SET", clave, valor, "NX", "PX", int(ttl * 1000)) is not None
+        return self.comando("SET", clave, valor, "NX") is not None
+
+    def delete(self, *claves: str):
+        if claves:
+            self.comando("DEL", *claves)
+
+    def incr(self, clave: str, ttl: Optional[float] = None) -> int:
+        if ttl:
+            # INCR conserva el vencimiento: se crea la clave con él si no existe
+            self.comando("SET", clave, 0, "NX", "PX", int(ttl * 1000))
+        return self.comando("INCR", clave)
+
+
+# === FACHADA CON ETIQUETAS Y SINGLE-FLIGHT ===
+
+class _Vuelo:
+    __slots__ = ("evento", "valor")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+
+
+class Cache:
+    def __init__(self, backend, prefijo: str = CACHE_PREFIX):
+        self.backend = backend
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self._vuelos: Dict[str, _Vuelo] = {}
+        self._metricas = {"aciertos": 0, "fallos": 0, "recalculos": 0, "esperas": 0, "errores": 0}
+        self._ultimo_error = 0.0
+
+    def _contar(self, metrica: str):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    def _error(self, e: Exception):
+        self._contar("errores")
+        ahora = time.monotonic()
+        if ahora - self._ultimo_error > 60:  # no llenar el log si el backend está caído
+            self._ultimo_error = ahora
+            print(f"⚠️ Caché no disponible ({type(self.backend).__name__}): {e}")
+
+    def get(self, clave: str) -> Optional[bytes]:
+        try:
+            return self.backend.get(self.prefijo + clave)
+        except ErrorCache as e:
+            self._error(e)
+            return None
+
+    def set(self, clave: str, valor: bytes, ttl: Optional[float] = CACHE_DEFAULT_TTL):
+        try:
+            self.backend.set(self.prefijo + clave, valor, ttl)
+        except ErrorCache as e:
+            self._error(e)
+
+    def add(self, clave: str, valor: bytes, ttl: Optional[float] = None) -> Optional[bool]:
+        """Guardar solo si no existe. None si el backend no respondió."""
+        try:
+            return self.backend.add(self.prefijo + clave, valor, ttl)
+        except ErrorCache as e:
+            self._error(e)
+            return None
+
+    def delete(self, *claves: str):
+        try:
+            self.backend.delete(*[self.prefijo + c for c in claves])
+        except ErrorCache as e:
+            self._error(e)
+
+    def incr(self, clave: str, ttl: Optional[float] = None) -> Optional[int]:
+        """Incrementar un contador (con vencimiento desde su creación). None si el backend no respondió."""
+        try:
+            return self.backend.incr(self.prefijo + clave, ttl)
+        except ErrorCache as e:
+            self._error(e)
+            return None
+
+    def etiquetas(self, etiquetas: Iterable[str]) -> Optional[List[int]]:
+        """Versión actual de cada etiqueta (0 si nunca se invalidó); None si el backend falló."""
+        etiquetas = list(etiquetas)
+        if not etiquetas:
+            return []
+        try:
+            valores = self.backend.get_many([f"{self.prefijo}etiqueta:{e}" for e in etiquetas])
+        except ErrorCache as e:
+            self._error(e)
+            return None
+        return [int(v) if v is not None else 0 for v in valores]
+
+    def invalidar(self, *etiquetas: str) -> Dict[str, Optional[int]]:
+        """Incrementar las etiquetas: toda entrada calculada con la versión anterior queda vencida."""
+        nuevas = {}
+        for etiqueta in dict.fromkeys(etiquetas):
+            try:
+                nuevas[etiqueta] = self.backend.incr(f"{self.prefijo}etiqueta:{etiqueta}")
+            except ErrorCache as e:
+                self._error(e)
+                nuevas[etiqueta] = None
+        return nuevas
+
+    def _leer(self, clave: str, versiones: List[int]) -> Optional[bytes]:
+        guardado = self.get(clave)
+        if guardado is None:
+            return None
+        cabecera, _, valor = guardado.partition(b"\n")
+        return valor if orjson.loads(cabecera) == versiones else None
+
+    def memo(
+        self,
+        clave: str,
+        calcular: Callable[[], bytes],
+        ttl: Optional[float] = CACHE_DEFAULT_TTL,
+        etiquetas: Iterable[str] = ()
+    ) -> bytes:
+        """Valor en caché o recalculado por un solo hilo/worker a la vez."""
+        etiquetas = list(etiquetas)
+        versiones = self.etiquetas(etiquetas)
+        if versiones is None:
+            return calcular()
+        valor = self._leer(clave, versiones)
+        if valor is not None:
+            self._contar("aciertos")
+            return valor
+        self._contar("fallos")
+
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+        if not lider:
+            # Otro hilo del proceso ya está calculando esta clave
+            self._contar("esperas")
+            vuelo.evento.wait(CACHE_WAIT_MS / 1000)
+            return vuelo.valor if vuelo.valor is not None else calcular()
+        try:
+            vuelo.valor = self._calcular(clave, calcular, ttl, versiones)
+            return vuelo.valor
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.evento.set()
+
+    def _calcular(self, clave: str, calcular, ttl, versiones: List[int]) -> bytes:
+        candado = f"candado:{clave}"
+        if self.add(candado, b"1", CACHE_LOCK_MS / 1000) is False:
+            # Otro worker recalcula: esperar su resultado antes de calcular también
+            self._contar("esperas")
+            limite = time.monotonic() + CACHE_WAIT_MS / 1000
+            while time.monotonic() < limite:
+                time.sleep(_ENCUESTA)
+                valor = self._leer(clave, versiones)
+                if valor is not None:
+                    return valor
+            candado = None
+        try:
+            self._contar("recalculos")
+            # Las versiones se leyeron antes de calcular: si hubo una escritura
+            # mientras tanto, la entrada nace vencida y la próxima lectura recalcula
+            valor = calcular()
+            self.set(clave, orjson.dumps(versiones) + b"\n" + valor, ttl)
+            return valor
+        finally:
+            if candado is not None:
+                self.delete(candado)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {"backend": type(self.backend).__name__, **self._metricas, "en_vuelo": len(self._vuelos)}
+
+
+class CacheLocal:
+    """Objetos en memoria del proceso validados contra etiquetas compartidas.
+
+    Para lo que no conviene serializar (árboles, listas con fechas): cada worker
+    guarda su copia y la descarta cuando cualquier worker invalida sus etiquetas.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._datos = OrderedDict()  # clave -> (versiones, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, etiquetas: List[str], calcular: Callable[[], object]):
+        versiones = cache().etiquetas(etiquetas)
+        if versiones is None:
+            return calcular()
+        with self._lock:
+            guardado = self._datos.get(clave)
+            if guardado is not None and guardado[0] == versiones:
+                self._datos.move_to_end(clave)
+                return guardado[1]
+        valor = calcular()
+        with self._lock:
+            self._datos[clave] = (versiones, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+        return valor
+
+    def quitar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+
+_cache: Optional[Cache] = None
+_cache_lock = threading.Lock()
+
+
+def _crear_backend():
+    if CACHE_BACKEND == "resp":
+        return BackendRESP(CACHE_URL)
+    if CACHE_BACKEND == "compartida":
+        return BackendCompartido(CACHE_SHARED_PATH)
+    return BackendMemoria()
+
+
+def cache() -> Cache:
+    """Caché del proceso, creada con el backend de CACHE_BACKEND al primer uso."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = Cache(_crear_backend())
+    return _cache
+
+
+def set_backend(backend):
+    """Reemplazar el backend (p. ej. por un sustituto local en pruebas)."""
+    global _cache
+    with _cache_lock:
+        _cache = Cache(backend)
@@ -0,0 +1,200 @@
+import base64
+import hashlib
+import hmac
+import io
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import pytz
+from sqlalchemy.orm import Session
+
+from auth import SECRET_KEY, datos_principal
+from cache import cache
+from models import Clase, Profesora, SerieClase
+import recurrencia
+
+# Feed iCalendar (.ics) de clases para suscribirse desde el calendario del teléfono.
+#
+# Las apps de calendario consultan la URL con frecuencia y no envían el token JWT,
+# así que el feed se autentica con un token firmado en la propia URL. El token
+# lleva quién lo emitió y la generación de feed de esa profesora: en cada consulta
+# se verifica (con el principal en caché de auth.py) que siga activa, que la
+# generación no haya cambiado (se incrementa al cambiar la contraseña o desactivar
+# la cuenta) y, para "todas", que siga siendo admin. Cada feed
+# (una profesora, o "todas" para el admin) se renderiza una vez y se guarda ya
+# generado en la caché compartida, así que un solo worker lo genera; las
+# escrituras de clases en routers/clases.py invalidan su etiqueta.
+
+# Configuración desde .env
+ICS_TIMEZONE = os.getenv("ICS_TIMEZONE", "America/Bogota")  # zona de las fechas guardadas
+ICS_DAYS_BACK = int(os.getenv("ICS_DAYS_BACK", "90"))
+ICS_DAYS_AHEAD = int(os.getenv("ICS_DAYS_AHEAD", "365"))
+ICS_MAX_AGE = int(os.getenv("ICS_MAX_AGE", "900"))
+ICS_CACHE_TTL = int(os.getenv("ICS_CACHE_TTL", "86400"))
+
+TODAS = "todas"
+_LOTE = 500
+
+
+def _alcance(profesora_id: Optional[int]) -> str:
+    return TODAS if profesora_id is None else str(profesora_id)
+
+
+def invalidar(*profesora_ids):
+    """Marcar como vencidos los feeds de las profesoras afectadas y el general."""
+    alcances = {TODAS} | {str(pid) for pid in profesora_ids if pid is not None}
+    cache().invalidar(*[f"ics:{alcance}" for alcance in alcances])
+
+
+def _firma(mensaje: str) -> str:
+    digest = hmac.new(SECRET_KEY.encode(), f"ics:{mensaje}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+def token_feed(emisor, todas: bool = False) -> str:
+    """Token de suscripción: alcance (id de la profesora o "todas"), emisor y su generación, más la firma."""
+    alcance = TODAS if todas else str(emisor.id)
+    mensaje = f"{alcance}.{emisor.id}.{emisor.feed_generacion or 0}"
+    return f"{mensaje}.{_firma(mensaje)}"
+
+
+def verificar_token(db: Session, token: str) -> Optional[str]:
+    """Alcance del token si la firma es válida y el emisor puede seguir viendo el feed."""
+    mensaje, _, firma = token.rpartition(".")
+    partes = mensaje.split(".")
+    if len(partes) != 3 or not (partes[0] == TODAS or partes[0].isdigit()) or not all(p.isdigit() for p in partes[1:]):
+        return None
+    if not hmac.compare_digest(firma, _firma(mensaje)):
+        return None
+    alcance, emisor, generacion = partes[0], int(partes[1]), int(partes[2])
+    if alcance != TODAS and int(alcance) != emisor:
+        return None
+    datos = datos_principal(db, emisor)
+    if datos is None or not datos["activa"] or (datos.get("feed_generacion") or 0) != generacion:
+        return None
+    if alcance == TODAS and not datos["is_admin"]:
+        return None
+    return alcance
+
+
+def _escapar(texto: str) -> str:
+    return (
+        texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _linea(salida: io.StringIO, contenido: str):
+    """Escribir una línea plegada a 75 octetos, como pide RFC 5545 (las de
+    continuación empiezan con un espacio, así que llevan 74 de contenido)."""
+    datos = contenido.encode("utf-8")
+    limite = 75
+    while len(datos) > limite:
+        corte = limite
+        while (datos[corte] & 0xC0) == 0x80:  # no partir un carácter UTF-8
+            corte -= 1
+        salida.write(datos[:corte].decode("utf-8") + "\r\n ")
+        datos = datos[corte:]
+        limite = 74
+    salida.write(datos.decode("utf-8") + "\r\n")
+
+
+def _utc(fecha: datetime, zona) -> str:
+    if fecha.tzinfo is None:
+        fecha = zona.localize(fecha)
+    return fecha.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _dtstamp(fecha_creacion: Optional[datetime], inicio: datetime, zona) -> str:
+    # fecha_creacion se guarda en UTC sin zona (default=datetime.utcnow); las filas
+    # sin ella usan el inicio, que está en la hora local de las clases
+    if fecha_creacion is not None:
+        return _utc(fecha_creacion, pytz.utc)
+    return _utc(inicio, zona)
+
+
+def _evento(salida, zona, uid, dtstamp, inicio, fin, titulo, ubicacion, descripcion, activa):
+    _linea(salida, "BEGIN:VEVENT")
+    _linea(salida, f"UID:{uid}@tecnoacademia")
+    _linea(salida, f"DTSTAMP:{dtstamp}")
+    _linea(salida, f"DTSTART:{_utc(inicio, zona)}")
+    _linea(salida, f"DTEND:{_utc(fin, zona)}")
+    _linea(salida, f"SUMMARY:{_escapar(titulo)}")
+    _linea(salida, f"LOCATION:{_escapar(ubicacion)}")
+    if descripcion:
+        _linea(salida, f"DESCRIPTION:{_escapar(descripcion)}")
+    _linea(salida, "STATUS:CONFIRMED" if activa else "STATUS:CANCELLED")
+    _linea(salida, "END:VEVENT")
+
+
+def _renderizar(db: Session, alcance: str) -> bytes:
+    zona = pytz.timezone(ICS_TIMEZONE)
+    hoy = datetime.now(zona).replace(tzinfo=None)
+    desde, hasta = hoy - timedelta(days=ICS_DAYS_BACK), hoy + timedelta(days=ICS_DAYS_AHEAD)
+
+    columnas = [
+        Clase.id, Clase.titulo, Clase.fecha_inicio, Clase.fecha_fin, Clase.ubicacion,
+        Clase.descripcion, Clase.activa, Clase.fecha_creacion, Profesora.nombre.label("profesora"),
+    ]
+    query = db.query(*columnas).join(Profesora, Profesora.id == Clase.profesora_id).filter(
+        Clase.fecha_inicio >= desde, Clase.fecha_inicio <= hasta
+    )
+    if alcance != TODAS:
+        query = query.filter(Clase.profesora_id == int(alcance))
+    # Rango por el índice (profesora_id, fecha_inicio), leído por lotes
+    query = query.order_by(Clase.fecha_inicio).yield_per(_LOTE)
+
+    salida = io.StringIO()
+    for linea in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//TecnoAcademia//Clases//ES", "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH", "X-WR-CALNAME:Clases TecnoAcademia", f"X-WR-TIMEZONE:{ICS_TIMEZONE}",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H", "X-PUBLISHED-TTL:PT1H",
+    ):
+        _linea(salida, linea)
+    for clase in query:
+        titulo = clase.titulo if alcance != TODAS else f"{clase.titulo} ({clase.profesora})"
+        _evento(
+            salida, zona, f"clase-{clase.id}", _dtstamp(clase.fecha_creacion, clase.fecha_inicio, zona),
+            clase.fecha_inicio, clase.fecha_fin, titulo, clase.ubicacion, clase.descripcion, clase.activa
+        )
+    # Ocurrencias de las series, expandidas solo para la ventana del feed
+    ocurrencias = recurrencia.ocurrencias(db, None if alcance == TODAS else int(alcance), desde, hasta)
+    # El DTSTAMP de una ocurrencia es el de su serie: no cambia entre generaciones del feed
+    series = {
+        serie_id: (fecha_creacion, inicio)
+        for serie_id, fecha_creacion, inicio in db.query(
+            SerieClase.id, SerieClase.fecha_creacion, SerieClase.inicio
+        ).filter(SerieClase.id.in_({o["serie_id"] for o in ocurrencias}))
+    } if ocurrencias else {}
+    for o in ocurrencias:
+        titulo = o["titulo"] if alcance != TODAS else f"{o['titulo']} ({o['profesora']['nombre']})"
+        fecha_creacion, inicio = series.get(o["serie_id"], (None, o["ocurrencia"]))
+        _evento(
+            salida, zona, f"serie-{o['serie_id']}-{o['ocurrencia']:%Y%m%dT%H%M%S}", _dtstamp(fecha_creacion, inicio, zona),
+            o["fecha_inicio"], o["fecha_fin"], titulo, o["ubicacion"], o["descripcion"], o["activa"]
+        )
+    _linea(salida, "END:VCALENDAR")
+    return salida.getvalue().encode("utf-8")
+
+
+def feed(db: Session, alcance: str) -> Optional[Tuple[str, bytes]]:
+    """(ETag, contenido) del feed, desde la caché si no hubo escrituras desde que se generó.
+
+    None si la profesora ya no existe o está inactiva.
+    """
+    def calcular() -> bytes:
+        if alcance != TODAS and not db.query(Profesora.id).filter(
+            Profesora.id == int(alcance), Profesora.activa == True
+        ).first():
+            return b""
+        contenido = _renderizar(db, alcance)
+        return hashlib.sha1(contenido).hexdigest().encode() + b"\n" + contenido
+
+    # La ventana de fechas se mueve cada día: la fecha también entra en la clave
+    dia = datetime.now(pytz.timezone(ICS_TIMEZONE)).date()
+    guardado = cache().memo(f"ics:{alcance}:{dia.isoformat()}", calcular, ICS_CACHE_TTL, [f"ics:{alcance}"])
+    if not guardado:
+        return None
+    huella, _, contenido = guardado.partition(b"\n")
+    return '"%s"' % huella.decode(), contenido
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+from typing import Callable, Iterator, List
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+
+# Presupuesto de tiempo y cancelación para las lecturas pesadas.
+#
+# Cada endpoint pesado declara su presupuesto: la sesión lo aplica como timeout
+# por sentencia (max_execution_time en MySQL) y, mientras el handler trabaja en el
+# threadpool, una tarea del loop consulta request.is_disconnected(). Si el cliente
+# se fue, se corta la consulta en curso en el servidor (KILL QUERY, o interrupt en
+# SQLite) y el handler se detiene en el próximo lote, así la conexión vuelve al
+# pool de inmediato en lugar de terminar un reporte que nadie va a leer.
+
+# Configuración desde .env
+REPORTE_QUERY_BUDGET_MS = int(os.getenv("REPORTE_QUERY_BUDGET_MS", "30000"))
+ASISTENCIAS_QUERY_BUDGET_MS = int(os.getenv("ASISTENCIAS_QUERY_BUDGET_MS", "15000"))
+EXPORT_QUERY_BUDGET_MS = int(os.getenv("EXPORT_QUERY_BUDGET_MS", "120000"))
+CANCEL_POLL_MS = int(os.getenv("CANCEL_POLL_MS", "500"))
+CANCEL_CHUNK_SIZE = int(os.getenv("CANCEL_CHUNK_SIZE", "500"))  # aprendices por lote
+
+CLIENTE_DESCONECTADO = 499  # convención de nginx: el cliente cerró la conexión
+
+
+class Vigilancia:
+    """Estado de cancelación de una petición pesada.
+
+    Se usa como contexto alrededor del trabajo con la base: traduce la consulta
+    cortada a 499 (cliente desconectado) o 503 (presupuesto agotado).
+    """
+
+    def __init__(self, request: Request, db: Session, presupuesto_ms: int):
+        self.request = request
+        self.db = db
+        self.presupuesto_ms = presupuesto_ms
+        self.cancelada = False
+
+    def verificar(self):
+        if self.cancelada:
+            raise HTTPException(status_code=CLIENTE_DESCONECTADO, detail="El cliente cerró la conexión")
+
+    def lotes(self, items: List, tamano: int = CANCEL_CHUNK_SIZE) -> Iterator[List]:
+        """Partir `items` en lotes, verificando la cancelación antes de cada uno."""
+        for inicio in range(0, len(items), tamano):
+            self.verificar()
+            yield items[inicio:inicio + tamano]
+        self.verificar()
+
+    def cancelar(self):
+        self.cancelada = True
+        try:
+            if database.cancelar_consulta(self.db):
+                print(f"⚠️ Consulta cancelada: el cliente cerró {self.request.url.path}")
+        except Exception as e:
+            print(f"❌ Error cancelando la consulta de {self.request.url.path}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, error, traza):
+        if isinstance(error, DBAPIError) and database.consulta_interrumpida(error):
+            self.verificar()
+            raise HTTPException(
+                status_code=503,
+                detail=f"La consulta superó el tiempo máximo ({self.presupuesto_ms / 1000:g} s); acota el rango de fechas"
+            ) from error
+        return False
+
+
+async def _vigilar(vigilancia: Vigilancia):
+    # Dentro de /batch se vigila la conexión del lote, no la sub-petición sintética
+    peticion = getattr(vigilancia.request.state, "peticion_lote", vigilancia.request)
+    while True:
+        await asyncio.sleep(CANCEL_POLL_MS / 1000)
+        if await peticion.is_disconnected():
+            await run_in_threadpool(vigilancia.cancelar)
+            return
+
+
+def vigilar(presupuesto_ms: int, get_session: Callable = database.get_heavy_db):
+    """Dependencia: aplica el presupuesto a la sesión de `get_session` y vigila la desconexión.
+
+    Debe recibir la misma dependencia de sesión que el handler, para que FastAPI
+    entregue a ambos la misma sesión.
+    """
+    async def dependencia(request: Request, db: Session = Depends(get_session)):
+        vigilancia = Vigilancia(request, db, presupuesto_ms)
+        # Dentro de /batch la sesión es compartida y puede tener ya una transacción:
+        # se cierra para que el presupuesto se aplique al empezar la siguiente, y al
+        # salir se vuelve a cerrar para que las otras sub-peticiones no lo hereden
+        compartida = database._sesion_compartida(request) is not None
+        if compartida:
+            db.rollback()
+        db.info["presupuesto_ms"] = presupuesto_ms
+        db.info["lock_cancelacion"] = threading.Lock()
+        tarea = asyncio.create_task(_vigilar(vigilancia))
+        try:
+            yield vigilancia
+        finally:
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+            db.info.pop("presupuesto_ms", None)
+            if compartida:
+                db.rollback()
+
+    return dependencia
@@ -0,0 +1,286 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from auth import SECRET_KEY
+from cache import cache
+from database import SessionLocal
+from models import Aprendiz
+import sesiones
+import versiones
+
+# Auto-registro de asistencia con código QR.
+#
+# La profesora muestra un QR de vida corta firmado con HMAC (clase, profesora,
+# fecha, versión del padrón, vencimiento). El aprendiz lo escanea y envía su
+# documento. La firma y la ventana se validan sin leer la base y el documento se
+# busca en el padrón de la profesora que queda en memoria; un worker con un padrón
+# anterior a la versión del token lo recarga. Las marcas aceptadas se acumulan y
+# un hilo las escribe por lotes cada CHECKIN_FLUSH_MS con sesiones.aplicar_marcas
+# (INSERT IGNORE). Una vez escritas, una clave por aprendiz y día en la caché
+# compartida descarta los escaneos repetidos en todos los workers; antes, los
+# descarta la cola del worker y, entre workers, la base los ignora.
+
+# Configuración desde .env
+QR_TTL_SECONDS = int(os.getenv("QR_TTL_SECONDS", "90"))
+CHECKIN_FLUSH_MS = int(os.getenv("CHECKIN_FLUSH_MS", "250"))
+CHECKIN_BATCH_MAX = int(os.getenv("CHECKIN_BATCH_MAX", "2000"))
+CHECKIN_DEDUP_TTL = int(os.getenv("CHECKIN_DEDUP_TTL", "172800"))  # 2 días
+
+_CLAVE = hmac.new(SECRET_KEY.encode(), b"qr-checkin", hashlib.sha256).digest()
+_NO_DIGITOS = re.compile(r"[^0-9A-Za-z]")
+
+_lock = threading.Lock()
+_padrones: Dict[int, Tuple[int, Dict[str, Tuple[int, str]]]] = {}  # profesora -> (versión, {documento: (id, nombre)})
+_pendientes: Dict[Tuple[int, date], int] = {}  # (aprendiz_id, fecha) -> profesora_id
+_metricas = {"aceptados": 0, "duplicados": 0, "escritos": 0, "lotes": 0, "errores": 0, "descartados": 0}
+
+_hay_pendientes = threading.Event()
+_flush_ahora = threading.Event()  # lote lleno: escribir sin esperar el intervalo
+_stop = threading.Event()
+_thread = None
+
+
+class CodigoInvalido(Exception):
+    """QR con firma incorrecta o vencido."""
+
+
+def _firma(mensaje: str) -> str:
+    return base64.urlsafe_b64encode(hmac.new(_CLAVE, mensaje.encode(), hashlib.sha256).digest()[:12]).decode()
+
+
+def emitir_token(clase_id: int, profesora_id: int, fecha: date, version_padron) -> Tuple[str, int]:
+    """Token del QR y su vencimiento (epoch)."""
+    expira = int(time.time()) + QR_TTL_SECONDS
+    mensaje = f"{clase_id}.{profesora_id}.{fecha.toordinal()}.{version_padron}.{expira}"
+    return f"{mensaje}.{_firma(mensaje)}", expira
+
+
+def verificar_token(token: str) -> Tuple[int, int, date, str]:
+    """(clase_id, profesora_id, fecha, versión del padrón) de un token válido y vigente. Sin acceso a la base."""
+    mensaje, _, firma = token.rpartition(".")
+    partes = mensaje.split(".")
+    if len(partes) != 5 or not all(p.isalnum() for p in partes):
+        raise CodigoInvalido("Código QR inválido")
+    if not hmac.compare_digest(firma, _firma(mensaje)):
+        raise CodigoInvalido("Código QR inválido")
+    clase_id, profesora_id, ordinal, expira = (int(p) for p in (partes[0], partes[1], partes[2], partes[4]))
+    if expira < time.time():
+        raise CodigoInvalido("Código QR vencido, escanea el código actual")
+    return clase_id, profesora_id, date.fromordinal(ordinal), partes[3]
+
+
+def _normalizar(documento: str) -> str:
+    return _NO_DIGITOS.sub("", documento or "").upper()
+
+
+def cargar_padron(db, profesora_id: int):
+    """Dejar en memoria {documento: (aprendiz_id, nombre)} de la profesora (si cambió).
+
+    Devuelve la versión cargada, que viaja en el token del QR.
+    """
+    version = versiones.version(f"profesora:{profesora_id}")[0]
+    with _lock:
+        guardado = _padrones.get(profesora_id)
+        if guardado is not None and guardado[0] == version:
+            return version
+    padron = {
+        _normalizar(documento): (aprendiz_id, nombre)
+        for aprendiz_id, nombre, documento in db.query(Aprendiz.id, Aprendiz.nombre, Aprendiz.documento)
+        .filter(Aprendiz.profesora_id == profesora_id, Aprendiz.documento.isnot(None))
+    }
+    with _lock:
+        _padrones[profesora_id] = (version, padron)
+    return version
+
+
+def padron_al_dia(profesora_id: int, version_token: str) -> bool:
+    """Si el padrón en memoria es al menos tan nuevo como el del token.
+
+    Con la caché caída la versión no es numérica y el padrón se recarga.
+    """
+    guardado = _padrones.get(profesora_id)
+    if guardado is None or not version_token.isdigit() or not isinstance(guardado[0], int):
+        return False
+    return guardado[0] >= int(version_token)
+
+
+def cargar_padron_nuevo(profesora_id: int):
+    """Cargar el padrón con una sesión propia (escaneo en otro worker o padrón viejo)."""
+    db = SessionLocal()
+    try:
+        cargar_padron(db, profesora_id)
+    finally:
+        db.close()
+
+
+def buscar_aprendiz(profesora_id: int, documento: str) -> Optional[Tuple[int, str]]:
+    guardado = _padrones.get(profesora_id)
+    if guardado is None:
+        return None
+    return guardado[1].get(_normalizar(documento))
+
+
+def _clave_registro(aprendiz_id: int, fecha: date) -> str:
+    return f"checkin:{fecha.isoformat()}:{aprendiz_id}"
+
+
+def registrar(aprendiz_id: int, fecha: date, profesora_id: int) -> bool:
+    """Encolar la marca de presente; False si el aprendiz ya se registró ese día."""
+    with _lock:
+        en_cola = (aprendiz_id, fecha) in _pendientes
+    if en_cola or cache().get(_clave_registro(aprendiz_id, fecha)) is not None:
+        with _lock:
+            _metricas["duplicados"] += 1
+        return False
+    with _lock:
+        _pendientes[(aprendiz_id, fecha)] = profesora_id
+        _metricas["aceptados"] += 1
+        lleno = len(_pendientes) >= CHECKIN_BATCH_MAX
+    _hay_pendientes.set()
+    if lleno:
+        _flush_ahora.set()
+    return True
+
+
+def olvidar(marcas) -> None:
+    """Liberar la clave de registro de [(aprendiz_id, fecha)] cuyo presente se retiró.
+
+    Así el aprendiz puede volver a registrarse ese día con el QR.
+    """
+    claves = [_clave_registro(aprendiz_id, fecha) for aprendiz_id, fecha in marcas]
+    if claves:
+        cache().delete(*claves)
+
+
+def _escribir(lote: Dict[Tuple[int, date], int]):
+    db = SessionLocal()
+    try:
+        sesiones.aplicar_marcas(db, {
+            (aprendiz_id, fecha): (profesora_id, True)
+            for (aprendiz_id, fecha), profesora_id in lote.items()
+        })
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _aprendices_existentes(aprendiz_ids) -> set:
+    db = SessionLocal()
+    try:
+        return {aid for (aid,) in db.query(Aprendiz.id).filter(Aprendiz.id.in_(set(aprendiz_ids)))}
+    finally:
+        db.close()
+
+
+def _rescatar(lote: Dict[Tuple[int, date], int]) -> Tuple[dict, dict, int]:
+    """Tras fallar el lote: descartar marcas de aprendices borrados y escribir el resto de a una.
+
+    Un aprendiz borrado entre el escaneo y la escritura hace fallar el lote entero
+    (en SQLite la clave foránea no se ignora). Devuelve (escritas, a reintentar,
+    descartadas). Si la base no responde, todo queda para reintentar.
+    """
+    try:
+        existentes = _aprendices_existentes(aprendiz_id for aprendiz_id, _ in lote)
+    except Exception:
+        return {}, lote, 0
+    escritas, fallidas = {}, {}
+    for clave, profesora_id in lote.items():
+        if clave[0] not in existentes:
+            continue
+        try:
+            _escribir({clave: profesora_id})
+            escritas[clave] = profesora_id
+        except Exception:
+            fallidas[clave] = profesora_id
+    return escritas, fallidas, len(lote) - len(escritas) - len(fallidas)
+
+
+def flush() -> int:
+    """Escribir las marcas pendientes en una transacción.
+
+    Si el lote falla se descartan las marcas de aprendices borrados y el resto se
+    escribe de a una. Devuelve cuántas se escribieron, o -1 si alguna falló (queda
+    pendiente para reintentar).
+    """
+    with _lock:
+        if not _pendientes:
+            _hay_pendientes.clear()
+            return 0
+        lote = dict(_pendientes)
+        _pendientes.clear()
+        _hay_pendientes.clear()
+
+    fallidas = {}
+    try:
+        _escribir(lote)
+    except Exception as e:
+        print(f"❌ Error guardando check-ins: {e}")
+        lote, fallidas, descartadas = _rescatar(lote)
+        # Se reintentan en el próximo ciclo sin perder marcas más nuevas
+        with _lock:
+            for clave, profesora_id in fallidas.items():
+                _pendientes.setdefault(clave, profesora_id)
+            _metricas["errores"] += 1
+            _metricas["descartados"] += descartadas
+        if fallidas:
+            _hay_pendientes.set()
+        if not lote:
+            return -1 if fallidas else 0
+
+    # Solo las marcas ya guardadas cuentan como registradas para los demás workers
+    for aprendiz_id, fecha in lote:
+        cache().set(_clave_registro(aprendiz_id, fecha), b"1", ttl=CHECKIN_DEDUP_TTL)
+    versiones.bump(*set(lote.values()))
+    with _lock:
+        _metricas["escritos"] += len(lote)
+        _metricas["lotes"] += 1
+    return -1 if fallidas else len(lote)
+
+
+def _loop():
+    intervalo = CHECKIN_FLUSH_MS / 1000
+    while not _stop.is_set():
+        _hay_pendientes.wait()
+        if _stop.is_set():
+            break
+        # Esperar el intervalo para juntar más escaneos, salvo que el lote ya esté lleno
+        _flush_ahora.wait(intervalo)
+        _flush_ahora.clear()
+        if flush() < 0:
+            _stop.wait(intervalo * 4)  # la base falló: no reintentar en bucle
+    flush()
+
+
+def start():
+    """Arrancar el hilo escritor (idempotente)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="checkin-writer", daemon=True)
+    _thread.start()
+
+
+def stop():
+    """Detener el escritor escribiendo antes lo pendiente."""
+    _stop.set()
+    _hay_pendientes.set()
+    _flush_ahora.set()
+    if _thread is not None:
+        _thread.join(timeout=10)
+    flush()
+
+
+def metricas() -> dict:
+    with _lock:
+        return {**_metricas, "pendientes": len(_pendientes), "padrones": len(_padrones)}
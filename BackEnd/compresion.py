@@ -0,0 +1,273 @@
+import os
+import time
+import zlib
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+# Codificadores opcionales: se usan solo si el paquete está instalado
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Configuración desde .env
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+# Tipos de contenido que vale la pena comprimir
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/csv",
+    "text/plain",
+    "text/html",
+    "text/calendar",
+)
+
+# En streaming se fuerza un flush cada tantos bytes sin comprimir, para no
+# retener datos indefinidamente sin destruir la tasa de compresión por chunk
+STREAM_FLUSH_BYTES = 64 * 1024
+
+# Cuerpos grandes se comprimen fuera del event loop
+THREADPOOL_MIN_SIZE = 256 * 1024
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._c.compress(data)
+        if flush:
+            out += self._c.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._c.process(data)
+        if flush:
+            out += self._c.flush()
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._c.compress(data)
+        if flush:
+            out += self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+# Orden de preferencia ante empate de q-values
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _ZstdEncoder
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+ENCODERS["gzip"] = _GzipEncoder
+
+
+# Métricas por codificación (acumuladas desde el arranque del proceso)
+_metrics: Dict[str, Dict[str, float]] = {
+    name: {"respuestas": 0, "bytes_entrada": 0, "bytes_salida": 0, "cpu_segundos": 0.0}
+    for name in ENCODERS
+}
+_omitidas = {"pequenas": 0, "tipo_no_comprimible": 0}
+
+
+def compression_metrics() -> dict:
+    """Tasa de compresión y tiempo de CPU por codificación."""
+    result = {}
+    for name, m in _metrics.items():
+        result[name] = {
+            **m,
+            "ratio": round(m["bytes_salida"] / m["bytes_entrada"], 4) if m["bytes_entrada"] else None,
+            "cpu_ms_por_respuesta": round(m["cpu_segundos"] * 1000 / m["respuestas"], 3) if m["respuestas"] else None,
+        }
+    return {"codificaciones": result, "omitidas": dict(_omitidas), "tamano_minimo": COMPRESSION_MIN_SIZE}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Elegir la mejor codificación disponible según Accept-Encoding (con q-values)."""
+    if not accept_encoding:
+        return None
+
+    qvalues = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qvalues[token] = q
+
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = qvalues.get(name, qvalues.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """Middleware ASGI de compresión gzip/br/zstd con umbral de tamaño.
+
+    Las respuestas de un solo bloque por debajo de COMPRESSION_MIN_SIZE se
+    envían tal cual. Las StreamingResponse se comprimen chunk a chunk, sin
+    acumular el cuerpo completo en memoria.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.started = False
+        self.passthrough = False
+        self.encoder = None
+        self.pending = 0
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.start_message["headers"])
+
+            if not self._should_compress(headers, body, more_body):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            self.encoder = ENCODERS[self.encoding]()
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+
+            if not more_body:
+                # Respuesta de un solo bloque: comprimir todo y fijar Content-Length
+                if len(body) >= THREADPOOL_MIN_SIZE:
+                    compressed = await run_in_threadpool(self._compress_all, body)
+                else:
+                    compressed = self._compress_all(body)
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming: la longitud final es desconocida
+            del headers["Content-Length"]
+            await self._send(self.start_message)
+
+        chunk = self._compress_chunk(body, finish=not more_body)
+        if chunk or not more_body:
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _should_compress(self, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers:
+            return False
+
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            _omitidas["tipo_no_comprimible"] += 1
+            return False
+
+        if more_body:
+            declared = headers.get("content-length")
+            size = int(declared) if declared and declared.isdigit() else None
+        else:
+            size = len(body)
+        if size is not None and size < self.minimum_size:
+            _omitidas["pequenas"] += 1
+            return False
+        return True
+
+    def _compress_all(self, body: bytes) -> bytes:
+        inicio = time.thread_time()
+        compressed = self.encoder.compress(body) + self.encoder.finish()
+        self._record(len(body), len(compressed), time.thread_time() - inicio, done=True)
+        return compressed
+
+    def _compress_chunk(self, body: bytes, finish: bool) -> bytes:
+        inicio = time.thread_time()
+        self.pending += len(body)
+        flush = self.pending >= STREAM_FLUSH_BYTES
+        out = self.encoder.compress(body, flush=flush and not finish)
+        if flush:
+            self.pending = 0
+        if finish:
+            out += self.encoder.finish()
+        self._record(len(body), len(out), time.thread_time() - inicio, done=finish)
+        return out
+
+    def _record(self, bytes_in: int, bytes_out: int, cpu: float, done: bool):
+        m = _metrics[self.encoding]
+        m["bytes_entrada"] += bytes_in
+        m["bytes_salida"] += bytes_out
+        m["cpu_segundos"] += cpu
+        if done:
+            m["respuestas"] += 1
@@ -0,0 +1,290 @@
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dateutil.rrule import rrulestr
+from sqlalchemy.orm import Session
+
+from cache import cache
+from models import Clase
+import recurrencia
+
+# Detección de choques de horario por profesora.
+#
+# Cada profesora tiene en memoria un árbol de intervalos (treap aumentado con el
+# fin máximo de cada subárbol) con sus clases activas y las ocurrencias de sus
+# series. Se llena con una consulta por rango sobre (profesora_id, fecha_inicio)
+# la primera vez que se usa, las escrituras de clases lo actualizan en el sitio y
+# las de series lo descartan para que se vuelva a llenar. Buscar los intervalos
+# que se cruzan con [inicio, fin) cuesta O(log n + k). Los intervalos son
+# semiabiertos: una clase que empieza justo cuando termina otra no choca.
+#
+# Cada árbol guarda la versión de la etiqueta compartida "horario:<id>" con que se
+# llenó. Toda escritura la incrementa: el worker que escribe actualiza su árbol en
+# el sitio si estaba al día (versión anterior exacta) y los demás workers ven la
+# versión nueva y vuelven a llenar el suyo.
+
+Clave = tuple  # ("clase", id) o ("serie", serie_id, ocurrencia)
+
+
+class _Nodo:
+    __slots__ = ("inicio", "fin", "clave", "titulo", "prioridad", "max_fin", "izq", "der")
+
+    def __init__(self, inicio: datetime, fin: datetime, clave: Clave, titulo: Optional[str]):
+        self.inicio = inicio
+        self.fin = fin
+        self.clave = clave
+        self.titulo = titulo
+        self.prioridad = random.random()
+        self.max_fin = fin
+        self.izq = None
+        self.der = None
+
+    def orden(self):
+        return self.inicio, self.clave
+
+
+def _actualizar(nodo: _Nodo) -> _Nodo:
+    nodo.max_fin = nodo.fin
+    if nodo.izq is not None and nodo.izq.max_fin > nodo.max_fin:
+        nodo.max_fin = nodo.izq.max_fin
+    if nodo.der is not None and nodo.der.max_fin > nodo.max_fin:
+        nodo.max_fin = nodo.der.max_fin
+    return nodo
+
+
+def _dividir(nodo: Optional[_Nodo], orden) -> Tuple[Optional[_Nodo], Optional[_Nodo]]:
+    """Partir en (< orden, >= orden)."""
+    if nodo is None:
+        return None, None
+    if nodo.orden() < orden:
+        nodo.der, derecha = _dividir(nodo.der, orden)
+        return _actualizar(nodo), derecha
+    izquierda, nodo.izq = _dividir(nodo.izq, orden)
+    return izquierda, _actualizar(nodo)
+
+
+def _unir(a: Optional[_Nodo], b: Optional[_Nodo]) -> Optional[_Nodo]:
+    """Unir dos treaps donde todo `a` va antes que todo `b`."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prioridad > b.prioridad:
+        a.der = _unir(a.der, b)
+        return _actualizar(a)
+    b.izq = _unir(a, b.izq)
+    return _actualizar(b)
+
+
+def _quitar(nodo: Optional[_Nodo], orden) -> Optional[_Nodo]:
+    if nodo is None:
+        return None
+    actual = nodo.orden()
+    if actual == orden:
+        return _unir(nodo.izq, nodo.der)
+    if orden < actual:
+        nodo.izq = _quitar(nodo.izq, orden)
+    else:
+        nodo.der = _quitar(nodo.der, orden)
+    return _actualizar(nodo)
+
+
+class ArbolIntervalos:
+    """Treap ordenado por (inicio, clave) con el fin máximo de cada subárbol."""
+
+    def __init__(self):
+        self._raiz: Optional[_Nodo] = None
+        self._por_clave: Dict[Clave, Tuple[datetime, datetime]] = {}
+
+    def __len__(self):
+        return len(self._por_clave)
+
+    def __contains__(self, clave: Clave):
+        return clave in self._por_clave
+
+    def insertar(self, inicio: datetime, fin: datetime, clave: Clave, titulo: Optional[str] = None):
+        if clave in self._por_clave:
+            self.quitar(clave)
+        nodo = _Nodo(inicio, fin, clave, titulo)
+        izquierda, derecha = _dividir(self._raiz, nodo.orden())
+        self._raiz = _unir(_unir(izquierda, nodo), derecha)
+        self._por_clave[clave] = (inicio, fin)
+
+    def quitar(self, clave: Clave) -> bool:
+        intervalo = self._por_clave.pop(clave, None)
+        if intervalo is None:
+            return False
+        self._raiz = _quitar(self._raiz, (intervalo[0], clave))
+        return True
+
+    def solapados(self, inicio: datetime, fin: datetime) -> List[_Nodo]:
+        """Intervalos con inicio < fin y fin > inicio, ordenados por inicio."""
+        resultado = []
+        pila, nodo = [], self._raiz
+        # Recorrido en orden que poda los subárboles cuyo fin máximo no alcanza `inicio`
+        while pila or nodo is not None:
+            while nodo is not None and nodo.max_fin > inicio:
+                pila.append(nodo)
+                nodo = nodo.izq
+            if not pila:
+                break
+            nodo = pila.pop()
+            if nodo.inicio >= fin:
+                break  # el resto empieza después de la ventana
+            if nodo.fin > inicio:
+                resultado.append(nodo)
+            nodo = nodo.der
+        return resultado
+
+
+_lock = threading.Lock()
+_arboles: Dict[int, Tuple[int, ArbolIntervalos]] = {}  # profesora -> (versión, árbol)
+
+
+def _etiqueta(profesora_id: int) -> str:
+    return f"horario:{profesora_id}"
+
+
+def _cargar(db: Session, profesora_id: int) -> ArbolIntervalos:
+    arbol = ArbolIntervalos()
+    for clase_id, titulo, inicio, fin in db.query(
+        Clase.id, Clase.titulo, Clase.fecha_inicio, Clase.fecha_fin
+    ).filter(Clase.profesora_id == profesora_id, Clase.activa == True).order_by(Clase.fecha_inicio):
+        arbol.insertar(inicio, fin, ("clase", clase_id), titulo)
+    for o in recurrencia.ocurrencias(db, profesora_id):
+        if o["activa"]:
+            arbol.insertar(o["fecha_inicio"], o["fecha_fin"], ("serie", o["serie_id"], o["ocurrencia"]), o["titulo"])
+    return arbol
+
+
+def _arbol(db: Session, profesora_id: int) -> ArbolIntervalos:
+    # La versión se lee antes de consultar: una escritura posterior la deja vieja
+    version = (cache().etiquetas([_etiqueta(profesora_id)]) or [None])[0]
+    with _lock:
+        guardado = _arboles.get(profesora_id)
+        if guardado is not None and version is not None and guardado[0] == version:
+            return guardado[1]
+    arbol = _cargar(db, profesora_id)
+    if version is not None:
+        with _lock:
+            _arboles[profesora_id] = (version, arbol)
+    return arbol
+
+
+def invalidar(*profesora_ids):
+    """Descartar los árboles en todos los workers (se vuelven a llenar en la próxima consulta)."""
+    cache().invalidar(*[_etiqueta(pid) for pid in profesora_ids])
+    with _lock:
+        for profesora_id in profesora_ids:
+            _arboles.pop(profesora_id, None)
+
+
+def _aplicar(profesora_id: int, cambio: Callable[[ArbolIntervalos], None]):
+    """Invalidar el árbol en los demás workers y, si el propio está al día, actualizarlo en el sitio."""
+    nueva = cache().invalidar(_etiqueta(profesora_id))[_etiqueta(profesora_id)]
+    with _lock:
+        guardado = _arboles.get(profesora_id)
+        if guardado is None:
+            return
+        if nueva is None or guardado[0] != nueva - 1:
+            # Otro worker escribió desde que se llenó: no se sabe qué le falta
+            del _arboles[profesora_id]
+            return
+        cambio(guardado[1])
+        _arboles[profesora_id] = (nueva, guardado[1])
+
+
+def clase_guardada(profesora_id: int, clase_id: int, inicio: datetime, fin: datetime, activa: bool, titulo: str):
+    """Reflejar una clase creada o editada en el árbol de su profesora."""
+    def cambio(arbol: ArbolIntervalos):
+        if activa:
+            arbol.insertar(recurrencia.local(inicio), recurrencia.local(fin), ("clase", clase_id), titulo)
+        else:
+            arbol.quitar(("clase", clase_id))
+    _aplicar(profesora_id, cambio)
+
+
+def clase_eliminada(profesora_id: int, clase_id: int):
+    _aplicar(profesora_id, lambda arbol: arbol.quitar(("clase", clase_id)))
+
+
+def _describir(inicio: datetime, fin: datetime, clave: Clave, titulo: Optional[str]) -> dict:
+    item = {"tipo": clave[0], "titulo": titulo, "fecha_inicio": inicio, "fecha_fin": fin}
+    if clave[0] == "clase":
+        item["clase_id"] = clave[1]
+    elif clave[0] == "serie":
+        item["serie_id"], item["ocurrencia"] = clave[1], clave[2]
+    else:
+        item["indice"] = clave[1]
+    return item
+
+
+def validar(
+    db: Session,
+    profesora_id: int,
+    intervalos: Iterable[Tuple[datetime, datetime, Clave, Optional[str]]],
+    ignorar: Optional[Callable[[Clave], bool]] = None
+) -> List[dict]:
+    """Choques de un horario propuesto (una clase, una serie o un lote) en una pasada.
+
+    Cada intervalo se busca en el árbol (O(log n + k)); los choques entre los propios
+    intervalos se encuentran ordenándolos y barriendo. `ignorar` descarta claves del
+    árbol, p. ej. la misma clase o las ocurrencias de la serie que se está editando.
+    """
+    propuestos = sorted(
+        ((recurrencia.local(i), recurrencia.local(f), c, t) for i, f, c, t in intervalos if f > i),
+        key=lambda x: (x[0], x[1])
+    )
+    if not propuestos:
+        return []
+    conflictos = []
+    arbol = _arbol(db, profesora_id)
+    with _lock:
+        for inicio, fin, clave, titulo in propuestos:
+            for nodo in arbol.solapados(inicio, fin):
+                if ignorar is None or not ignorar(nodo.clave):
+                    conflictos.append({
+                        "propuesta": _describir(inicio, fin, clave, titulo),
+                        "existente": _describir(nodo.inicio, nodo.fin, nodo.clave, nodo.titulo),
+                    })
+    # Barrido: los abiertos se mantienen ordenados por inicio y se descartan al terminar
+    abiertos = []
+    for inicio, fin, clave, titulo in propuestos:
+        abiertos = [a for a in abiertos if a[1] > inicio]
+        for otro in abiertos:
+            conflictos.append({
+                "propuesta": _describir(inicio, fin, clave, titulo),
+                "existente": _describir(*otro),
+            })
+        abiertos.append((inicio, fin, clave, titulo))
+    return conflictos
+
+
+def reporte(db: Session, profesora_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+    """Pares de intervalos de la profesora que se cruzan y tocan la ventana [desde, hasta)."""
+    arbol = _arbol(db, profesora_id)
+    pares = []
+    with _lock:
+        en_ventana = arbol.solapados(recurrencia.local(desde), recurrencia.local(hasta))
+        vistos = {id(nodo) for nodo in en_ventana}
+        for nodo in en_ventana:
+            for otro in arbol.solapados(nodo.inicio, nodo.fin):
+                # Cada par una vez: si ambos están en la ventana, lo reporta el primero
+                if otro is not nodo and (id(otro) not in vistos or otro.orden() > nodo.orden()):
+                    pares.append({
+                        "profesora_id": profesora_id,
+                        "a": _describir(nodo.inicio, nodo.fin, nodo.clave, nodo.titulo),
+                        "b": _describir(otro.inicio, otro.fin, otro.clave, otro.titulo),
+                    })
+    return pares
+
+
+def expandir_serie(regla: str, inicio: datetime, duracion_minutos: int, serie_id=None, titulo=None):
+    """Intervalos de todas las ocurrencias de una regla (ya validada) para `validar`."""
+    duracion = timedelta(minutes=duracion_minutos)
+    return [
+        (o, o + duracion, ("serie", serie_id, o), titulo)
+        for o in rrulestr(regla, dtstart=recurrencia.local(inicio))
+    ]
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+from starlette.requests import Request
 import os
+import time
+from types import SimpleNamespace
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,19 +20,125 @@ MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "tecnoacademia2")
 # Escapar la contraseña para caracteres especiales
 escaped_password = quote_plus(MYSQL_PASSWORD)
 
-# URL de conexión a MySQL
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{escaped_password}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}?charset=utf8mb4"
-
-# Configuración del motor de base de datos
-engine = create_engine(
-    DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=10,
-    max_overflow=20,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    echo=False  # Cambiar a True para debug SQL
-)
+# URL de conexión a MySQL (DATABASE_URL permite usar otra base, p.ej. SQLite en pruebas)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+pymysql://{MYSQL_USER}:{escaped_password}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}?charset=utf8mb4"
+
+# Réplica de solo lectura opcional; sin ella las lecturas usan la base principal
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+# Tras una escritura, las lecturas van a la principal durante esta ventana (o el
+# retraso medido de la réplica, si es mayor): el ETag ya refleja la escritura
+READ_YOUR_WRITES_SEGUNDOS = float(os.getenv("READ_YOUR_WRITES_SEGUNDOS", "5"))
+
+# Tamaños de los pools por tipo de carga
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "10"))
+READ_MAX_OVERFLOW = int(os.getenv("READ_MAX_OVERFLOW", "20"))
+HEAVY_POOL_SIZE = int(os.getenv("HEAVY_POOL_SIZE", "3"))
+HEAVY_MAX_OVERFLOW = int(os.getenv("HEAVY_MAX_OVERFLOW", "2"))
+HEAVY_POOL_TIMEOUT = int(os.getenv("HEAVY_POOL_TIMEOUT", "60"))
+
+# Errores del servidor al cortar una consulta: max_execution_time vencido y KILL QUERY
+ER_QUERY_TIMEOUT = 3024
+ER_QUERY_INTERRUPTED = 1317
+
+# Contadores por pool (además de pool.status())
+_pool_stats = {}
+
+
+def _instrument_pool(engine, nombre):
+    stats = _pool_stats.setdefault(nombre, {"conexiones_creadas": 0, "checkouts": 0, "checkins": 0, "invalidadas": 0})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats["conexiones_creadas"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats["checkouts"] += 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        stats["checkins"] += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats["invalidadas"] += 1
+
+
+def _create_engine(url, nombre, pool_size, max_overflow, pool_timeout=30):
+    connect_args = {}
+    if url.startswith("sqlite"):
+        connect_args["check_same_thread"] = False
+
+    db_engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=connect_args,
+        echo=False  # Cambiar a True para debug SQL
+    )
+
+    if url.startswith("sqlite"):
+        # SQLite no aplica claves foráneas (ni ON DELETE CASCADE) sin este pragma
+        @event.listens_for(db_engine, "connect")
+        def _sqlite_foreign_keys(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        # El presupuesto de SQLite se mide por sentencia, como max_execution_time
+        @event.listens_for(db_engine, "before_cursor_execute")
+        def _sqlite_reiniciar_presupuesto(conn, cursor, statement, parameters, context, executemany):
+            limite = conn.connection.info.get("limite")
+            if limite is not None:
+                limite[0] = time.monotonic() + conn.connection.info["presupuesto_ms"] / 1000
+
+    # La conexión vuelve al pool sin el presupuesto de la petición que la usó y
+    # deja de ser cancelable. El evento corre antes de que otra petición pueda
+    # tomarla, y el candado espera a un KILL QUERY que ya esté en curso
+    @event.listens_for(db_engine, "checkin")
+    def _quitar_presupuesto(dbapi_connection, connection_record):
+        vigilada = connection_record.info.pop("sesion_vigilada", None)
+        if vigilada is not None:
+            lock, info = vigilada
+            with lock:
+                objetivo = info.get("objetivo")
+                if objetivo is not None and (dbapi_connection is None or objetivo[1] is dbapi_connection):
+                    info.pop("objetivo")
+        if dbapi_connection is None or not connection_record.info.pop("presupuesto_ms", None):
+            return
+        connection_record.info.pop("limite", None)
+        if url.startswith("sqlite"):
+            dbapi_connection.set_progress_handler(None, 0)
+        else:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET SESSION max_execution_time = DEFAULT")
+            cursor.close()
+
+    _instrument_pool(db_engine, nombre)
+    return db_engine
+
+
+# Motor principal: escrituras, login y operaciones sensibles a latencia (toggle)
+engine = _create_engine(DATABASE_URL, "principal", DB_POOL_SIZE, DB_MAX_OVERFLOW)
+
+# Lecturas: réplica si está configurada, con su propio pool
+read_engine = _create_engine(REPLICA_DATABASE_URL or DATABASE_URL, "lectura", READ_POOL_SIZE, READ_MAX_OVERFLOW)
+
+# Trabajo pesado (importar/exportar/reportes): pool pequeño y acotado sobre la base
+# principal, para que una exportación grande no agote las conexiones del resto
+heavy_engine = _create_engine(DATABASE_URL, "pesado", HEAVY_POOL_SIZE, HEAVY_MAX_OVERFLOW, HEAVY_POOL_TIMEOUT)
+
+ENGINES = {
+    "principal": engine,
+    "lectura": read_engine,
+    "pesado": heavy_engine,
+}
 
 # Crear la fábrica de sesiones
 SessionLocal = sessionmaker(
@@ -38,19 +147,193 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+HeavySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=heavy_engine)
+
 # Dependencia para obtener la sesión de la base de datos
-def get_db():
+def _sesion_compartida(request: Request):
+    # /batch ejecuta varias lecturas con una sola sesión (ver routers/batch.py)
+    return getattr(request.state, "db_compartida", None)
+
+def get_db(request: Request):
+    compartida = _sesion_compartida(request)
+    if compartida is not None:
+        yield compartida
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def _alcance_lectura(request: Request) -> str:
+    """Alcance de versiones.py que lee la petición: el de la profesora del token.
+
+    Admin (salvo que filtre por profesora_id) y peticiones sin token leen el global.
+    """
+    # Imports locales: auth y versiones importan este módulo
+    from auth import _leer_token, datos_principal
+    import versiones
+
+    esquema, _, token = request.headers.get("authorization", "").partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return "global"
+    try:
+        email, profesora_id = _leer_token(token)
+    except Exception:
+        return "global"
+    if profesora_id is None:
+        return "global"
+    # La misma entrada en caché que get_current_user: solo consulta si venció
+    db = SessionLocal()
+    try:
+        datos = datos_principal(db, profesora_id)
+    finally:
+        db.close()
+    if datos is None or datos["email"] != email:
+        return "global"
+    return versiones._resolver_alcance(request, SimpleNamespace(id=profesora_id, is_admin=datos["is_admin"]), "profesora")
+
+def _leer_de_principal(request: Request, alcance: str = "profesora") -> bool:
+    """True si hubo una escritura en el alcance leído que la réplica quizá aún no tenga.
+
+    Los contadores de versiones.py avanzan en la escritura, así que una lectura de
+    la réplica atrasada quedaría guardada por el cliente bajo el ETag nuevo y el
+    304 la serviría hasta la próxima escritura. Cada escritura avanza también el
+    alcance global: si el global no se escribió en la ventana, ninguno lo hizo y
+    no hace falta resolver la profesora.
+    """
+    if not REPLICA_DATABASE_URL:
+        return False
+    import salud
+    import versiones
+    ventana = max(READ_YOUR_WRITES_SEGUNDOS, salud.ultimo_lag() or 0)
+    transcurrido = versiones.escrito_hace("global")
+    if transcurrido is None or transcurrido >= ventana:
+        return False
+    if alcance != "global":
+        alcance = _alcance_lectura(request)
+        if alcance != "global":
+            transcurrido = versiones.escrito_hace(alcance)
+    return transcurrido is not None and transcurrido < ventana
+
+def _sesion_lectura(request: Request, alcance: str):
+    compartida = _sesion_compartida(request)
+    if compartida is not None:
+        yield compartida
+        return
+    db = SessionLocal() if _leer_de_principal(request, alcance) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependencia para endpoints de solo lectura (réplica si existe); tras una
+# escritura en el alcance de la profesora del token, la principal
+def get_read_db(request: Request):
+    yield from _sesion_lectura(request, "profesora")
+
+# Igual, para lecturas de datos globales (etag_global): cualquier escritura cuenta
+def get_global_read_db(request: Request):
+    yield from _sesion_lectura(request, "global")
+
+# Dependencia para importaciones, exportaciones y reportes
+def get_heavy_db(request: Request):
+    compartida = _sesion_compartida(request)
+    if compartida is not None:
+        yield compartida
+        return
+    db = HeavySessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# === PRESUPUESTO DE TIEMPO Y CANCELACIÓN DE CONSULTAS ===
+# cancelacion.py deja en session.info el presupuesto (ms) de la petición y un
+# candado; al empezar la transacción se aplica a la conexión y se recuerda cuál
+# es, para poder cortar su consulta desde otro hilo mientras la sesión la tenga.
+# El listener "checkin" del motor la olvida cuando vuelve al pool.
+
+@event.listens_for(Session, "after_begin")
+def _aplicar_presupuesto(session, transaction, connection):
+    presupuesto_ms = session.info.get("presupuesto_ms")
+    if not presupuesto_ms:
+        return
+    fairy = connection.connection
+    dbapi_connection = fairy.dbapi_connection
+    if connection.dialect.name == "sqlite":
+        limite = [time.monotonic() + presupuesto_ms / 1000]
+        dbapi_connection.set_progress_handler(lambda: time.monotonic() > limite[0], 10000)
+        fairy.info["limite"] = limite
+        hilo = None
+    else:
+        # Solo afecta a los SELECT; las escrituras de la misma sesión no se cortan
+        connection.exec_driver_sql(f"SET SESSION max_execution_time = {int(presupuesto_ms)}")
+        hilo = dbapi_connection.thread_id()
+    fairy.info["presupuesto_ms"] = presupuesto_ms
+    fairy.info["sesion_vigilada"] = (session.info["lock_cancelacion"], session.info)
+    with session.info["lock_cancelacion"]:
+        session.info["objetivo"] = (connection.dialect.name, dbapi_connection, hilo)
+
+# Conexiones sin pool para KILL QUERY: el pool de la consulta puede estar agotado
+_motores_cancelacion = {}
+
+def cancelar_consulta(session: Session) -> bool:
+    """Cortar en el servidor la consulta en curso de la sesión (desde otro hilo)."""
+    lock = session.info.get("lock_cancelacion")
+    if lock is None:
+        return False
+    with lock:
+        objetivo = session.info.get("objetivo")
+        if objetivo is None:
+            return False
+        dialecto, dbapi_connection, hilo = objetivo
+        if dialecto == "sqlite":
+            dbapi_connection.interrupt()
+            return True
+        url = session.get_bind().url
+        motor = _motores_cancelacion.get(url)
+        if motor is None:
+            motor = _motores_cancelacion.setdefault(url, create_engine(url, poolclass=NullPool))
+        with motor.connect() as conexion:
+            conexion.exec_driver_sql(f"KILL QUERY {int(hilo)}")
+    return True
+
+def consulta_interrumpida(error: Exception) -> bool:
+    """Si el error es de una consulta cortada por presupuesto o cancelación."""
+    orig = getattr(error, "orig", None)
+    if orig is None:
+        return False
+    if orig.args and orig.args[0] in (ER_QUERY_TIMEOUT, ER_QUERY_INTERRUPTED):
+        return True
+    return "interrupted" in str(orig)  # SQLite
+
+def pool_metrics():
+    """Estado y contadores de cada pool de conexiones."""
+    result = {}
+    for nombre, db_engine in ENGINES.items():
+        pool = db_engine.pool
+        capacidad = pool.size() + db_engine.pool._max_overflow
+        en_uso = pool.checkedout()
+        result[nombre] = {
+            "url": db_engine.url.render_as_string(hide_password=True),
+            "tamano": pool.size(),
+            "max_overflow": db_engine.pool._max_overflow,
+            "en_uso": en_uso,
+            "libres": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "saturacion": round(en_uso / capacidad, 4) if capacidad else None,
+            **_pool_stats.get(nombre, {}),
+        }
+    return result
+
 # Función para verificar la conexión
 def test_connection():
     try:
         with engine.connect() as connection:
-            result = connection.execute("SELECT 1")
+            connection.execute(text("SELECT 1"))
             print("✅ Conexión a MySQL exitosa")
             return True
     except Exception as e:
@@ -66,4 +349,4 @@ def create_tables():
         return True
     except Exception as e:
         print(f"❌ Error creando tablas: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,158 @@
+import os
+from datetime import date
+from typing import Iterator, Optional
+
+from sqlalchemy import and_, false, func, select, union_all
+from sqlalchemy.orm import Session
+
+import archivado
+from archivado import pa, pq
+from models import Aprendiz, Asistencia, Sesion
+from sesiones import en_asignacion
+
+# Exportación columnar (Parquet / Arrow IPC) de la asistencia en forma larga:
+# una fila por (profesora_id, aprendiz_id, fecha, presente), ya expandida desde el
+# calendario de sesiones. Las filas salen de un cursor del lado del servidor en
+# lotes de EXPORT_BATCH_ROWS y se escriben como record batches a medida que llegan.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "65536"))
+
+ESQUEMA = pa.schema([
+    ("profesora_id", pa.int32()),
+    ("aprendiz_id", pa.int32()),
+    ("fecha", pa.date32()),
+    ("presente", pa.bool_()),
+]) if pa is not None else None
+
+
+def disponible() -> bool:
+    return pa is not None
+
+
+def consulta_larga(profesora_id: Optional[int] = None, desde: Optional[date] = None, hasta: Optional[date] = None):
+    """SELECT de la matriz expandida: sesiones x aprendices (LEFT JOIN a las marcas)
+    desde la asignación de cada aprendiz, más las filas guardadas fuera de esa zona
+    (p.ej. las ausencias con la profesora anterior)."""
+    en_zona = and_(Sesion.profesora_id == Aprendiz.profesora_id, en_asignacion(Sesion.fecha))
+    en_sesion = (
+        select(
+            func.coalesce(Asistencia.profesora_id, Sesion.profesora_id).label("profesora_id"),
+            Aprendiz.id.label("aprendiz_id"),
+            Sesion.fecha.label("fecha"),
+            func.coalesce(Asistencia.presente, false()).label("presente"),
+        )
+        .select_from(Aprendiz)
+        .join(Sesion, en_zona)
+        .outerjoin(Asistencia, and_(Asistencia.aprendiz_id == Aprendiz.id, Asistencia.fecha == Sesion.fecha))
+    )
+    fuera_de_sesion = (
+        select(
+            func.coalesce(Asistencia.profesora_id, Aprendiz.profesora_id).label("profesora_id"),
+            Asistencia.aprendiz_id.label("aprendiz_id"),
+            Asistencia.fecha.label("fecha"),
+            Asistencia.presente.label("presente"),
+        )
+        .select_from(Asistencia)
+        .join(Aprendiz, Aprendiz.id == Asistencia.aprendiz_id)
+        .outerjoin(Sesion, and_(en_zona, Sesion.fecha == Asistencia.fecha))
+        .where(Sesion.id.is_(None))
+    )
+    if profesora_id is not None:
+        en_sesion = en_sesion.where(Aprendiz.profesora_id == profesora_id)
+        fuera_de_sesion = fuera_de_sesion.where(Aprendiz.profesora_id == profesora_id)
+    if desde:
+        en_sesion = en_sesion.where(Sesion.fecha >= desde)
+        fuera_de_sesion = fuera_de_sesion.where(Asistencia.fecha >= desde)
+    if hasta:
+        en_sesion = en_sesion.where(Sesion.fecha <= hasta)
+        fuera_de_sesion = fuera_de_sesion.where(Asistencia.fecha <= hasta)
+    return union_all(en_sesion, fuera_de_sesion)
+
+
+def lotes(
+    db: Session,
+    profesora_id: Optional[int] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS
+) -> Iterator["pa.RecordBatch"]:
+    """Record batches de la tabla caliente (cursor del servidor) y del archivo frío."""
+    resultado = db.execute(
+        consulta_larga(profesora_id, desde, hasta),
+        execution_options={"stream_results": True, "yield_per": batch_rows}
+    )
+    for filas in resultado.partitions():
+        columnas = list(zip(*filas))
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array(columnas[0], pa.int32()),
+                pa.array(columnas[1], pa.int32()),
+                pa.array(columnas[2], pa.date32()),
+                pa.array([bool(v) for v in columnas[3]], pa.bool_()),
+            ],
+            schema=ESQUEMA
+        )
+
+    # Años archivados: el filtro por profesora/fecha se empuja al lector de Parquet
+    filtros = []
+    if profesora_id is not None:
+        aprendiz_ids = [i for (i,) in db.query(Aprendiz.id).filter(Aprendiz.profesora_id == profesora_id)]
+        if not aprendiz_ids:
+            return
+        filtros.append(("aprendiz_id", "in", aprendiz_ids))
+    if desde:
+        filtros.append(("fecha", ">=", desde))
+    if hasta:
+        filtros.append(("fecha", "<=", hasta))
+    for entrada in archivado.anios_archivados(desde, hasta):
+        tabla = pq.read_table(
+            os.path.join(archivado.ARCHIVE_DIR, entrada["archivo"]),
+            columns=ESQUEMA.names,
+            filters=filtros or None
+        )
+        yield from tabla.cast(ESQUEMA).to_batches(max_chunksize=batch_rows)
+
+
+class _Buffer:
+    """Destino de escritura que acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self.partes = []
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def stream_parquet(batches: Iterator["pa.RecordBatch"], compression: str = "zstd") -> Iterator[bytes]:
+    """Parquet escrito de forma incremental: un row group por lote."""
+    buffer = _Buffer()
+    with pq.ParquetWriter(pa.PythonFile(buffer, mode="w"), ESQUEMA, compression=compression) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            datos = buffer.vaciar()
+            if datos:
+                yield datos
+    yield buffer.vaciar()
+
+
+def stream_arrow(batches: Iterator["pa.RecordBatch"]) -> Iterator[bytes]:
+    """Formato de streaming Arrow IPC (application/vnd.apache.arrow.stream)."""
+    buffer = _Buffer()
+    with pa.ipc.new_stream(pa.PythonFile(buffer, mode="w"), ESQUEMA) as writer:
+        yield buffer.vaciar()
+        for batch in batches:
+            writer.write_batch(batch)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from cache import CACHE_BACKEND, cache
+
+# Con CACHE_BACKEND compartida o resp las entradas (y la marca de "en curso") viven
+# en la caché compartida: un reintento que llega a otro worker reproduce la
+# respuesta o espera a la original. Con la caché en memoria, o si el backend no
+# responde, el almacén es el del proceso y solo protege los reintentos que llegan
+# al mismo worker.
+
+# Escrituras de asistencia que aceptan el encabezado Idempotency-Key
+IDEMPOTENT_ROUTES = {
+    ("POST", "/asistencia/"),
+    ("POST", "/asistencia/masiva"),
+    ("POST", "/asistencia/importar"),
+    ("POST", "/asistencia/importar/"),
+}
+
+# Configuración desde .env
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "2000"))
+# Respuestas más grandes no se guardan (la clave se libera y un reintento se ejecuta de nuevo)
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(1024 * 1024)))
+# Vida de la marca "en curso" en la caché compartida: si el worker muere, la clave se libera
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", "600"))
+
+_ENCUESTA = 0.05  # intervalo de consulta mientras otro worker ejecuta la original
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?')
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "expires")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.response = None  # (status, headers, body) cuando termina con éxito
+        self.expires = time.monotonic() + IDEMPOTENCY_TTL
+
+
+class IdempotencyStore:
+    """Almacén LRU acotado de respuestas por clave de idempotencia (del proceso)."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.done.is_set() and entry.expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def add(self, key, entry):
+        self._entries[key] = entry
+        # Expulsar las más antiguas ya terminadas; las que están en curso se conservan
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(
+                (k for k, e in self._entries.items() if e.done.is_set()),
+                None
+            )
+            if oldest_key is None:
+                break
+            del self._entries[oldest_key]
+
+    def discard(self, key, entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+store = IdempotencyStore()
+
+
+def _clave_compartida(key: str) -> str:
+    return f"idempotencia:{key}"
+
+
+def _codificar(fingerprint: str, response=None) -> bytes:
+    cabecera = {"huella": fingerprint}
+    if response is not None:
+        status, headers, body = response
+        cabecera["status"] = status
+        cabecera["headers"] = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers]
+    return orjson.dumps(cabecera) + b"\n" + (response[2] if response is not None else b"")
+
+
+def _decodificar(valor: bytes) -> Tuple[str, Optional[tuple]]:
+    cabecera, _, body = valor.partition(b"\n")
+    datos = orjson.loads(cabecera)
+    if "status" not in datos:
+        return datos["huella"], None
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in datos["headers"]]
+    return datos["huella"], (datos["status"], headers, body)
+
+
+async def _reservar_compartida(key: str, fingerprint: str):
+    """Tomar la clave en la caché compartida o esperar a quien la tiene.
+
+    Devuelve ("propia", None), ("distinta", None), ("respuesta", respuesta) o None
+    si el backend no responde.
+    """
+    clave = _clave_compartida(key)
+    while True:
+        tomada = await run_in_threadpool(cache().add, clave, _codificar(fingerprint), IDEMPOTENCY_LOCK_TTL)
+        if tomada is None:
+            return None
+        if tomada:
+            return "propia", None
+        valor = await run_in_threadpool(cache().get, clave)
+        if valor is None:
+            continue  # la original falló o venció entre el add y el get
+        huella, response = _decodificar(valor)
+        if huella != fingerprint:
+            return "distinta", None
+        if response is not None:
+            return "respuesta", response
+        await asyncio.sleep(_ENCUESTA)
+
+
+def _fingerprint(headers: Headers, query_string: bytes, body: bytes) -> str:
+    """Huella del cuerpo. En multipart se elimina el boundary, que el navegador
+    genera de nuevo en cada reintento aunque el archivo sea el mismo."""
+    content_type = headers.get("content-type", "")
+    match = _BOUNDARY_RE.search(content_type)
+    if match:
+        body = body.replace(match.group(1).encode("latin-1"), b"")
+    digest = hashlib.sha256()
+    digest.update(query_string)
+    digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class IdempotencyMiddleware:
+    """Reproduce la primera respuesta de una escritura con el mismo Idempotency-Key.
+
+    La clave se asocia al encabezado Authorization, así dos usuarios no pueden
+    compartir resultados. Un duplicado que llega mientras la original sigue en
+    curso (en este worker o, con caché compartida, en otro) espera a que termine
+    en lugar de ejecutarse en paralelo.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        # Leer el cuerpo completo para calcular la huella y reinyectarlo después
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        key = hashlib.sha256(
+            "\0".join((headers.get("authorization", ""), scope["method"], scope["path"], idempotency_key)).encode()
+        ).hexdigest()
+        fingerprint = _fingerprint(headers, scope.get("query_string", b""), body)
+
+        reserva = await _reservar_compartida(key, fingerprint) if CACHE_BACKEND != "memoria" else None
+        compartida = reserva is not None
+        if compartida:
+            resultado, response = reserva
+            if resultado == "distinta":
+                await self._rechazar(scope, receive, send)
+                return
+            if resultado == "respuesta":
+                await self._replay(response, send)
+                return
+            entry = None
+        else:
+            while True:
+                entry = store.get(key)
+                if entry is None:
+                    break
+                if entry.fingerprint != fingerprint:
+                    await self._rechazar(scope, receive, send)
+                    return
+                if not entry.done.is_set():
+                    await entry.done.wait()
+                    continue
+                if entry.response is not None:
+                    await self._replay(entry.response, send)
+                    return
+                # La original falló: se ejecuta de nuevo
+
+            entry = _Entry(fingerprint)
+            store.add(key, entry)
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        captured = {"status": None, "headers": None, "body": [], "size": 0, "overflow": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body" and not captured["overflow"]:
+                chunk = message.get("body", b"")
+                captured["size"] += len(chunk)
+                if captured["size"] > IDEMPOTENCY_MAX_BODY:
+                    captured["overflow"] = True
+                    captured["body"] = []
+                else:
+                    captured["body"].append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            status = captured["status"]
+            response = None
+            if status is not None and status < 500 and not captured["overflow"]:
+                response = (status, captured["headers"], b"".join(captured["body"]))
+            if compartida:
+                # Si la original falló se borra la marca y un reintento se ejecuta de nuevo
+                if response is not None:
+                    await run_in_threadpool(
+                        cache().set, _clave_compartida(key), _codificar(fingerprint, response), IDEMPOTENCY_TTL
+                    )
+                else:
+                    await run_in_threadpool(cache().delete, _clave_compartida(key))
+            else:
+                if response is not None:
+                    entry.response = response
+                else:
+                    store.discard(key, entry)
+                entry.done.set()
+
+    async def _rechazar(self, scope, receive, send):
+        await JSONResponse(
+            status_code=422,
+            content={"detail": "Idempotency-Key ya usada con una petición diferente"}
+        )(scope, receive, send)
+
+    async def _replay(self, response, send):
+        status, headers, body = response
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,595 @@
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import openpyxl
+from sqlalchemy import delete, or_, update
+from sqlalchemy.orm import Session
+
+from models import Aprendiz, Asistencia
+from sesiones import _insert_ignorando_duplicados, dentro_de_asignacion, registrar_sesiones, sesiones_existentes
+
+# Límites de importación (configurables en .env)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+IMPORT_MAX_UNCOMPRESSED_BYTES = int(os.getenv("IMPORT_MAX_UNCOMPRESSED_BYTES", str(200 * 1024 * 1024)))
+IMPORT_MAX_CELLS = int(os.getenv("IMPORT_MAX_CELLS", "2000000"))
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+# Importación por lotes: procesos que parsean en paralelo (0 = en el hilo del servidor)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(min(os.cpu_count() or 1, 4))))
+IMPORT_MAX_FILES = int(os.getenv("IMPORT_MAX_FILES", "100"))
+
+NOMBRE_COLUMNS = ["NOMBRES", "NOMBRE", "Nombres", "Nombre"]
+DOCUMENTO_COLUMN = "DOCUMENTO"
+VALORES_PRESENTE = ("x", "1", "true", "si", "sí", "y", "yes")
+
+
+class ArchivoInvalido(ValueError):
+    """El archivo no se puede importar; status_code indica la respuesta HTTP."""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class Registro(NamedTuple):
+    fila: int
+    nombre: str
+    documento: Optional[str]
+    marcas: List[Tuple[date, bool]]
+
+
+class HojaAsistencia(NamedTuple):
+    fecha_cols: List[Tuple[int, date]]
+    bloques: Iterator[List[Registro]]
+    errores: List[str]
+
+
+def parse_date_col(col):
+    """Helper function para parsear fechas de diferentes formatos"""
+    if isinstance(col, datetime):
+        return col.date()
+    if isinstance(col, date):
+        return col
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(str(col), fmt).date()
+        except Exception:
+            continue
+    return None
+
+
+def parse_presente(val) -> bool:
+    """Interpretar una celda de asistencia (vacía = ausente)"""
+    if val is None or val == '':
+        return False
+    if isinstance(val, float) and val != val:  # NaN
+        return False
+    s = str(val).strip().lower()
+    if s in VALORES_PRESENTE:
+        return True
+    try:
+        return float(val) != 0
+    except (ValueError, TypeError):
+        return bool(s)  # Si hay algún valor, considerar presente
+
+
+def _texto_celda(val) -> str:
+    if val is None:
+        return ""
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    texto = str(val).strip()
+    return "" if texto.lower() == "nan" else texto
+
+
+def _tamano(fileobj) -> int:
+    posicion = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    tamano = fileobj.tell()
+    fileobj.seek(posicion)
+    return tamano
+
+
+def _es_csv(filename: Optional[str], content_type: Optional[str]) -> bool:
+    if filename and filename.lower().endswith((".csv", ".txt")):
+        return True
+    return bool(content_type) and content_type.split(";")[0].strip() in ("text/csv", "text/plain")
+
+
+def _filas_csv(fileobj) -> Iterator[tuple]:
+    texto = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        muestra = texto.read(8192)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        for fila in csv.reader(texto, dialecto):
+            yield tuple(fila)
+    finally:
+        if not texto.closed:
+            texto.detach()
+
+
+def _inspeccionar_xlsx(fileobj):
+    """Rechazar libros enormes leyendo solo el directorio del zip."""
+    try:
+        with zipfile.ZipFile(fileobj) as zf:
+            descomprimido = sum(info.file_size for info in zf.infolist())
+    except zipfile.BadZipFile as e:
+        raise ArchivoInvalido(f"Error leyendo Excel: {e}")
+    finally:
+        fileobj.seek(0)
+    if descomprimido > IMPORT_MAX_UNCOMPRESSED_BYTES:
+        raise ArchivoInvalido("El archivo Excel es demasiado grande", status_code=413)
+
+
+def _filas_xlsx(fileobj) -> Iterator[tuple]:
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # En modo read_only las dimensiones salen de la cabecera <dimension> de la hoja
+        if ws.max_row and ws.max_column and ws.max_row * ws.max_column > IMPORT_MAX_CELLS:
+            raise ArchivoInvalido(
+                f"La hoja tiene demasiadas celdas ({ws.max_row} filas x {ws.max_column} columnas)",
+                status_code=413
+            )
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def abrir_filas(fileobj, filename: Optional[str] = None, content_type: Optional[str] = None) -> Iterator[tuple]:
+    """Iterador de filas (tuplas de valores) sin cargar el archivo completo en memoria."""
+    if _tamano(fileobj) > IMPORT_MAX_BYTES:
+        raise ArchivoInvalido("El archivo supera el tamaño máximo permitido", status_code=413)
+    fileobj.seek(0)
+    if _es_csv(filename, content_type):
+        return _filas_csv(fileobj)
+    _inspeccionar_xlsx(fileobj)
+    return _filas_xlsx(fileobj)
+
+
+def leer_hoja(
+    fileobj,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    chunk_size: int = IMPORT_CHUNK_ROWS
+) -> HojaAsistencia:
+    """Leer el encabezado, detectar columnas y devolver los registros en bloques."""
+    filas = abrir_filas(fileobj, filename, content_type)
+    try:
+        encabezado = next(filas)
+    except StopIteration:
+        raise ArchivoInvalido("El archivo está vacío")
+    except ArchivoInvalido:
+        raise
+    except Exception as e:
+        raise ArchivoInvalido(f"Error leyendo Excel: {e}")
+
+    columnas = [c if c is not None else "" for c in encabezado]
+
+    # Detectar columna de nombre
+    nombre_idx = 0
+    for cand in NOMBRE_COLUMNS:
+        if cand in columnas:
+            nombre_idx = columnas.index(cand)
+            break
+    documento_idx = columnas.index(DOCUMENTO_COLUMN) if DOCUMENTO_COLUMN in columnas else None
+
+    # Detectar columnas fecha
+    fecha_cols = []
+    for idx, col in enumerate(columnas):
+        fecha_parsed = parse_date_col(col)
+        if fecha_parsed:
+            fecha_cols.append((idx, fecha_parsed))
+
+    if not fecha_cols:
+        filas.close()
+        raise ArchivoInvalido("No se encontraron columnas de fecha válidas en el archivo")
+
+    errores = []
+
+    def bloques():
+        bloque = []
+        for numero, fila in enumerate(filas, start=2):
+            try:
+                nombre = _texto_celda(fila[nombre_idx] if nombre_idx < len(fila) else None)
+                if not nombre:
+                    continue
+                documento = None
+                if documento_idx is not None and documento_idx < len(fila):
+                    documento = _texto_celda(fila[documento_idx]) or None
+                marcas = [
+                    (fecha, parse_presente(fila[idx] if idx < len(fila) else None))
+                    for idx, fecha in fecha_cols
+                ]
+                bloque.append(Registro(numero, nombre, documento, marcas))
+            except Exception as e:
+                errores.append(f"Error procesando fila {numero}: {str(e)}")
+            if len(bloque) >= chunk_size:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+
+    return HojaAsistencia(fecha_cols, bloques(), errores)
+
+
+class PlanImportacion:
+    """Lo que una importación deja hecho para los bloques siguientes.
+
+    La importación real lo encuentra en la base (sesiones registradas, aprendices
+    creados, celdas escritas); una simulación no escribe, así que lo arrastra aquí
+    para que cada bloque vea lo mismo que vería la importación. Las celdas de la
+    simulación se guardan como tres máscaras de bits por aprendiz (una por fecha
+    del archivo), no como un dict por celda.
+    """
+
+    def __init__(self):
+        self.sesiones: Set[date] = set()
+        self.por_documento: Dict[str, Aprendiz] = {}
+        self.por_nombre: Dict[str, Aprendiz] = {}
+        self.creados: Set[int] = set()  # id() de los aprendices creados por la importación
+        self._fechas: Dict[date, int] = {}
+        self._celdas: Dict[object, Tuple[int, int, int]] = {}  # aprendiz -> (tocadas, con fila, presentes)
+
+    @staticmethod
+    def _clave(aprendiz: Aprendiz):
+        return aprendiz.id if aprendiz.id is not None else ("nuevo", aprendiz.documento or aprendiz.nombre)
+
+    def agregar_aprendiz(self, aprendiz: Aprendiz):
+        self.creados.add(id(aprendiz))
+        self.por_nombre[aprendiz.nombre] = aprendiz
+        if aprendiz.documento:
+            self.por_documento[aprendiz.documento] = aprendiz
+
+    def marcar(self, aprendiz: Aprendiz, fecha: date, fila: Optional[bool]):
+        """Anotar la fila que la importación deja en la celda (None: sin fila)."""
+        bit = 1 << self._fechas.setdefault(fecha, len(self._fechas))
+        tocadas, con_fila, presentes = self._celdas.get(self._clave(aprendiz), (0, 0, 0))
+        self._celdas[self._clave(aprendiz)] = (
+            tocadas | bit,
+            con_fila | bit if fila is not None else con_fila & ~bit,
+            presentes | bit if fila else presentes & ~bit,
+        )
+
+    def fila(self, aprendiz: Aprendiz, fecha: date) -> Tuple[bool, Optional[bool]]:
+        """(si el plan tocó la celda, valor de la fila que dejó o None si no dejó fila)."""
+        indice = self._fechas.get(fecha)
+        celda = self._celdas.get(self._clave(aprendiz))
+        if indice is None or celda is None or not celda[0] >> indice & 1:
+            return False, None
+        return True, bool(celda[2] >> indice & 1) if celda[1] >> indice & 1 else None
+
+
+def escribir_bloque(
+    db: Session,
+    profesora_id: int,
+    bloque: List[Registro],
+    contadores: dict,
+    simular: bool = False,
+    huella=None,
+    plan: Optional[PlanImportacion] = None
+):
+    """Upsert de un bloque de registros: una consulta de aprendices y una de asistencias por bloque.
+
+    Solo se escriben las celdas nuevas o cuyo valor cambió, y de ellas solo las
+    marcas de presente y las ausencias fuera de la zona implícita del aprendiz
+    (antes de su fecha_asignacion; ver sesiones.py). Con
+    simular=True no se escribe nada y solo se cuentan las diferencias. Si se pasa
+    `huella` (un hashlib) se le agrega cada cambio, para comparar el plan de una
+    simulación con la importación. Los bloques de un mismo archivo comparten
+    `plan` (ver PlanImportacion).
+    """
+    if plan is None:
+        plan = PlanImportacion()
+    documentos = {r.documento for r in bloque if r.documento}
+    nombres = {r.nombre for r in bloque}
+    condiciones = [Aprendiz.nombre.in_(nombres)]
+    if documentos:
+        condiciones.append(Aprendiz.documento.in_(documentos))
+
+    por_documento = {}
+    por_nombre = {}
+    for aprendiz in db.query(Aprendiz).filter(Aprendiz.profesora_id == profesora_id, or_(*condiciones)):
+        if aprendiz.documento:
+            por_documento.setdefault(aprendiz.documento, aprendiz)
+        por_nombre.setdefault(aprendiz.nombre, aprendiz)
+    # Aprendices que crearon los bloques anteriores (en una simulación no están en la base)
+    for documento in documentos:
+        if documento in plan.por_documento:
+            por_documento.setdefault(documento, plan.por_documento[documento])
+    for nombre in nombres:
+        if nombre in plan.por_nombre:
+            por_nombre.setdefault(nombre, plan.por_nombre[nombre])
+
+    # Buscar o crear aprendices (primero por documento, luego por nombre). Los nuevos
+    # se asignan desde la primera fecha del archivo: sus ausencias quedan implícitas
+    fechas = {fecha for r in bloque for fecha, _ in r.marcas}
+    inicio = min(fechas) if fechas else date.today()
+    aprendices_bloque = []
+    nuevos = []
+    for registro in bloque:
+        aprendiz = por_documento.get(registro.documento) if registro.documento else None
+        if aprendiz is None:
+            aprendiz = por_nombre.get(registro.nombre)
+        if aprendiz is None:
+            aprendiz = Aprendiz(
+                nombre=registro.nombre, documento=registro.documento, profesora_id=profesora_id, fecha_asignacion=inicio
+            )
+            if not simular:
+                db.add(aprendiz)
+            nuevos.append(aprendiz)
+            plan.agregar_aprendiz(aprendiz)
+            por_nombre[registro.nombre] = aprendiz
+            if registro.documento:
+                por_documento[registro.documento] = aprendiz
+        aprendices_bloque.append(aprendiz)
+    if nuevos:
+        if not simular:
+            db.flush()  # Para obtener los IDs
+        contadores["aprendices_creados"] += len(nuevos)
+
+    # Estado actual del bloque: filas guardadas (id y valor) y sesiones ya dictadas.
+    # En el esquema disperso una celda sin fila en una sesión existente desde la
+    # asignación del aprendiz es "ausente".
+    ids = {a.id for a in aprendices_bloque if a.id is not None}
+    existentes = {}
+    if ids:
+        existentes = {
+            (aprendiz_id, fecha): (asistencia_id, presente)
+            for aprendiz_id, fecha, asistencia_id, presente in db.query(
+                Asistencia.aprendiz_id, Asistencia.fecha, Asistencia.id, Asistencia.presente
+            ).filter(Asistencia.aprendiz_id.in_(ids), Asistencia.fecha.in_(fechas))
+        }
+    sesiones_previas = sesiones_existentes(db, profesora_id, fechas) | (plan.sesiones & fechas)
+
+    # Valor final de cada celda: una fila repetida en el archivo gana la última aparición
+    # (la sesión devuelve un único objeto por aprendiz, y los nuevos aún no tienen id
+    # en una simulación: se agrupa por objeto)
+    destino = {}
+    for registro, aprendiz in zip(bloque, aprendices_bloque):
+        for fecha, presente in registro.marcas:
+            destino[(id(aprendiz), fecha)] = (aprendiz, presente)
+
+    nuevas = []
+    a_cambiar = []
+    a_borrar = []
+    retiradas = []
+    for (_, fecha), (aprendiz, presente) in destino.items():
+        actual = existentes.get((aprendiz.id, fecha)) if aprendiz.id is not None else None
+        nuevo = id(aprendiz) in plan.creados
+        implicita = dentro_de_asignacion(aprendiz.fecha_asignacion, fecha)
+        tocada, planeada = plan.fila(aprendiz, fecha) if simular else (False, None)
+        if tocada:
+            valor_actual = planeada
+        elif actual is not None:
+            valor_actual = bool(actual[1])
+        else:
+            valor_actual = None
+        if valor_actual is None and not nuevo and implicita and fecha in sesiones_previas:
+            valor_actual = False
+
+        if valor_actual is None:
+            contadores["asistencias_creadas"] += 1
+        elif valor_actual == presente:
+            contadores["asistencias_sin_cambio"] += 1
+            continue
+        else:
+            contadores["asistencias_actualizadas"] += 1
+        if huella is not None:
+            # Clave estable entre la simulación y la importación: el id de un aprendiz
+            # nuevo solo existe en la segunda
+            huella.update(f"{aprendiz.documento or aprendiz.nombre}|{fecha.isoformat()}|{int(presente)}\n".encode())
+        if simular:
+            # Misma regla que la escritura de abajo: la ausencia implícita no deja fila
+            plan.marcar(aprendiz, fecha, presente if presente or not implicita else None)
+
+        # Dentro de la zona implícita una ausencia borra la marca si había
+        if actual is not None and actual[1] and not presente:
+            retiradas.append((aprendiz.id, fecha))
+        if actual is None:
+            if presente or not implicita:
+                nuevas.append({
+                    "aprendiz_id": aprendiz.id,
+                    "fecha": fecha,
+                    "presente": presente,
+                    "profesora_id": profesora_id
+                })
+        elif not presente and implicita:
+            a_borrar.append(actual[0])
+        else:
+            a_cambiar.append({"id": actual[0], "presente": presente})
+
+    plan.sesiones |= fechas
+    if simular:
+        return
+
+    # Escritura por conjuntos: sesiones, INSERT, UPDATE y DELETE en una sentencia cada uno,
+    # sin instanciar objetos ORM por celda (la memoria no crece con el archivo)
+    registrar_sesiones(db, {(profesora_id, fecha) for fecha in fechas})
+    if nuevas:
+        # Una marca concurrente (toggle, check-in) puede haber creado la celda entre la
+        # lectura y el INSERT: no debe abortar la importación completa
+        db.execute(_insert_ignorando_duplicados(db, Asistencia), nuevas)
+    if a_cambiar:
+        db.execute(update(Asistencia), a_cambiar)
+    if a_borrar:
+        db.execute(
+            delete(Asistencia).where(Asistencia.id.in_(a_borrar)).execution_options(synchronize_session=False)
+        )
+    if retiradas:
+        import checkin  # local: los procesos que solo parsean no lo necesitan
+        checkin.olvidar(retiradas)
+
+
+def _contadores() -> dict:
+    return {
+        "aprendices_creados": 0,
+        "asistencias_creadas": 0,
+        "asistencias_actualizadas": 0,
+        "asistencias_sin_cambio": 0
+    }
+
+
+def importar_hoja(db: Session, profesora_id: int, hoja: HojaAsistencia, simular: bool = False) -> dict:
+    """Alimentar el upsert bloque a bloque (sin commit: lo decide quien llama).
+
+    Devuelve los contadores y "plan_hash", la huella de las celdas a escribir:
+    una simulación y la importación del mismo archivo sobre los mismos datos dan
+    el mismo valor.
+    """
+    contadores = _contadores()
+    huella = hashlib.sha256()
+    plan = PlanImportacion()
+    for bloque in hoja.bloques:
+        escribir_bloque(db, profesora_id, bloque, contadores, simular=simular, huella=huella, plan=plan)
+    contadores["plan_hash"] = huella.hexdigest()
+    return contadores
+
+
+# --- Importación por lotes (varios archivos o un ZIP) ---
+
+class HojaParseada(NamedTuple):
+    """Resultado de parsear un archivo en un proceso del pool (se envía por pickle)."""
+    archivo: str
+    fecha_cols: List[Tuple[int, date]]
+    registros: List[Registro]
+    errores: List[str]
+    error: Optional[str] = None
+
+
+def parsear_archivo(archivo: str, contenido: bytes) -> HojaParseada:
+    """Parsear un archivo completo. Es una función de módulo para poder ejecutarse
+    en un ProcessPoolExecutor: recibe bytes y devuelve solo tuplas serializables."""
+    try:
+        hoja = leer_hoja(io.BytesIO(contenido), archivo)
+        registros = [registro for bloque in hoja.bloques for registro in bloque]
+    except ArchivoInvalido as e:
+        return HojaParseada(archivo, [], [], [], e.detail)
+    except Exception as e:
+        return HojaParseada(archivo, [], [], [], f"Error leyendo archivo: {e}")
+    return HojaParseada(archivo, hoja.fecha_cols, registros, hoja.errores)
+
+
+def importar_registros(db: Session, profesora_id: int, registros: List[Registro], chunk_size: int = IMPORT_CHUNK_ROWS) -> dict:
+    """Escribir registros ya parseados con el mismo upsert por bloques (sin commit)."""
+    contadores = _contadores()
+    huella = hashlib.sha256()
+    plan = PlanImportacion()
+    for inicio in range(0, len(registros), chunk_size):
+        escribir_bloque(db, profesora_id, registros[inicio:inicio + chunk_size], contadores, huella=huella, plan=plan)
+    contadores["plan_hash"] = huella.hexdigest()
+    return contadores
+
+
+_ID_EN_NOMBRE_RE = re.compile(r"^(\d+)[_\- ]")
+
+
+def profesora_de_archivo(nombre: str, mapeo: dict) -> Optional[int]:
+    """profesora_id de un archivo: primero el mapeo explícito (por nombre completo o
+    nombre base), luego la convención "<id>_lista.xlsx" o una carpeta "<id>/" en el ZIP."""
+    base = nombre.replace("\\", "/").rsplit("/", 1)[-1]
+    for clave in (nombre, base):
+        if clave in mapeo:
+            return int(mapeo[clave])
+    match = _ID_EN_NOMBRE_RE.match(base)
+    if match:
+        return int(match.group(1))
+    partes = nombre.replace("\\", "/").split("/")
+    if len(partes) > 1 and partes[-2].isdigit():
+        return int(partes[-2])
+    return None
+
+
+def _leer_archivo(fileobj) -> bytes:
+    fileobj.seek(0)
+    return fileobj.read()
+
+
+def expandir_archivos(archivos: list) -> List[Tuple[str, Callable[[], bytes]]]:
+    """Listar las hojas (.xlsx/.csv) de los archivos recibidos y de sus ZIP, respetando los límites.
+
+    `archivos` son pares (nombre, archivo abierto). Solo se miran tamaños: el de cada
+    archivo y los declarados en el directorio de cada ZIP (un miembro no se descomprime
+    más allá de lo declarado). Cada hoja se lee al llamar a su función, cuando se va a
+    parsear; los ZIP quedan abiertos sobre los archivos recibidos hasta entonces.
+    """
+    resultado = []
+    total = 0
+    for nombre, fileobj in archivos:
+        tamano = _tamano(fileobj)
+        if not nombre.lower().endswith(".zip"):
+            if tamano > IMPORT_MAX_BYTES:
+                raise ArchivoInvalido(f"{nombre}: supera el tamaño máximo permitido", status_code=413)
+            total += tamano
+            resultado.append((nombre, partial(_leer_archivo, fileobj)))
+            continue
+        if tamano > IMPORT_MAX_UNCOMPRESSED_BYTES:
+            raise ArchivoInvalido(f"{nombre}: el ZIP es demasiado grande", status_code=413)
+        try:
+            fileobj.seek(0)
+            zf = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise ArchivoInvalido(f"{nombre}: ZIP inválido ({e})")
+        miembros = [
+            info for info in zf.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith((".xlsx", ".csv"))
+            and not info.filename.rsplit("/", 1)[-1].startswith(("~$", "."))
+            and not info.filename.startswith("__MACOSX/")
+        ]
+        for info in miembros:
+            if info.file_size > IMPORT_MAX_BYTES:
+                raise ArchivoInvalido(f"{info.filename}: supera el tamaño máximo permitido", status_code=413)
+            total += info.file_size
+            resultado.append((info.filename, partial(zf.read, info)))
+    if total > IMPORT_MAX_UNCOMPRESSED_BYTES:
+        raise ArchivoInvalido("El lote descomprimido es demasiado grande", status_code=413)
+    if len(resultado) > IMPORT_MAX_FILES:
+        raise ArchivoInvalido(f"Demasiados archivos en el lote (máximo {IMPORT_MAX_FILES})", status_code=413)
+    return resultado
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # El pool se crea desde un hilo del threadpool, con conexiones de base y hilos
+    # de fondo abiertos: un fork copiaría sockets y candados tomados. forkserver
+    # (spawn donde no existe) arranca los procesos desde un intérprete limpio
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+def process_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool de procesos compartido para parsear (se crea al primer uso)."""
+    global _process_pool
+    if IMPORT_WORKERS <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=_mp_context())
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            return
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
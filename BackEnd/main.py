@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from dotenv import load_dotenv
@@ -7,12 +8,24 @@ from dotenv import load_dotenv
 from database import engine
 from models import Base
 from startup_admin import ensure_admin
+from compresion import CompressionMiddleware
+from idempotencia import IdempotencyMiddleware
+from perfilado import ProfilingMiddleware
+import salud
+import checkin
+import importacion
 
 # Crear las tablas
 Base.metadata.create_all(bind=engine)
 
 # Inicializar FastAPI
-app = FastAPI(title="Sistema de Asistencia TecnoAcademia")
+app = FastAPI(
+    title="Sistema de Asistencia TecnoAcademia",
+    default_response_class=ORJSONResponse
+)
+
+# Reintentos con Idempotency-Key en escrituras de asistencia (el más interno)
+app.add_middleware(IdempotencyMiddleware)
 
 # Configurar CORS
 app.add_middleware(
@@ -23,6 +36,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresión gzip/br/zstd de respuestas JSON y CSV
+app.add_middleware(CompressionMiddleware)
+
+# Perfilado bajo demanda (X-Profile: 1 con token de admin, o PROFILE_SAMPLE_RATE); el más externo
+app.add_middleware(ProfilingMiddleware)
+
 # Incluir todos los routers
 from routers.asistencia import router as asistencia_router
 from routers.aprendices import router as aprendices_router
@@ -30,6 +49,7 @@ from routers.profesoras import router as profesoras_admin_router
 from routers.clases import router as clases_router
 from routers.profesoras_general import router as profesoras_general_router
 from routers.estadisticas import router as estadisticas_router
+from routers.batch import router as batch_router
 
 # Registrar routers
 app.include_router(asistencia_router)
@@ -38,6 +58,19 @@ app.include_router(profesoras_admin_router)
 app.include_router(clases_router)
 app.include_router(profesoras_general_router)
 app.include_router(estadisticas_router)
+app.include_router(batch_router)
+
+# Verificación de salud en segundo plano (los probes leen el resultado cacheado)
+@app.on_event("startup")
+def iniciar_verificacion_salud():
+    salud.start()
+    checkin.start()
+
+@app.on_event("shutdown")
+def detener_tareas_de_fondo():
+    salud.stop()
+    checkin.stop()
+    importacion.shutdown_process_pool()
 
 if __name__ == "__main__":
     ensure_admin()
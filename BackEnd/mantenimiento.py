@@ -0,0 +1,194 @@
+"""Tareas de mantenimiento de la base de datos.
+
+Uso (desde BackEnd/):
+    python mantenimiento.py compactar [--optimizar]
+    python mantenimiento.py particionar --desde 2020 --hasta 2030 [--imprimir]
+    python mantenimiento.py archivar 2023
+    python mantenimiento.py archivos
+    python mantenimiento.py indices
+    python mantenimiento.py columnas
+
+compactar: pasa la asistencia al esquema disperso. Agrega las columnas que falten,
+completa la fecha de asignación de los aprendices, crea el calendario de sesiones
+a partir de las filas existentes y borra las filas de ausencia que pasan a ser
+implícitas. Es idempotente y se puede repetir sin riesgo.
+
+particionar: (opcional, solo MySQL) particiona asistencias por año escolar.
+archivar: exporta un año escolar cerrado a Parquet y lo borra de la base.
+indices: crea en tablas existentes los índices declarados en models.py que falten
+(create_all solo los crea junto con tablas nuevas).
+columnas: agrega a tablas existentes las columnas nullable de models.py que falten
+(p.ej. aprendices.fecha_asignacion) y completa la fecha de asignación.
+"""
+import argparse
+import sys
+from datetime import date
+
+from sqlalchemy import inspect, text
+
+from database import SessionLocal, create_tables, engine, test_connection
+from models import Base
+import archivado
+import sesiones
+
+
+def compactar(optimizar: bool = False) -> bool:
+    if not test_connection():
+        print("❌ No se pudo conectar a la base de datos")
+        return False
+    create_tables()  # Crea la tabla sesiones si aún no existe
+    if not agregar_columnas():
+        return False
+
+    db = SessionLocal()
+    try:
+        resultado = sesiones.compactar(db)
+        print(f"✅ Aprendices con fecha de asignación: {resultado['aprendices_asignados']}")
+        print(f"✅ Sesiones creadas: {resultado['sesiones_creadas']}")
+        print(f"✅ Filas de ausencia borradas: {resultado['ausencias_borradas']}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error compactando asistencias: {e}")
+        return False
+    finally:
+        db.close()
+
+    if optimizar and engine.dialect.name == "mysql":
+        # Recupera el espacio de la tabla y reconstruye sus índices
+        with engine.connect() as connection:
+            connection.execute(text("OPTIMIZE TABLE asistencias"))
+        print("✅ Tabla asistencias optimizada")
+    return True
+
+
+def particionar(desde_anio: int, hasta_anio: int, imprimir: bool = False) -> bool:
+    sentencias = archivado.ddl_particiones(desde_anio, hasta_anio)
+    if engine.dialect.name != "mysql":
+        print("❌ El particionado solo aplica a MySQL")
+        imprimir = True
+    else:
+        db = SessionLocal()
+        try:
+            sentencias = [
+                f"ALTER TABLE asistencias DROP FOREIGN KEY {fk}" for fk in archivado.claves_foraneas_asistencias(db)
+            ] + sentencias
+        finally:
+            db.close()
+
+    if imprimir:
+        for sentencia in sentencias:
+            print(sentencia + ";")
+        return engine.dialect.name == "mysql"
+
+    with engine.begin() as connection:
+        for sentencia in sentencias:
+            print(f"⏳ {sentencia.splitlines()[0]}")
+            connection.execute(text(sentencia))
+    print("✅ Tabla asistencias particionada")
+    return True
+
+
+def archivar(anio: int) -> bool:
+    db = SessionLocal()
+    try:
+        entrada = archivado.archivar(db, anio)
+        print(f"✅ Año escolar {anio} archivado en {entrada['archivo']}: "
+              f"{entrada['filas']} filas, {entrada['bytes']} bytes")
+        return True
+    except (ValueError, RuntimeError) as e:
+        db.rollback()
+        print(f"❌ {e}")
+        return False
+    finally:
+        db.close()
+
+
+def listar_archivos() -> bool:
+    anios = archivado.leer_manifest()["anios"]
+    if not anios:
+        print("No hay años archivados")
+    for anio, entrada in sorted(anios.items()):
+        print(f"{anio}: {entrada['archivo']} ({entrada['desde']} a {entrada['hasta']}), "
+              f"{entrada['filas']} filas, {entrada['bytes']} bytes, creado {entrada['creado']}")
+    return True
+
+
+def crear_indices() -> bool:
+    if not test_connection():
+        print("❌ No se pudo conectar a la base de datos")
+        return False
+    existentes = set()
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        for tabla in Base.metadata.sorted_tables:
+            if inspector.has_table(tabla.name):
+                existentes |= {(tabla.name, i["name"]) for i in inspector.get_indexes(tabla.name)}
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            if (tabla.name, indice.name) in existentes:
+                continue
+            indice.create(engine)
+            print(f"✅ Índice {indice.name} creado en {tabla.name}")
+    return True
+
+
+
+def agregar_columnas() -> bool:
+    if not test_connection():
+        print("❌ No se pudo conectar a la base de datos")
+        return False
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for tabla in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in existentes or not columna.nullable:
+                    continue
+                tipo = columna.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo} NULL"))
+                print(f"✅ Columna {columna.name} agregada en {tabla.name}")
+    return True
+
+
+def columnas() -> bool:
+    if not agregar_columnas():
+        return False
+    db = SessionLocal()
+    try:
+        print(f"✅ Aprendices con fecha de asignación: {sesiones.asignar_fechas(db)}")
+    finally:
+        db.close()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    parser_compactar = subparsers.add_parser("compactar", help="Migrar la asistencia al esquema disperso")
+    parser_compactar.add_argument("--optimizar", action="store_true", help="Ejecutar OPTIMIZE TABLE (MySQL)")
+    parser_particionar = subparsers.add_parser("particionar", help="Particionar asistencias por año escolar (MySQL)")
+    parser_particionar.add_argument("--desde", type=int, default=date.today().year - 5)
+    parser_particionar.add_argument("--hasta", type=int, default=date.today().year + 5)
+    parser_particionar.add_argument("--imprimir", action="store_true", help="Solo mostrar el DDL")
+    parser_archivar = subparsers.add_parser("archivar", help="Archivar un año escolar cerrado en Parquet")
+    parser_archivar.add_argument("anio", type=int)
+    subparsers.add_parser("archivos", help="Listar los años archivados")
+    subparsers.add_parser("indices", help="Crear los índices que falten en tablas existentes")
+    subparsers.add_parser("columnas", help="Agregar las columnas que falten en tablas existentes")
+    args = parser.parse_args()
+
+    if args.comando == "compactar":
+        ok = compactar(args.optimizar)
+    elif args.comando == "particionar":
+        ok = particionar(args.desde, args.hasta, args.imprimir)
+    elif args.comando == "archivar":
+        ok = archivar(args.anio)
+    elif args.comando == "indices":
+        ok = crear_indices()
+    elif args.comando == "columnas":
+        ok = columnas()
+    else:
+        ok = listar_archivos()
+    sys.exit(0 if ok else 1)
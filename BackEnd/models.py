@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Date, Integer, String, DateTime, Boolean, Text, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Date, Integer, String, DateTime, Boolean, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.orm import backref, relationship
+from datetime import date, datetime
 
 
 
@@ -18,16 +18,18 @@ class Profesora(Base):
     especialidad = Column(String(100), nullable=False)
     fecha_registro = Column(DateTime, default=datetime.utcnow)
     activa = Column(Boolean, default=True)
+    # Generación del token del feed .ics: al incrementarla se revocan las URLs emitidas
+    feed_generacion = Column(Integer, nullable=True, default=0)
     
-    # Relaciones
-    asistencias = relationship("Asistencia", back_populates="profesora")
-    clases = relationship("Clase", back_populates="profesora")
+    # Relaciones (el borrado de los hijos lo hace la base con ON DELETE, sin cargarlos)
+    asistencias = relationship("Asistencia", back_populates="profesora", passive_deletes=True)
+    clases = relationship("Clase", back_populates="profesora", cascade="all, delete-orphan", passive_deletes=True)
 
 class Clase(Base):
     __tablename__ = "clases"
     
     id = Column(Integer, primary_key=True, index=True)
-    profesora_id = Column(Integer, ForeignKey("profesoras.id"), nullable=False)
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="CASCADE"), nullable=False)
     titulo = Column(String(200), nullable=False)
     fecha_inicio = Column(DateTime, nullable=False)
     fecha_fin = Column(DateTime, nullable=False)
@@ -39,27 +41,115 @@ class Clase(Base):
     # Relaciones
     profesora = relationship("Profesora", back_populates="clases")
     
+    # Rangos de fechas por profesora (calendario, feed .ics)
+    __table_args__ = (Index('ix_clases_profesora_fecha', 'profesora_id', 'fecha_inicio'),)
+
+
+class SerieClase(Base):
+    """Clase que se repite según una regla RRULE (RFC 5545), p. ej. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20270615.
+
+    Las ocurrencias no se guardan: se calculan al consultar, solo para la ventana
+    pedida (recurrencia.py). `hasta` es el inicio de la última ocurrencia y se
+    recalcula al guardar la regla; los cambios puntuales van en ExcepcionSerie.
+    """
+    __tablename__ = "series_clases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="CASCADE"), nullable=False)
+    titulo = Column(String(200), nullable=False)
+    ubicacion = Column(String(100), nullable=False)
+    descripcion = Column(Text, nullable=True)
+    inicio = Column(DateTime, nullable=False)  # inicio de la primera ocurrencia (DTSTART)
+    duracion_minutos = Column(Integer, nullable=False)
+    regla = Column(String(255), nullable=False)
+    hasta = Column(DateTime, nullable=False)
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    activa = Column(Boolean, default=True)
+
+    profesora = relationship("Profesora")
+
+    __table_args__ = (Index('ix_series_profesora_rango', 'profesora_id', 'inicio', 'hasta'),)
+
+class ExcepcionSerie(Base):
+    """Ocurrencia de una serie cancelada o modificada (hora, título, lugar).
+
+    `ocurrencia` es el inicio original que genera la regla; los campos en NULL
+    conservan el valor de la serie.
+    """
+    __tablename__ = "excepciones_serie"
+
+    id = Column(Integer, primary_key=True, index=True)
+    serie_id = Column(Integer, ForeignKey("series_clases.id", ondelete="CASCADE"), nullable=False)
+    ocurrencia = Column(DateTime, nullable=False)
+    cancelada = Column(Boolean, default=False, nullable=False)
+    titulo = Column(String(200), nullable=True)
+    ubicacion = Column(String(100), nullable=True)
+    descripcion = Column(Text, nullable=True)
+    fecha_inicio = Column(DateTime, nullable=True)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('serie_id', 'ocurrencia', name='_serie_ocurrencia_uc'),
+        Index('ix_excepciones_fecha_inicio', 'fecha_inicio'),
+    )
+    
     
 
 class Aprendiz(Base):
     __tablename__ = "aprendices"
     id = Column(Integer, primary_key=True, index=True)
-    lista_id = Column(Integer, ForeignKey("clases.id"), nullable=True)  # opcional link a clase si prefieres
+    lista_id = Column(Integer, ForeignKey("clases.id", ondelete="SET NULL"), nullable=True)  # opcional link a clase si prefieres
     nombre = Column(String(200), nullable=False)
     documento = Column(String(50), nullable=True)
-    profesora_id = Column(Integer, ForeignKey("profesoras.id"), nullable=False)
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="CASCADE"), nullable=False)
+    # Desde cuándo cuenta en las sesiones de su profesora actual (ingreso o última
+    # reasignación); NULL en aprendices anteriores: todas las sesiones
+    fecha_asignacion = Column(Date, nullable=True, default=date.today)
 
-    profesora = relationship("Profesora", backref="aprendices")
-    asistencias = relationship("Asistencia", back_populates="aprendiz", cascade="all, delete-orphan")
+    profesora = relationship(
+        "Profesora",
+        backref=backref("aprendices", cascade="all, delete-orphan", passive_deletes=True)
+    )
+    asistencias = relationship(
+        "Asistencia", back_populates="aprendiz", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 class Asistencia(Base):
     __tablename__ = "asistencias"
     id = Column(Integer, primary_key=True, index=True)
-    aprendiz_id = Column(Integer, ForeignKey("aprendices.id"), nullable=False)
+    aprendiz_id = Column(Integer, ForeignKey("aprendices.id", ondelete="CASCADE"), nullable=False)
     fecha = Column(Date, nullable=False)
     presente = Column(Boolean, default=False)
-    profesora_id = Column(Integer, ForeignKey("profesoras.id"))
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="SET NULL"))
 
     aprendiz = relationship("Aprendiz", back_populates="asistencias")
     profesora = relationship("Profesora", back_populates="asistencias")
-    __table_args__ = (UniqueConstraint('aprendiz_id', 'fecha', name='_aprendiz_fecha_uc'),)
\ No newline at end of file
+    __table_args__ = (UniqueConstraint('aprendiz_id', 'fecha', name='_aprendiz_fecha_uc'),)
+class Sesion(Base):
+    """Día de clase dictado por una profesora (calendario de sesiones).
+
+    La asistencia se guarda dispersa: en `asistencias` solo quedan las marcas de
+    presente; cualquier aprendiz de la profesora sin marca en una sesión está ausente.
+    """
+    __tablename__ = "sesiones"
+    id = Column(Integer, primary_key=True, index=True)
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="CASCADE"), nullable=False)
+    fecha = Column(Date, nullable=False)
+
+    __table_args__ = (UniqueConstraint('profesora_id', 'fecha', name='_profesora_fecha_uc'),)
+
+class RefreshToken(Base):
+    """Refresh token opaco (solo se guarda su SHA-256).
+
+    Cada uso lo rota: la fila queda marcada como usada y se emite otra de la misma
+    familia. Presentar un token ya usado revoca toda la familia (posible robo).
+    """
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    profesora_id = Column(Integer, ForeignKey("profesoras.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    familia = Column(String(32), index=True, nullable=False)
+    creado = Column(DateTime, default=datetime.utcnow)
+    expira = Column(DateTime, nullable=False)
+    usado = Column(DateTime, nullable=True)
+    revocado = Column(Boolean, default=False, nullable=False)
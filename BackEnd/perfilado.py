@@ -0,0 +1,268 @@
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+# Perfilado bajo demanda de peticiones individuales.
+#
+# Se activa con el encabezado X-Profile: 1 (solo con un token de admin) o al azar
+# con PROFILE_SAMPLE_RATE. Mientras dura la petición un hilo toma muestras de las
+# pilas de los hilos que la atienden: el del event loop y los del threadpool que
+# estén ejecutando con el contexto de esta petición (endpoints y dependencias
+# síncronas; cProfile o un perfilador atado al hilo que lo inicia solo verían el
+# primero). Los demás workers del threadpool, ocupados con otras peticiones, no
+# entran. El resultado se guarda en formato "folded" (una pila por línea con su
+# número de muestras), que abren speedscope o flamegraph.pl, junto a un .json con
+# los datos de la petición.
+
+# Configuración desde .env
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "20"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfiles"))
+
+PROFILE_HEADER = "x-profile"
+
+# Hojas de pila de hilos que están esperando (no consumen CPU ni explican latencia propia)
+_ESPERAS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_base.py", "select"),
+}
+
+_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{12}_[0-9a-f]{4}$")
+
+# Una captura a la vez: el hilo del event loop es compartido por todas las peticiones
+_captura = threading.Lock()
+_indice_lock = threading.Lock()
+
+# Marca de la petición perfilada. anyio ejecuta cada llamada al threadpool con una
+# copia del contexto, así que la marca viaja con el trabajo de esta petición
+_peticion = contextvars.ContextVar("perfilado_peticion", default=None)
+
+
+def _contexto_del_hilo(frame) -> Optional[contextvars.Context]:
+    """Contexto con que un worker de anyio ejecuta su trabajo actual (local `context` de su bucle)."""
+    while frame is not None:
+        codigo = frame.f_code
+        if codigo.co_name == "run" and "context" in codigo.co_varnames and "anyio" in codigo.co_filename:
+            contexto = frame.f_locals.get("context")
+            return contexto if isinstance(contexto, contextvars.Context) else None
+        frame = frame.f_back
+    return None
+
+
+class _Muestreador(threading.Thread):
+    def __init__(self, intervalo: float, hilo_loop: int, marca: object):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.intervalo = intervalo
+        self.hilo_loop = hilo_loop
+        self.marca = marca
+        self.pilas = Counter()
+        self.muestras = 0
+        self._parar = threading.Event()
+
+    def _atiende(self, tid: int, frame) -> bool:
+        if tid == self.hilo_loop:
+            return True
+        contexto = _contexto_del_hilo(frame)
+        return contexto is not None and contexto.get(_peticion) is self.marca
+
+    def run(self):
+        while True:
+            nombres = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if not self._atiende(tid, frame):
+                    continue
+                codigo = frame.f_code
+                if (os.path.basename(codigo.co_filename), codigo.co_name) in _ESPERAS:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                pila.append(nombres.get(tid, str(tid)))
+                self.pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+            if self._parar.wait(self.intervalo):
+                break
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+
+
+def _guardar(metadatos: dict, pilas: Counter):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, metadatos["id"])
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for pila, cuenta in pilas.most_common():
+            f.write(f"{pila} {cuenta}\n")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(metadatos, f, ensure_ascii=False)
+
+    # Anillo acotado: se borran las capturas más antiguas
+    with _indice_lock:
+        ids = sorted(n[:-5] for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+        for viejo in ids[:-PROFILE_MAX_CAPTURES] if PROFILE_MAX_CAPTURES > 0 else ids:
+            for extension in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, viejo + extension))
+                except FileNotFoundError:
+                    pass
+
+
+def listar() -> List[dict]:
+    """Capturas guardadas, la más reciente primero."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    capturas = []
+    for nombre in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not nombre.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, nombre), encoding="utf-8") as f:
+                capturas.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return capturas
+
+
+def ruta_captura(captura_id: str) -> Optional[str]:
+    if not _ID_RE.match(captura_id):
+        return None
+    ruta = os.path.join(PROFILE_DIR, captura_id + ".folded")
+    return ruta if os.path.exists(ruta) else None
+
+
+def resumen(captura_id: str, limite: int = 25) -> Optional[dict]:
+    """Funciones con más muestras propias (hoja de la pila) y acumuladas."""
+    ruta = ruta_captura(captura_id)
+    if ruta is None:
+        return None
+    propias, acumuladas = Counter(), Counter()
+    total = 0
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            pila, _, cuenta = linea.rstrip("\n").rpartition(" ")
+            cuenta = int(cuenta)
+            marcos = pila.split(";")[1:]
+            total += cuenta
+            if marcos:
+                propias[marcos[-1]] += cuenta
+            for marco in set(marcos):
+                acumuladas[marco] += cuenta
+    return {
+        "id": captura_id,
+        "muestras": total,
+        "propias": [{"funcion": k, "muestras": v} for k, v in propias.most_common(limite)],
+        "acumuladas": [{"funcion": k, "muestras": v} for k, v in acumuladas.most_common(limite)],
+    }
+
+
+def _es_admin(authorization: str) -> bool:
+    # Imports locales: solo se pagan cuando alguien pide un perfil
+    from auth import _leer_token, _principal
+    from database import SessionLocal
+
+    esquema, _, token = authorization.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return False
+    try:
+        email, profesora_id = _leer_token(token)
+    except Exception:
+        return False
+    if profesora_id is None:
+        return False  # token anterior sin id: basta con volver a iniciar sesión
+    # La misma profesora en caché que get_current_user: la sesión solo toma una
+    # conexión si la entrada venció
+    db = SessionLocal()
+    try:
+        user = _principal(db, email, profesora_id)
+    finally:
+        db.close()
+    return bool(user is not None and user.activa and user.is_admin)
+
+
+class ProfilingMiddleware:
+    """Perfila la petición si trae X-Profile (admin) o cae en la muestra aleatoria.
+
+    Sin el encabezado y con PROFILE_SAMPLE_RATE en 0 la petición pasa directo.
+    La respuesta perfilada lleva X-Profile-Id con el id de la captura.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        pedido = any(nombre == b"x-profile" for nombre, _ in scope["headers"])
+        if not pedido and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        if pedido:
+            headers = Headers(scope=scope)
+            if headers.get(PROFILE_HEADER) != "1" or not await run_in_threadpool(
+                _es_admin, headers.get("authorization", "")
+            ):
+                await self.app(scope, receive, send)
+                return
+
+        if not _captura.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        # Id ordenable por fecha (el anillo borra por orden de nombre)
+        captura_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{os.urandom(2).hex()}"
+        estado = {"status": None}
+
+        async def send_con_id(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", captura_id)
+            await send(message)
+
+        marca = object()
+        muestreador = _Muestreador(PROFILE_INTERVAL_MS / 1000, threading.get_ident(), marca)
+        token = _peticion.set(marca)
+        inicio = time.perf_counter()
+        muestreador.start()
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            muestreador.detener()
+            _peticion.reset(token)
+            duracion = time.perf_counter() - inicio
+            _captura.release()
+            metadatos = {
+                "id": captura_id,
+                "metodo": scope["method"],
+                "ruta": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": estado["status"],
+                "duracion_ms": round(duracion * 1000, 3),
+                "muestras": muestreador.muestras,
+                "intervalo_ms": PROFILE_INTERVAL_MS,
+                "origen": "encabezado" if pedido else "muestreo",
+                "creado": datetime.now().isoformat(timespec="seconds"),
+            }
+            await run_in_threadpool(_guardar, metadatos, muestreador.pilas)
@@ -0,0 +1,120 @@
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Query, status
+
+# Campos dispersos en los listados: ?fields=id,titulo&include=profesora
+#
+# `fields` elige las columnas propias del recurso; `profesora.nombre` dentro de
+# `fields` elige también columnas de una relación (y la incluye). `include` añade
+# una relación con sus campos por defecto. Solo las columnas pedidas entran en el
+# SELECT y solo las relaciones incluidas generan un JOIN. Sin ninguno de los dos
+# parámetros los endpoints responden exactamente como antes.
+
+
+class Relacion:
+    def __init__(self, modelo, condicion, columnas: Dict[str, object], por_defecto: Optional[List[str]] = None):
+        self.modelo = modelo
+        self.condicion = condicion
+        self.columnas = columnas
+        self.por_defecto = por_defecto or list(columnas)
+
+
+class Recurso:
+    def __init__(self, columnas: Dict[str, object], relaciones: Optional[Dict[str, Relacion]] = None):
+        self.columnas = columnas
+        self.relaciones = relaciones or {}
+
+
+class Proyeccion:
+    """Columnas propias pedidas y relaciones incluidas con sus columnas."""
+
+    def __init__(self, campos: List[str], incluir: Dict[str, List[str]]):
+        self.campos = campos
+        self.incluir = incluir
+
+
+def _lista(valor: Optional[str]) -> List[str]:
+    return [v.strip() for v in (valor or "").split(",") if v.strip()]
+
+
+def _desconocido(tipo: str, nombre: str, disponibles):
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"{tipo} desconocido: {nombre}. Disponibles: {', '.join(disponibles)}"
+    )
+
+
+def parsear(recurso: Recurso, fields: Optional[str], include: Optional[str]) -> Optional[Proyeccion]:
+    if fields is None and include is None:
+        return None
+    campos, incluir = [], {}
+    for nombre in _lista(fields):
+        relacion, _, subcampo = nombre.partition(".")
+        if subcampo:
+            if relacion not in recurso.relaciones:
+                _desconocido("Relación", relacion, recurso.relaciones)
+            if subcampo not in recurso.relaciones[relacion].columnas:
+                _desconocido("Campo", nombre, recurso.relaciones[relacion].columnas)
+            incluir.setdefault(relacion, [])
+            if subcampo not in incluir[relacion]:
+                incluir[relacion].append(subcampo)
+        elif nombre not in recurso.columnas:
+            _desconocido("Campo", nombre, recurso.columnas)
+        elif nombre not in campos:
+            campos.append(nombre)
+    for relacion in _lista(include):
+        if relacion not in recurso.relaciones:
+            _desconocido("Relación", relacion, recurso.relaciones)
+        if not incluir.get(relacion):
+            incluir[relacion] = list(recurso.relaciones[relacion].por_defecto)
+    # Solo include=: columnas propias completas más la relación
+    if fields is None:
+        campos = list(recurso.columnas)
+    if not campos and not incluir:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pide al menos un campo")
+    return Proyeccion(campos, incluir)
+
+
+def dependencia(recurso: Recurso):
+    """Dependencia que lee ?fields= e ?include= (None si no se pidió ninguno)."""
+    def leer(
+        fields: Optional[str] = Query(None, description="Campos separados por coma; relacion.campo para relaciones"),
+        include: Optional[str] = Query(None, description="Relaciones a incluir, separadas por coma")
+    ) -> Optional[Proyeccion]:
+        return parsear(recurso, fields, include)
+    return leer
+
+
+def aplicar(query, recurso: Recurso, proyeccion: Proyeccion):
+    """Reducir un Query ORM a las columnas pedidas, con un OUTER JOIN por relación incluida."""
+    columnas = [recurso.columnas[c].label(c) for c in proyeccion.campos]
+    for nombre, subcampos in proyeccion.incluir.items():
+        relacion = recurso.relaciones[nombre]
+        query = query.outerjoin(relacion.modelo, relacion.condicion)
+        columnas.extend(relacion.columnas[c].label(f"{nombre}__{c}") for c in subcampos)
+    return query.with_entities(*columnas)
+
+
+def serializar(filas, proyeccion: Proyeccion) -> List[dict]:
+    """Filas de `aplicar` a dicts, anidando cada relación (None si el JOIN no encontró fila)."""
+    resultado = []
+    for fila in filas:
+        datos = fila._mapping
+        item = {c: datos[c] for c in proyeccion.campos}
+        for nombre, subcampos in proyeccion.incluir.items():
+            anidado = {c: datos[f"{nombre}__{c}"] for c in subcampos}
+            item[nombre] = anidado if any(v is not None for v in anidado.values()) else None
+        resultado.append(item)
+    return resultado
+
+
+def proyectar(items: List[dict], proyeccion: Proyeccion) -> List[dict]:
+    """Como `serializar`, para dicts ya armados que traen cada relación como dict anidado."""
+    resultado = []
+    for datos in items:
+        item = {c: datos[c] for c in proyeccion.campos}
+        for nombre, subcampos in proyeccion.incluir.items():
+            relacion = datos.get(nombre)
+            item[nombre] = {c: relacion[c] for c in subcampos} if relacion is not None else None
+        resultado.append(item)
+    return resultado
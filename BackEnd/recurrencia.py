@@ -0,0 +1,212 @@
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from dateutil.rrule import rrulestr
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from cache import CacheLocal, cache
+from models import ExcepcionSerie, Profesora, SerieClase
+
+# Series de clases recurrentes.
+#
+# Una serie guarda una regla RRULE en lugar de una fila por sesión. Las
+# ocurrencias se expanden al consultar y solo para los meses que cubre la ventana
+# pedida; cada mes expandido (por profesora, o "todas" para el admin) queda en
+# memoria del worker, validado contra la etiqueta compartida "series:<alcance>",
+# hasta que una escritura sobre las series de esa profesora (en cualquier worker)
+# la invalida.
+# Editar o cancelar la serie completa es un único UPDATE de su fila.
+
+# Configuración desde .env
+SERIES_TIMEZONE = os.getenv("SERIES_TIMEZONE", "America/Bogota")  # zona de las fechas guardadas
+SERIES_MAX_OCCURRENCES = int(os.getenv("SERIES_MAX_OCCURRENCES", "400"))
+SERIES_CACHE_MAX_MONTHS = int(os.getenv("SERIES_CACHE_MAX_MONTHS", "2000"))
+
+TODAS = "todas"
+_UNTIL_FECHA = re.compile(r"(UNTIL=\d{8})(?=;|$)", re.IGNORECASE)
+
+_meses = CacheLocal(SERIES_CACHE_MAX_MONTHS)  # (alcance, anio, mes) o (alcance, "rango") -> valor
+
+
+class ReglaInvalida(ValueError):
+    """Regla RRULE que no se puede interpretar o que no termina."""
+
+
+def _alcance(profesora_id: Optional[int]) -> str:
+    return TODAS if profesora_id is None else str(profesora_id)
+
+
+def invalidar(*profesora_ids):
+    """Descartar los meses expandidos de las profesoras afectadas y el general."""
+    alcances = {TODAS} | {str(pid) for pid in profesora_ids if pid is not None}
+    cache().invalidar(*[f"series:{alcance}" for alcance in alcances])
+
+
+def normalizar_regla(regla: str, inicio: datetime) -> Tuple[str, datetime]:
+    """(regla normalizada, inicio de la última ocurrencia).
+
+    La regla debe terminar (COUNT o UNTIL) y no superar SERIES_MAX_OCCURRENCES.
+    Un UNTIL de solo fecha incluye ese día completo.
+    """
+    texto = regla.strip()
+    if texto.upper().startswith("RRULE:"):
+        texto = texto[len("RRULE:"):]
+    texto = _UNTIL_FECHA.sub(r"\1T235959", texto.upper())
+    if "COUNT=" not in texto and "UNTIL=" not in texto:
+        raise ReglaInvalida("La regla debe terminar: usa COUNT o UNTIL")
+    try:
+        ocurrencias = rrulestr(texto, dtstart=inicio)
+    except (ValueError, TypeError) as e:
+        raise ReglaInvalida(f"Regla inválida: {e}")
+    ultima = None
+    for i, ocurrencia in enumerate(ocurrencias):
+        if i >= SERIES_MAX_OCCURRENCES:
+            raise ReglaInvalida(f"La serie supera {SERIES_MAX_OCCURRENCES} ocurrencias")
+        ultima = ocurrencia
+    if ultima is None:
+        raise ReglaInvalida("La regla no genera ninguna ocurrencia")
+    return texto, ultima
+
+
+def local(fecha: Optional[datetime]) -> Optional[datetime]:
+    """Fecha sin zona en la hora local de las clases (como se guardan)."""
+    if fecha is None or fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone(pytz.timezone(SERIES_TIMEZONE)).replace(tzinfo=None)
+
+
+def _siguiente_mes(anio: int, mes: int) -> Tuple[int, int]:
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def _ocurrencia(serie, profesora, ocurrencia: datetime, excepcion) -> dict:
+    inicio = ocurrencia
+    fin = ocurrencia + timedelta(minutes=serie.duracion_minutos)
+    titulo, ubicacion, descripcion, activa = serie.titulo, serie.ubicacion, serie.descripcion, serie.activa
+    if excepcion is not None:
+        inicio = excepcion.fecha_inicio or inicio
+        fin = excepcion.fecha_fin or (inicio + timedelta(minutes=serie.duracion_minutos))
+        titulo = excepcion.titulo or titulo
+        ubicacion = excepcion.ubicacion or ubicacion
+        descripcion = excepcion.descripcion if excepcion.descripcion is not None else descripcion
+        activa = activa and not excepcion.cancelada
+    return {
+        "id": None,
+        "serie_id": serie.id,
+        "ocurrencia": ocurrencia,
+        "profesora_id": serie.profesora_id,
+        "titulo": titulo,
+        "fecha_inicio": inicio,
+        "fecha_fin": fin,
+        "ubicacion": ubicacion,
+        "descripcion": descripcion,
+        "activa": bool(activa),
+        "profesora": profesora,
+    }
+
+
+def _expandir_mes(db: Session, alcance: str, anio: int, mes: int) -> List[dict]:
+    """Ocurrencias que empiezan en el mes (incluidas las movidas a él por una excepción)."""
+    desde = datetime(anio, mes, 1)
+    hasta = datetime(*_siguiente_mes(anio, mes), 1)
+
+    movidas = select(ExcepcionSerie.serie_id).where(
+        ExcepcionSerie.fecha_inicio >= desde, ExcepcionSerie.fecha_inicio < hasta
+    )
+    query = db.query(SerieClase, Profesora).join(Profesora, Profesora.id == SerieClase.profesora_id).filter(
+        or_(and_(SerieClase.inicio < hasta, SerieClase.hasta >= desde), SerieClase.id.in_(movidas))
+    )
+    if alcance != TODAS:
+        query = query.filter(SerieClase.profesora_id == int(alcance))
+    series = query.all()
+    if not series:
+        return []
+
+    excepciones: Dict[int, Dict[datetime, ExcepcionSerie]] = {}
+    for excepcion in db.query(ExcepcionSerie).filter(
+        ExcepcionSerie.serie_id.in_([serie.id for serie, _ in series]),
+        or_(
+            and_(ExcepcionSerie.ocurrencia >= desde, ExcepcionSerie.ocurrencia < hasta),
+            and_(ExcepcionSerie.fecha_inicio >= desde, ExcepcionSerie.fecha_inicio < hasta),
+        )
+    ):
+        excepciones.setdefault(excepcion.serie_id, {})[excepcion.ocurrencia] = excepcion
+
+    resultado = []
+    for serie, p in series:
+        profesora = {
+            "id": p.id, "nombre": p.nombre, "email": p.email, "especialidad": p.especialidad,
+            "is_admin": p.is_admin, "activa": p.activa,
+        }
+        propias = excepciones.get(serie.id, {})
+        regla = rrulestr(serie.regla, dtstart=serie.inicio)
+        for ocurrencia in regla.between(desde, hasta, inc=True):
+            if ocurrencia >= hasta:
+                continue
+            excepcion = propias.pop(ocurrencia, None)
+            item = _ocurrencia(serie, profesora, ocurrencia, excepcion)
+            if desde <= item["fecha_inicio"] < hasta:  # las movidas a otro mes salen en ese mes
+                resultado.append(item)
+        # Ocurrencias de otros meses movidas a este (solo si la regla realmente las genera)
+        for ocurrencia, excepcion in propias.items():
+            if excepcion.fecha_inicio is not None and desde <= excepcion.fecha_inicio < hasta \
+                    and regla.after(ocurrencia, inc=True) == ocurrencia:
+                resultado.append(_ocurrencia(serie, profesora, ocurrencia, excepcion))
+    resultado.sort(key=lambda item: item["fecha_inicio"])
+    return resultado
+
+
+def _rango(db: Session, alcance: str) -> Optional[Tuple[datetime, datetime]]:
+    """Primer y último inicio posibles entre las series del alcance (con excepciones movidas)."""
+    series = db.query(func.min(SerieClase.inicio), func.max(SerieClase.hasta))
+    movidas = db.query(func.min(ExcepcionSerie.fecha_inicio), func.max(ExcepcionSerie.fecha_inicio)).join(
+        SerieClase, SerieClase.id == ExcepcionSerie.serie_id
+    )
+    if alcance != TODAS:
+        series = series.filter(SerieClase.profesora_id == int(alcance))
+        movidas = movidas.filter(SerieClase.profesora_id == int(alcance))
+    limites = [f for f in (*series.one(), *movidas.one()) if f is not None]
+    return (min(limites), max(limites)) if limites else None
+
+
+def _en_cache(clave: tuple, calcular):
+    return _meses.obtener(clave, [f"series:{clave[0]}"], calcular)
+
+
+def ocurrencias(
+    db: Session,
+    profesora_id: Optional[int],
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+) -> List[dict]:
+    """Ocurrencias con fecha_inicio en [desde, hasta], ordenadas (sin límites: todas).
+
+    Las canceladas se devuelven con activa=False, como una Clase cancelada.
+    """
+    alcance = _alcance(profesora_id)
+    rango = _en_cache((alcance, "rango"), lambda: _rango(db, alcance))
+    if rango is None:
+        return []
+    desde = max(local(desde) or rango[0], rango[0])
+    hasta = min(local(hasta) or rango[1], rango[1])
+    if desde > hasta:
+        return []
+
+    resultado = []
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        for item in _en_cache((alcance, anio, mes), lambda: _expandir_mes(db, alcance, anio, mes)):
+            if desde <= item["fecha_inicio"] <= hasta:
+                resultado.append(item)
+        anio, mes = _siguiente_mes(anio, mes)
+    return resultado
+
+
+def genera(serie: SerieClase, ocurrencia: datetime) -> bool:
+    """Si la regla de la serie produce una ocurrencia que empieza exactamente ahí."""
+    regla = rrulestr(serie.regla, dtstart=serie.inicio)
+    return regla.after(ocurrencia, inc=True) == ocurrencia
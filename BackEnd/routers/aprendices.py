@@ -1,15 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert, select, tuple_, update
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import os
 
-from database import get_db
+from database import get_db, get_read_db
 from models import Aprendiz, Profesora
 from auth import get_current_user
+from borrado import eliminar_aprendices
+from serializacion import FAST_JSON, raw_json_response
+import proyeccion
+import sesiones
+import versiones
+from versiones import etag_por_profesora
 
 router = APIRouter(prefix="/aprendices", tags=["aprendices"])
 
+# Máximo de aprendices por petición en los endpoints /bulk
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+
 # Esquemas Pydantic para Aprendices
 class AprendizCreate(BaseModel):
     nombre: str
@@ -21,6 +32,22 @@ class AprendizUpdate(BaseModel):
     documento: Optional[str] = None
     profesora_id: Optional[int] = None
 
+class AprendizBulkUpdateItem(AprendizUpdate):
+    id: int
+
+class AprendicesBulkCreate(BaseModel):
+    aprendices: List[AprendizCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class AprendicesBulkUpdate(BaseModel):
+    aprendices: List[AprendizBulkUpdateItem] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class AprendicesIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class AprendicesReasignar(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+    profesora_id: int
+
 class AprendizResponse(BaseModel):
     id: int
     nombre: str
@@ -56,6 +83,30 @@ def serialize_aprendiz(aprendiz: Aprendiz) -> dict:
         'profesora': profesora_obj
     }
 
+# Columnas y relaciones que admite ?fields= / ?include= en el listado
+RECURSO_APRENDIZ = proyeccion.Recurso(
+    columnas={
+        "id": Aprendiz.id,
+        "nombre": Aprendiz.nombre,
+        "documento": Aprendiz.documento,
+        "profesora_id": Aprendiz.profesora_id,
+    },
+    relaciones={
+        "profesora": proyeccion.Relacion(
+            Profesora,
+            Profesora.id == Aprendiz.profesora_id,
+            {
+                "id": Profesora.id,
+                "nombre": Profesora.nombre,
+                "email": Profesora.email,
+                "especialidad": Profesora.especialidad,
+                "is_admin": Profesora.is_admin,
+                "activa": Profesora.activa,
+            }
+        )
+    }
+)
+
 # CRUD Endpoints para Aprendices
 @router.post("", response_model=AprendizResponse)
 async def crear_aprendiz(
@@ -84,14 +135,171 @@ async def crear_aprendiz(
     db.add(aprendiz)
     db.commit()
     db.refresh(aprendiz)
+    versiones.bump(profesora_id)
 
     return serialize_aprendiz(aprendiz)
 
+# --- Operaciones masivas: una validación y una sentencia por lote ---
+
+def _columnas_aprendiz(aprendiz) -> dict:
+    """Aprendiz (fila o instancia) sin la profesora anidada, para respuestas masivas."""
+    return {
+        'id': aprendiz.id,
+        'nombre': aprendiz.nombre,
+        'documento': aprendiz.documento,
+        'profesora_id': aprendiz.profesora_id,
+        'profesora': None
+    }
+
+def _verificar_profesoras(db: Session, profesora_ids: set):
+    encontradas = {pid for (pid,) in db.query(Profesora.id).filter(Profesora.id.in_(profesora_ids))}
+    faltantes = sorted(profesora_ids - encontradas)
+    if faltantes:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profesora no encontrada: {faltantes}"
+        )
+
+def _propietarios(db: Session, ids: set, current_user: Profesora) -> dict:
+    """{aprendiz_id: profesora_id} de los ids pedidos; 404 si falta alguno y 403 si no son del usuario."""
+    propietarios = dict(db.query(Aprendiz.id, Aprendiz.profesora_id).filter(Aprendiz.id.in_(ids)))
+    faltantes = sorted(ids - propietarios.keys())
+    if faltantes:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Aprendiz no encontrado: {faltantes}"
+        )
+    if not current_user.is_admin:
+        ajenos = sorted(aid for aid, pid in propietarios.items() if pid != current_user.id)
+        if ajenos:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"No tienes permisos para editar estos aprendices: {ajenos}"
+            )
+    return propietarios
+
+@router.post("/bulk")
+async def crear_aprendices_bulk(
+    datos: AprendicesBulkCreate,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Crear varios aprendices en un solo INSERT de varias filas"""
+    filas = [
+        {
+            "nombre": a.nombre,
+            "documento": a.documento,
+            "profesora_id": a.profesora_id or current_user.id
+        }
+        for a in datos.aprendices
+    ]
+    profesora_ids = {f["profesora_id"] for f in filas}
+    if profesora_ids - {current_user.id}:
+        _verificar_profesoras(db, profesora_ids - {current_user.id})
+
+    dialect = db.get_bind().dialect
+    if dialect.insert_executemany_returning:
+        creados = db.execute(
+            insert(Aprendiz).returning(Aprendiz.id, Aprendiz.nombre, Aprendiz.documento, Aprendiz.profesora_id),
+            filas
+        ).all()
+    else:
+        # MySQL no tiene RETURNING: el INSERT va en un executemany (pymysql lo envía como
+        # un único INSERT de varias filas) y los ids se leen con una sola consulta
+        db.execute(insert(Aprendiz), filas)
+        claves = {(f["profesora_id"], f["nombre"]) for f in filas}
+        recientes = {}
+        for fila in db.execute(
+            select(Aprendiz.id, Aprendiz.nombre, Aprendiz.documento, Aprendiz.profesora_id)
+            .where(tuple_(Aprendiz.profesora_id, Aprendiz.nombre).in_(claves))
+            .order_by(Aprendiz.id.desc())
+        ):
+            recientes.setdefault((fila.profesora_id, fila.nombre, fila.documento), []).append(fila)
+        creados = [recientes[(f["profesora_id"], f["nombre"], f["documento"])].pop(0) for f in filas[::-1]][::-1]
+    db.commit()
+    versiones.bump(*profesora_ids)
+
+    return {"creados": len(creados), "aprendices": [_columnas_aprendiz(a) for a in creados]}
+
+@router.put("/bulk")
+async def actualizar_aprendices_bulk(
+    datos: AprendicesBulkUpdate,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Actualizar varios aprendices: UPDATE por clave primaria en un executemany"""
+    cambios = {}
+    for item in datos.aprendices:
+        valores = item.model_dump(exclude_unset=True)
+        cambios.setdefault(item.id, {}).update(valores)
+
+    propietarios = _propietarios(db, set(cambios), current_user)
+    # El cambio de profesora va aparte: conserva el historial de asistencia
+    reasignaciones = {}
+    for aprendiz_id, valores in cambios.items():
+        nueva_profesora = valores.pop("profesora_id", None)
+        if nueva_profesora:
+            reasignaciones[aprendiz_id] = nueva_profesora
+    nuevas_profesoras = set(reasignaciones.values())
+    if nuevas_profesoras:
+        _verificar_profesoras(db, nuevas_profesoras)
+        sesiones.reasignar(db, reasignaciones)
+
+    # Agrupar por conjunto de columnas: cada grupo es un executemany homogéneo
+    grupos = {}
+    for valores in cambios.values():
+        grupos.setdefault(tuple(sorted(valores)), []).append(valores)
+    for filas in grupos.values():
+        if len(filas[0]) > 1:
+            db.execute(update(Aprendiz), filas)
+    db.commit()
+    versiones.bump(*propietarios.values(), *nuevas_profesoras)
+
+    actualizados = db.execute(
+        select(Aprendiz.id, Aprendiz.nombre, Aprendiz.documento, Aprendiz.profesora_id)
+        .where(Aprendiz.id.in_(cambios))
+    ).all()
+    return {"actualizados": len(actualizados), "aprendices": [_columnas_aprendiz(a) for a in actualizados]}
+
+@router.post("/bulk/reasignar")
+async def reasignar_aprendices(
+    datos: AprendicesReasignar,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Pasar varios aprendices a otra profesora: un INSERT ... SELECT que guarda sus
+    ausencias con la profesora anterior y un UPDATE ... WHERE id IN"""
+    ids = set(datos.ids)
+    propietarios = _propietarios(db, ids, current_user)
+    _verificar_profesoras(db, {datos.profesora_id})
+
+    sesiones.reasignar(db, {aprendiz_id: datos.profesora_id for aprendiz_id in ids})
+    db.commit()
+    versiones.bump(datos.profesora_id, *propietarios.values())
+
+    return {"reasignados": len(ids), "profesora_id": datos.profesora_id}
+
+@router.post("/bulk/eliminar")
+async def eliminar_aprendices_bulk(
+    datos: AprendicesIds,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Eliminar varios aprendices y su historial con un DELETE por tabla"""
+    propietarios = _propietarios(db, set(datos.ids), current_user)
+    eliminados = eliminar_aprendices(db, propietarios.keys())
+    db.commit()
+    versiones.bump(*propietarios.values())
+
+    return {"eliminados": eliminados}
+
 @router.get("", response_model=List[AprendizResponse])
 async def get_aprendices(
     profesora_id: Optional[int] = None,
+    campos: Optional[proyeccion.Proyeccion] = Depends(proyeccion.dependencia(RECURSO_APRENDIZ)),
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     query = db.query(Aprendiz)
     
@@ -101,14 +309,21 @@ async def get_aprendices(
     elif profesora_id:
         query = query.filter(Aprendiz.profesora_id == profesora_id)
     
+    if campos is not None:
+        filas = proyeccion.aplicar(query, RECURSO_APRENDIZ, campos).all()
+        return raw_json_response(proyeccion.serializar(filas, campos), headers=cache_headers)
+    
     aprendices = query.all()
+    if FAST_JSON:
+        return raw_json_response([serialize_aprendiz(a) for a in aprendices], headers=cache_headers)
     return [serialize_aprendiz(a) for a in aprendices]
 
 @router.get("/{aprendiz_id}", response_model=AprendizResponse)
 async def get_aprendiz(
     aprendiz_id: int,
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     aprendiz = db.query(Aprendiz).filter(Aprendiz.id == aprendiz_id).first()
     
@@ -150,12 +365,17 @@ async def actualizar_aprendiz(
         )
     
     # Actualizar campos
+    profesora_anterior = aprendiz.profesora_id
     update_data = aprendiz_data.model_dump(exclude_unset=True)
+    nueva_profesora = update_data.pop("profesora_id", None)
+    if nueva_profesora:
+        sesiones.reasignar(db, {aprendiz.id: nueva_profesora})
     for field, value in update_data.items():
         setattr(aprendiz, field, value)
     
     db.commit()
     db.refresh(aprendiz)
+    versiones.bump(profesora_anterior, aprendiz.profesora_id)
 
     return serialize_aprendiz(aprendiz)
 
@@ -180,7 +400,10 @@ async def eliminar_aprendiz(
             detail="No tienes permisos para eliminar este aprendiz"
         )
     
-    db.delete(aprendiz)
+    # El historial se borra con una sentencia, sin cargar las asistencias en la sesión
+    profesora_id = aprendiz.profesora_id
+    eliminar_aprendices(db, [aprendiz.id])
     db.commit()
+    versiones.bump(profesora_id)
     
     return {"message": "Aprendiz eliminado exitosamente"}
@@ -1,13 +1,31 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from database import get_db
-from models import Aprendiz, Asistencia, Profesora
-from auth import get_current_user
+from database import get_db, get_read_db, get_heavy_db
+from models import Aprendiz, Asistencia, Clase, Profesora
+from auth import get_current_admin, get_current_user
+from cache import cache
+from cancelacion import (
+    ASISTENCIAS_QUERY_BUDGET_MS, EXPORT_QUERY_BUDGET_MS, REPORTE_QUERY_BUDGET_MS, Vigilancia, vigilar
+)
+from serializacion import FAST_JSON, raw_json_response
+from importacion import (
+    ArchivoInvalido, leer_hoja, importar_hoja, parsear_archivo, importar_registros,
+    expandir_archivos, profesora_de_archivo, process_pool, IMPORT_WORKERS
+)
+import checkin
+import exportacion
+import proyeccion
+import sesiones
+import versiones
+from versiones import etag_por_profesora
 from datetime import datetime, date
 import pandas as pd
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+import orjson
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import io
+import json
 from typing import List, Optional
 from pydantic import BaseModel
 
@@ -23,7 +41,7 @@ class AsistenciaUpdate(BaseModel):
     presente: Optional[bool] = None
 
 class AsistenciaResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None en ausencias implícitas: se editan por /celda/{aprendiz_id}/{fecha}
     aprendiz_id: int
     fecha: date
     presente: bool
@@ -33,23 +51,64 @@ class AsistenciaResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Campos que admite ?fields= / ?include= en el listado. Las filas salen de la matriz
+# expandida (no de un SELECT), así que la proyección decide qué columnas de
+# aprendices se leen y qué claves se emiten por celda.
+RECURSO_ASISTENCIA = proyeccion.Recurso(
+    columnas={
+        "id": Asistencia.id,
+        "aprendiz_id": Asistencia.aprendiz_id,
+        "fecha": Asistencia.fecha,
+        "presente": Asistencia.presente,
+        "profesora_id": Asistencia.profesora_id,
+    },
+    relaciones={
+        "aprendiz": proyeccion.Relacion(
+            Aprendiz,
+            Aprendiz.id == Asistencia.aprendiz_id,
+            {"id": Aprendiz.id, "nombre": Aprendiz.nombre, "documento": Aprendiz.documento}
+        )
+    }
+)
+
 class AsistenciaMasivaCreate(BaseModel):
     fecha: date
     asistencias: List[dict]  # [{"aprendiz_id": 1, "presente": True}, ...]
 
+class CheckinRequest(BaseModel):
+    token: str
+    documento: str
+
 class ToggleAttendance(BaseModel):
     aprendiz_id: int
     fecha: str
     presente: bool
 
-def _parse_date_col(col):
-    """Helper function para parsear fechas de diferentes formatos"""
-    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
-        try:
-            return datetime.strptime(str(col), fmt).date()
-        except Exception:
-            continue
-    return None
+def _parse_fecha(valor: Optional[str]) -> Optional[date]:
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _aprendiz_resumen(ap) -> dict:
+    return {"id": ap.id, "nombre": ap.nombre, "documento": ap.documento}
+
+def _respuesta_celda(db: Session, aprendiz: Aprendiz, fecha: date, presente: bool) -> dict:
+    """Celda tal como quedó guardada (la fila si la hay; si no, ausencia implícita)."""
+    fila = db.query(Asistencia.id, Asistencia.profesora_id).filter(
+        Asistencia.aprendiz_id == aprendiz.id,
+        Asistencia.fecha == fecha
+    ).first()
+    return {
+        "id": fila.id if fila else None,
+        "aprendiz_id": aprendiz.id,
+        "fecha": fecha,
+        "presente": presente,
+        "profesora_id": fila.profesora_id if fila else aprendiz.profesora_id,
+        "aprendiz": _aprendiz_resumen(aprendiz)
+    }
 
 # CRUD Endpoints mejorados
 @router.get("/", response_model=List[AsistenciaResponse])
@@ -59,58 +118,70 @@ def obtener_asistencias(
     fecha_fin: Optional[str] = Query(None),
     aprendiz_id: Optional[int] = Query(None),
     presente: Optional[bool] = Query(None),
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user)
+    campos: Optional[proyeccion.Proyeccion] = Depends(proyeccion.dependencia(RECURSO_ASISTENCIA)),
+    db: Session = Depends(get_read_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora),
+    vigilancia: Vigilancia = Depends(vigilar(ASISTENCIAS_QUERY_BUDGET_MS, get_read_db))
 ):
-    """Obtener asistencias con filtros opcionales - versión mejorada"""
-    query = db.query(Asistencia).join(Aprendiz)
+    """Obtener asistencias con filtros opcionales - matriz completa aprendiz x sesión"""
+    query = db.query(Aprendiz)
     
     # Control de permisos
     if not getattr(user, 'is_admin', False):
-        query = query.filter(Asistencia.profesora_id == user.id)
+        query = query.filter(Aprendiz.profesora_id == user.id)
     elif profesora_id:
-        query = query.filter(Asistencia.profesora_id == profesora_id)
-    
-    # Filtros de fecha
-    if fecha_inicio:
-        try:
-            fecha_ini = datetime.strptime(fecha_inicio, "%Y-%m-%d").date()
-            query = query.filter(Asistencia.fecha >= fecha_ini)
-        except ValueError:
-            pass
-    
-    if fecha_fin:
-        try:
-            fecha_fin_date = datetime.strptime(fecha_fin, "%Y-%m-%d").date()
-            query = query.filter(Asistencia.fecha <= fecha_fin_date)
-        except ValueError:
-            pass
+        query = query.filter(Aprendiz.profesora_id == profesora_id)
     
     # Filtros adicionales
     if aprendiz_id:
-        query = query.filter(Asistencia.aprendiz_id == aprendiz_id)
-    
-    if presente is not None:
-        query = query.filter(Asistencia.presente == presente)
+        query = query.filter(Aprendiz.id == aprendiz_id)
+    
+    # Con ?fields= solo se leen de aprendices las columnas que se van a emitir
+    campos_aprendiz = None
+    if campos is not None:
+        campos_aprendiz = campos.incluir.get("aprendiz")
+        relacion = RECURSO_ASISTENCIA.relaciones["aprendiz"]
+        query = query.with_entities(
+            Aprendiz.id, Aprendiz.profesora_id, Aprendiz.fecha_asignacion,
+            *[relacion.columnas[c] for c in campos_aprendiz or () if c != "id"]
+        )
     
-    asistencias = query.order_by(Asistencia.fecha.desc()).all()
+    # Por lotes de aprendices: si el cliente se va, se corta entre lotes
+    with vigilancia:
+        aprendices = query.all()
+        desde, hasta = _parse_fecha(fecha_inicio), _parse_fecha(fecha_fin)
+        matriz = sesiones.expandir_por_lotes(db, vigilancia.lotes(aprendices), desde, hasta)
     
-    # Formatear respuesta
+    # Formatear respuesta (las ausencias implícitas salen con id None; se editan por /celda/)
     result = []
-    for asist in asistencias:
-        result.append({
-            "id": asist.id,
-            "aprendiz_id": asist.aprendiz_id,
-            "fecha": asist.fecha,
-            "presente": asist.presente,
-            "profesora_id": asist.profesora_id,
-            "aprendiz": {
-                "id": asist.aprendiz.id,
-                "nombre": asist.aprendiz.nombre,
-                "documento": asist.aprendiz.documento
+    for ap in aprendices:
+        if campos is None:
+            datos_aprendiz = _aprendiz_resumen(ap)
+        elif campos_aprendiz:
+            datos_aprendiz = {c: getattr(ap, c) for c in campos_aprendiz}
+        for fecha, (presente_celda, asistencia_id, profesora_celda) in matriz[ap.id].items():
+            if presente is not None and presente_celda != presente:
+                continue
+            fila = {
+                "id": asistencia_id,
+                "aprendiz_id": ap.id,
+                "fecha": fecha,
+                "presente": presente_celda,
+                "profesora_id": profesora_celda,
             }
-        })
-    
+            if campos is None:
+                fila["aprendiz"] = datos_aprendiz
+            else:
+                fila = {c: fila[c] for c in campos.campos}
+                if campos_aprendiz:
+                    fila["aprendiz"] = datos_aprendiz
+            result.append((fecha, fila))
+    result.sort(key=lambda r: r[0], reverse=True)
+    result = [fila for _, fila in result]
+    
+    if FAST_JSON or campos is not None:
+        return raw_json_response(result, headers=cache_headers)
     return result
 
 @router.post("/", response_model=AsistenciaResponse)
@@ -119,7 +190,7 @@ def crear_asistencia(
     db: Session = Depends(get_db),
     user=Depends(get_current_user)
 ):
-    """Crear asistencia individual - versión mejorada"""
+    """Registrar la asistencia de un aprendiz en una fecha (crea o actualiza la celda)"""
     # Verificar que el aprendiz existe y pertenece al usuario actual (si no es admin)
     aprendiz = db.query(Aprendiz).filter(Aprendiz.id == asistencia_data.aprendiz_id).first()
     if not aprendiz:
@@ -134,56 +205,13 @@ def crear_asistencia(
             detail="No tienes permisos para registrar asistencia de este aprendiz"
         )
     
-    # Verificar si ya existe asistencia para ese día
-    existing = db.query(Asistencia).filter(
-        and_(
-            Asistencia.aprendiz_id == asistencia_data.aprendiz_id,
-            Asistencia.fecha == asistencia_data.fecha
-        )
-    ).first()
-    
-    if existing:
-        # Actualizar existente
-        existing.presente = asistencia_data.presente
-        db.commit()
-        db.refresh(existing)
-        return {
-            "id": existing.id,
-            "aprendiz_id": existing.aprendiz_id,
-            "fecha": existing.fecha,
-            "presente": existing.presente,
-            "profesora_id": existing.profesora_id,
-            "aprendiz": {
-                "id": existing.aprendiz.id,
-                "nombre": existing.aprendiz.nombre,
-                "documento": existing.aprendiz.documento
-            }
-        }
-    
-    # Crear nueva asistencia
-    asistencia = Asistencia(
-        aprendiz_id=asistencia_data.aprendiz_id,
-        fecha=asistencia_data.fecha,
-        presente=asistencia_data.presente,
-        profesora_id=user.id
-    )
-    
-    db.add(asistencia)
+    sesiones.aplicar_marcas(db, {
+        (aprendiz.id, asistencia_data.fecha): (aprendiz.profesora_id, asistencia_data.presente)
+    })
     db.commit()
-    db.refresh(asistencia)
+    versiones.bump(user.id, aprendiz.profesora_id)
     
-    return {
-        "id": asistencia.id,
-        "aprendiz_id": asistencia.aprendiz_id,
-        "fecha": asistencia.fecha,
-        "presente": asistencia.presente,
-        "profesora_id": asistencia.profesora_id,
-        "aprendiz": {
-            "id": asistencia.aprendiz.id,
-            "nombre": asistencia.aprendiz.nombre,
-            "documento": asistencia.aprendiz.documento
-        }
-    }
+    return _respuesta_celda(db, aprendiz, asistencia_data.fecha, asistencia_data.presente)
 
 @router.post("/masiva")
 def crear_asistencia_masiva(
@@ -192,17 +220,21 @@ def crear_asistencia_masiva(
     user=Depends(get_current_user)
 ):
     """Crear múltiples asistencias para una fecha específica"""
-    created_count = 0
-    updated_count = 0
     errors = []
+    afectadas = {user.id}
+    
+    # Todos los aprendices en una consulta
+    ids = {item.get("aprendiz_id") for item in asistencia_data.asistencias if isinstance(item.get("aprendiz_id"), int)}
+    aprendices = {ap.id: ap for ap in db.query(Aprendiz).filter(Aprendiz.id.in_(ids))} if ids else {}
     
+    marcas = {}
     for item in asistencia_data.asistencias:
         try:
             aprendiz_id = item.get("aprendiz_id")
-            presente = item.get("presente", True)
+            presente = bool(item.get("presente", True))
             
             # Verificar que el aprendiz existe
-            aprendiz = db.query(Aprendiz).filter(Aprendiz.id == aprendiz_id).first()
+            aprendiz = aprendices.get(aprendiz_id)
             if not aprendiz:
                 errors.append(f"Aprendiz {aprendiz_id} no encontrado")
                 continue
@@ -212,33 +244,15 @@ def crear_asistencia_masiva(
                 errors.append(f"Sin permisos para aprendiz {aprendiz_id}")
                 continue
             
-            # Buscar si ya existe
-            existing = db.query(Asistencia).filter(
-                and_(
-                    Asistencia.aprendiz_id == aprendiz_id,
-                    Asistencia.fecha == asistencia_data.fecha
-                )
-            ).first()
-            
-            if existing:
-                # Actualizar
-                existing.presente = presente
-                updated_count += 1
-            else:
-                # Crear nuevo
-                new_asistencia = Asistencia(
-                    aprendiz_id=aprendiz_id,
-                    fecha=asistencia_data.fecha,
-                    presente=presente,
-                    profesora_id=user.id
-                )
-                db.add(new_asistencia)
-                created_count += 1
+            afectadas.add(aprendiz.profesora_id)
+            marcas[(aprendiz.id, asistencia_data.fecha)] = (aprendiz.profesora_id, presente)
                 
         except Exception as e:
             errors.append(f"Error con aprendiz {item.get('aprendiz_id', 'N/A')}: {str(e)}")
     
+    created_count, updated_count = sesiones.aplicar_marcas(db, marcas)
     db.commit()
+    versiones.bump(*afectadas)
     
     return {
         "message": "Asistencia masiva procesada",
@@ -266,23 +280,9 @@ def toggle_attendance(
         )
     
     fecha = datetime.fromisoformat(item.fecha).date()
-    a = db.query(Asistencia).filter(
-        Asistencia.aprendiz_id == item.aprendiz_id, 
-        Asistencia.fecha == fecha
-    ).first()
-    
-    if a:
-        a.presente = item.presente
-    else:
-        a = Asistencia(
-            aprendiz_id=item.aprendiz_id, 
-            fecha=fecha, 
-            presente=item.presente, 
-            profesora_id=user.id
-        )
-        db.add(a)
-    
+    sesiones.aplicar_marcas(db, {(ap.id, fecha): (ap.profesora_id, item.presente)})
     db.commit()
+    versiones.bump(user.id)
     return {"ok": True}
 
 @router.get("/reporte")
@@ -290,44 +290,46 @@ def get_reporte_asistencia(
     fecha_inicio: date = Query(...),
     fecha_fin: date = Query(...),
     profesora_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user)
+    db: Session = Depends(get_heavy_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora),
+    vigilancia: Vigilancia = Depends(vigilar(REPORTE_QUERY_BUDGET_MS))
 ):
     """Generar reporte de asistencia por período"""
-    query = db.query(
-        Aprendiz.id,
-        Aprendiz.nombre,
-        Aprendiz.documento,
-        func.count(Asistencia.id).label('total_registros'),
-        func.sum(func.cast(Asistencia.presente, db.bind.dialect.INTEGER)).label('presentes'),
-    ).join(Asistencia, Aprendiz.id == Asistencia.aprendiz_id)
-    
     # Filtros de permiso
     if not getattr(user, 'is_admin', False):
-        query = query.filter(Aprendiz.profesora_id == user.id)
-    elif profesora_id:
-        query = query.filter(Aprendiz.profesora_id == profesora_id)
-    
-    # Filtro de fechas
-    query = query.filter(
-        and_(
-            Asistencia.fecha >= fecha_inicio,
-            Asistencia.fecha <= fecha_fin
+        profesora_id = user.id
+    # Un solo worker lo calcula; cualquier escritura del alcance lo invalida
+    alcance = "global" if profesora_id is None else f"profesora:{profesora_id}"
+    with vigilancia:
+        contenido = cache().memo(
+            f"reporte:{alcance}:{fecha_inicio.isoformat()}:{fecha_fin.isoformat()}",
+            lambda: orjson.dumps(_reporte(db, vigilancia, profesora_id, fecha_inicio, fecha_fin)),
+            etiquetas=[alcance]
         )
-    ).group_by(Aprendiz.id, Aprendiz.nombre, Aprendiz.documento)
+    return Response(content=contenido, media_type="application/json", headers=cache_headers)
+
+def _reporte(db: Session, vigilancia: Vigilancia, profesora_id: Optional[int], fecha_inicio: date, fecha_fin: date) -> dict:
+    query = db.query(Aprendiz)
+    if profesora_id is not None:
+        query = query.filter(Aprendiz.profesora_id == profesora_id)
     
-    resultados = query.all()
+    aprendices = query.all()
+    matriz = sesiones.expandir_por_lotes(db, vigilancia.lotes(aprendices), fecha_inicio, fecha_fin)
     
     reporte = []
-    for resultado in resultados:
-        presentes = resultado.presentes or 0
-        total = resultado.total_registros or 0
+    for ap in aprendices:
+        celdas = matriz[ap.id]
+        total = len(celdas)
+        if total == 0:
+            continue
+        presentes = sum(1 for presente, _, _ in celdas.values() if presente)
         porcentaje = (presentes / total * 100) if total > 0 else 0
         
         reporte.append({
-            "aprendiz_id": resultado.id,
-            "nombre": resultado.nombre,
-            "documento": resultado.documento,
+            "aprendiz_id": ap.id,
+            "nombre": ap.nombre,
+            "documento": ap.documento,
             "total_clases": total,
             "asistencias": presentes,
             "faltas": total - presentes,
@@ -342,6 +344,60 @@ def get_reporte_asistencia(
         "aprendices": reporte
     }
 
+def _celda_editable(db: Session, aprendiz_id: int, fecha: date, user):
+    """Aprendiz y fila guardada (o None) de una celda; 404/403 como las rutas por id."""
+    aprendiz = db.query(Aprendiz).filter(Aprendiz.id == aprendiz_id).first()
+    if not aprendiz:
+        raise HTTPException(status_code=404, detail="Aprendiz no encontrado")
+    asistencia = db.query(Asistencia).filter(
+        Asistencia.aprendiz_id == aprendiz_id,
+        Asistencia.fecha == fecha
+    ).first()
+    profesora_celda = (asistencia.profesora_id if asistencia else None) or aprendiz.profesora_id
+    if not getattr(user, 'is_admin', False) and profesora_celda != user.id:
+        raise HTTPException(status_code=403, detail="No tienes permisos para editar esta asistencia")
+    return aprendiz, asistencia, profesora_celda
+
+@router.put("/celda/{aprendiz_id}/{fecha}", response_model=AsistenciaResponse)
+def actualizar_celda(
+    aprendiz_id: int,
+    fecha: date,
+    asistencia_data: AsistenciaUpdate,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Actualizar una celda por aprendiz y fecha (también las ausencias implícitas, que no tienen id)"""
+    aprendiz, asistencia, profesora_celda = _celda_editable(db, aprendiz_id, fecha, user)
+    if asistencia_data.presente is None:
+        presente = bool(asistencia.presente) if asistencia else False
+    else:
+        presente = asistencia_data.presente
+    sesiones.aplicar_marcas(db, {(aprendiz.id, fecha): (profesora_celda, presente)})
+    db.commit()
+    versiones.bump(profesora_celda, aprendiz.profesora_id)
+    
+    return _respuesta_celda(db, aprendiz, fecha, presente)
+
+@router.delete("/celda/{aprendiz_id}/{fecha}")
+def eliminar_celda(
+    aprendiz_id: int,
+    fecha: date,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Borrar la marca guardada de una celda: vuelve a su valor por defecto
+    (ausente si es sesión de la profesora del aprendiz; si no, la celda desaparece)"""
+    aprendiz, asistencia, profesora_celda = _celda_editable(db, aprendiz_id, fecha, user)
+    if not asistencia:
+        raise HTTPException(status_code=404, detail="La celda no tiene una marca guardada")
+    db.delete(asistencia)
+    db.commit()
+    if asistencia.presente:
+        checkin.olvidar([(aprendiz.id, fecha)])
+    versiones.bump(profesora_celda, aprendiz.profesora_id)
+    
+    return {"message": "Asistencia eliminada exitosamente"}
+
 @router.put("/{asistencia_id}", response_model=AsistenciaResponse)
 def actualizar_asistencia(
     asistencia_id: int,
@@ -365,15 +421,17 @@ def actualizar_asistencia(
             detail="No tienes permisos para editar esta asistencia"
         )
     
-    # Actualizar campos
-    update_data = asistencia_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(asistencia, field, value)
-    
+    # Marcar ausente una celda implícita borra la fila (ver sesiones.aplicar_marcas)
+    aprendiz = asistencia.aprendiz
+    fecha = asistencia.fecha
+    presente = asistencia.presente if asistencia_data.presente is None else asistencia_data.presente
+    profesora_celda = asistencia.profesora_id or aprendiz.profesora_id
+    profesoras_afectadas = (profesora_celda, aprendiz.profesora_id)
+    sesiones.aplicar_marcas(db, {(aprendiz.id, fecha): (profesora_celda, bool(presente))})
     db.commit()
-    db.refresh(asistencia)
+    versiones.bump(*profesoras_afectadas)
     
-    return AsistenciaResponse.model_validate(asistencia)
+    return _respuesta_celda(db, aprendiz, fecha, bool(presente))
 
 @router.delete("/{asistencia_id}")
 def eliminar_asistencia(
@@ -397,8 +455,13 @@ def eliminar_asistencia(
             detail="No tienes permisos para eliminar esta asistencia"
         )
     
+    profesoras_afectadas = (asistencia.profesora_id, asistencia.aprendiz.profesora_id)
+    aprendiz_id, fecha, presente = asistencia.aprendiz_id, asistencia.fecha, asistencia.presente
     db.delete(asistencia)
     db.commit()
+    if presente:
+        checkin.olvidar([(aprendiz_id, fecha)])
+    versiones.bump(*profesoras_afectadas)
     
     return {"message": "Asistencia eliminada exitosamente"}
 
@@ -409,142 +472,179 @@ def eliminar_asistencia(
 async def importar_asistencia(
     archivo: UploadFile = File(...), 
     nombre_lista: str = "Importada", 
-    db: Session = Depends(get_db), 
+    simular: bool = Query(False, description="Solo calcular las diferencias, sin escribir"),
+    plan_hash: Optional[str] = Query(None, description="plan_hash de la simulación que se confirma"),
+    db: Session = Depends(get_heavy_db), 
     user=Depends(get_current_user)
 ):
-    """Importar asistencia desde Excel - funcionalidad existente mejorada"""
+    """Importar asistencia desde Excel o CSV - lectura en streaming por bloques.
+
+    Solo se escriben las celdas nuevas o modificadas. Con simular=true se devuelve el
+    resumen de diferencias y un plan_hash; al confirmar con ese plan_hash, si los datos
+    cambiaron desde la simulación se responde 409 sin escribir nada.
+    """
     try:
-        # Leer Excel
-        df = pd.read_excel(archivo.file, engine="openpyxl")
+        hoja = await run_in_threadpool(leer_hoja, archivo.file, archivo.filename, archivo.content_type)
+    except ArchivoInvalido as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # Cada bloque de filas se escribe al leerse: la memoria no depende del tamaño del archivo
+    try:
+        contadores = await run_in_threadpool(importar_hoja, db, user.id, hoja, simular)
+        if simular or (plan_hash and plan_hash != contadores["plan_hash"]):
+            db.rollback()
+        else:
+            db.commit()
+    except ArchivoInvalido as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error leyendo Excel: {e}")
-
-    # Detectar columna de nombre
-    nombre_col = None
-    for cand in ["NOMBRES", "NOMBRE", "Nombres", "Nombre"]:
-        if cand in df.columns:
-            nombre_col = cand
-            break
-    if nombre_col is None:
-        nombre_col = df.columns[0]
-
-    # Detectar columnas fecha
-    fecha_cols = []
-    for col in df.columns:
-        fecha_parsed = _parse_date_col(col)
-        if fecha_parsed:
-            fecha_cols.append((col, fecha_parsed))
-
-    if not fecha_cols:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error guardando en base de datos: {e}")
+
+    if not simular and plan_hash and plan_hash != contadores["plan_hash"]:
         raise HTTPException(
-            status_code=400, 
-            detail="No se encontraron columnas de fecha válidas en el archivo"
+            status_code=409,
+            detail="Los datos cambiaron desde la simulación; vuelva a simular la importación"
         )
+    if not simular and (contadores["aprendices_creados"] or contadores["asistencias_creadas"] or contadores["asistencias_actualizadas"]):
+        versiones.bump(user.id)
 
-    # Crear aprendices y asistencias
-    created_aprendices = 0
-    created_asistencias = 0
-    updated_asistencias = 0
-    errors = []
-
-    for idx, row in df.iterrows():
-        try:
-            nombre = str(row.get(nombre_col, "")).strip()
-            if not nombre or nombre.lower() == 'nan':
-                continue
+    return {
+        "ok": True,
+        "simulacion": simular,
+        **contadores,
+        "fechas_procesadas": len(hoja.fecha_cols),
+        "errores": hoja.errores
+    }
 
-            documento = str(row.get("DOCUMENTO", "")).strip() if "DOCUMENTO" in df.columns else None
-            if documento and documento.lower() == 'nan':
-                documento = None
-
-            # Buscar o crear aprendiz
-            aprendiz = None
-            if documento:
-                aprendiz = db.query(Aprendiz).filter(
-                    Aprendiz.documento == documento,
-                    Aprendiz.profesora_id == user.id
-                ).first()
-            
-            if not aprendiz:
-                # Buscar por nombre si no hay documento
-                aprendiz = db.query(Aprendiz).filter(
-                    Aprendiz.nombre == nombre,
-                    Aprendiz.profesora_id == user.id
-                ).first()
+@router.post("/importar/lote")
+async def importar_asistencia_lote(
+    archivos: List[UploadFile] = File(...),
+    mapeo: Optional[str] = Form(None),
+    db: Session = Depends(get_heavy_db),
+    admin=Depends(get_current_admin)
+):
+    """Importar varias hojas (o un ZIP) de distintas profesoras - solo admin.
 
-            if not aprendiz:
-                aprendiz = Aprendiz(
-                    nombre=nombre, 
-                    documento=documento, 
-                    profesora_id=user.id
-                )
-                db.add(aprendiz)
-                db.flush()  # Para obtener el ID
-                created_aprendices += 1
-
-            # Insertar asistencias
-            for colname, fecha in fecha_cols:
-                val = row.get(colname)
-                presente = False
-                
-                if pd.notna(val) and val != '':
-                    s = str(val).strip().lower()
-                    if s in ("x", "1", "true", "si", "sí", "y", "yes"):
-                        presente = True
-                    else:
-                        try:
-                            if float(val) != 0:
-                                presente = True
-                        except (ValueError, TypeError):
-                            if s:  # Si hay algún valor, considerar presente
-                                presente = True
-
-                # Upsert asistencia
-                existing_asist = db.query(Asistencia).filter(
-                    Asistencia.aprendiz_id == aprendiz.id,
-                    Asistencia.fecha == fecha
-                ).first()
-
-                if existing_asist:
-                    existing_asist.presente = presente
-                    updated_asistencias += 1
+    Cada archivo se asigna a una profesora con `mapeo` (JSON {"archivo.xlsx": profesora_id})
+    o por convención de nombre ("12_lista.xlsx" o carpeta "12/" dentro del ZIP).
+    Los archivos se parsean en paralelo en un pool de procesos y un único escritor
+    los guarda a medida que terminan, con un commit por archivo.
+    """
+    try:
+        asignacion = json.loads(mapeo) if mapeo else {}
+        if not isinstance(asignacion, dict):
+            raise ValueError("se esperaba un objeto")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"mapeo inválido: {e}")
+
+    # Los archivos ya están en disco (UploadFile): se revisan los tamaños sin leerlos
+    recibidos = [(archivo.filename or "archivo", archivo.file) for archivo in archivos]
+    try:
+        entradas = await run_in_threadpool(expandir_archivos, recibidos)
+    except ArchivoInvalido as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    reporte = {}
+    pendientes = []
+    for nombre, leer in entradas:
+        profesora_id = profesora_de_archivo(nombre, asignacion)
+        if profesora_id is None:
+            reporte[nombre] = {"ok": False, "error": "No se pudo determinar la profesora del archivo"}
+        else:
+            pendientes.append((nombre, leer, profesora_id))
+
+    def profesoras_existentes():
+        ids = {pid for (pid,) in db.query(Profesora.id).filter(Profesora.id.in_({p for _, _, p in pendientes}))}
+        db.commit()  # Liberar la conexión mientras se parsea
+        return ids
+
+    existentes = await run_in_threadpool(profesoras_existentes)
+
+    pool = process_pool()
+    loop = asyncio.get_running_loop()
+    # Solo las hojas que se están parseando están en memoria
+    en_curso = asyncio.Semaphore(max(IMPORT_WORKERS, 1))
+
+    async def parsear(nombre, leer, profesora_id):
+        try:
+            async with en_curso:
+                contenido = await run_in_threadpool(leer)
+                if pool is not None:
+                    hoja = await loop.run_in_executor(pool, parsear_archivo, nombre, contenido)
                 else:
-                    new_asist = Asistencia(
-                        aprendiz_id=aprendiz.id,
-                        fecha=fecha,
-                        presente=presente,
-                        profesora_id=user.id
-                    )
-                    db.add(new_asist)
-                    created_asistencias += 1
-
+                    hoja = await run_in_threadpool(parsear_archivo, nombre, contenido)
+        except Exception as e:  # p.ej. BrokenProcessPool o un miembro del ZIP dañado
+            hoja = None
+            reporte[nombre] = {"ok": False, "profesora_id": profesora_id, "error": f"Error en el proceso de lectura: {e}"}
+        return profesora_id, hoja
+
+    tareas = []
+    for nombre, leer, profesora_id in pendientes:
+        if profesora_id not in existentes:
+            reporte[nombre] = {"ok": False, "profesora_id": profesora_id, "error": "Profesora no encontrada"}
+        else:
+            tareas.append(parsear(nombre, leer, profesora_id))
+    del pendientes
+
+    def guardar(profesora_id, registros):
+        try:
+            contadores = importar_registros(db, profesora_id, registros)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return contadores
+
+    # Escritor único: las hojas se escriben de a una, en el orden en que terminan de parsearse
+    afectadas = set()
+    for completado in asyncio.as_completed(tareas):
+        profesora_id, hoja = await completado
+        if hoja is None:
+            continue
+        if hoja.error:
+            reporte[hoja.archivo] = {"ok": False, "profesora_id": profesora_id, "error": hoja.error}
+            continue
+        try:
+            contadores = await run_in_threadpool(guardar, profesora_id, hoja.registros)
         except Exception as e:
-            errors.append(f"Error procesando fila {idx + 2}: {str(e)}")
+            reporte[hoja.archivo] = {"ok": False, "profesora_id": profesora_id, "error": f"Error guardando en base de datos: {e}"}
+            continue
+        afectadas.add(profesora_id)
+        reporte[hoja.archivo] = {
+            "ok": True,
+            "profesora_id": profesora_id,
+            **contadores,
+            "fechas_procesadas": len(hoja.fecha_cols),
+            "errores": hoja.errores
+        }
 
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error guardando en base de datos: {e}")
+    if afectadas:
+        versiones.bump(*afectadas)
 
     return {
-        "ok": True,
-        "aprendices_creados": created_aprendices,
-        "asistencias_creadas": created_asistencias,
-        "asistencias_actualizadas": updated_asistencias,
-        "fechas_procesadas": len(fecha_cols),
-        "errores": errors
+        "ok": all(r["ok"] for r in reporte.values()),
+        "archivos": len(reporte),
+        "importados": sum(1 for r in reporte.values() if r["ok"]),
+        "reporte": reporte
     }
 
 @router.get("/listas/")
-def obtener_listas(db: Session = Depends(get_db), user=Depends(get_current_user)):
+def obtener_listas(
+    db: Session = Depends(get_read_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora)
+):
     """Obtener lista de aprendices con resumen de asistencias"""
     aprendices = db.query(Aprendiz).filter(Aprendiz.profesora_id == user.id).all()
+    matriz = sesiones.expandir(db, aprendices)
     result = []
     
     for ap in aprendices:
-        total_asistencias = len(ap.asistencias)
-        total_presentes = sum(1 for a in ap.asistencias if a.presente)
+        celdas = matriz[ap.id]
+        total_asistencias = len(celdas)
+        total_presentes = sum(1 for presente, _, _ in celdas.values() if presente)
         porcentaje = (total_presentes / total_asistencias * 100) if total_asistencias > 0 else 0
         
         result.append({
@@ -561,8 +661,9 @@ def obtener_listas(db: Session = Depends(get_db), user=Depends(get_current_user)
 @router.get("/detalle/{aprendiz_id}")
 def detalle_aprendiz(
     aprendiz_id: int, 
-    db: Session = Depends(get_db), 
-    user=Depends(get_current_user)
+    db: Session = Depends(get_read_db), 
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     """Obtener detalle completo de asistencias de un aprendiz"""
     ap = db.query(Aprendiz).filter(
@@ -577,12 +678,12 @@ def detalle_aprendiz(
         )
     
     # Ordenar asistencias por fecha
-    asistencias_ordenadas = sorted(ap.asistencias, key=lambda x: x.fecha)
-    fechas = [a.fecha for a in asistencias_ordenadas]
-    asist_map = {a.fecha.isoformat(): a.presente for a in asistencias_ordenadas}
+    celdas = sesiones.expandir(db, [ap])[ap.id]
+    fechas = sorted(celdas)
+    asist_map = {f.isoformat(): celdas[f][0] for f in fechas}
     
-    total_presentes = sum(1 for a in asistencias_ordenadas if a.presente)
-    porcentaje = (total_presentes / len(asistencias_ordenadas) * 100) if asistencias_ordenadas else 0
+    total_presentes = sum(1 for presente in asist_map.values() if presente)
+    porcentaje = (total_presentes / len(fechas) * 100) if fechas else 0
     
     return {
         "id": ap.id,
@@ -591,28 +692,30 @@ def detalle_aprendiz(
         "fechas": [f.isoformat() for f in fechas],
         "asistencias": asist_map,
         "resumen": {
-            "total_clases": len(asistencias_ordenadas),
+            "total_clases": len(fechas),
             "total_presentes": total_presentes,
-            "total_ausentes": len(asistencias_ordenadas) - total_presentes,
+            "total_ausentes": len(fechas) - total_presentes,
             "porcentaje_asistencia": round(porcentaje, 2)
         }
     }
 
 @router.get("/exportar/")
-def exportar_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
+def exportar_csv(
+    db: Session = Depends(get_heavy_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora),
+    vigilancia: Vigilancia = Depends(vigilar(EXPORT_QUERY_BUDGET_MS))
+):
     """Exportar asistencias a CSV - funcionalidad existente mejorada"""
-    aprendices = db.query(Aprendiz).filter(Aprendiz.profesora_id == user.id).all()
-    
-    if not aprendices:
-        raise HTTPException(status_code=404, detail="No hay aprendices para exportar")
-    
-    # Recopilar todas las fechas únicas
-    fechas_set = set()
-    for ap in aprendices:
-        for a in ap.asistencias:
-            fechas_set.add(a.fecha)
-    
-    fechas = sorted(list(fechas_set))
+    with vigilancia:
+        aprendices = db.query(Aprendiz).filter(Aprendiz.profesora_id == user.id).all()
+        
+        if not aprendices:
+            raise HTTPException(status_code=404, detail="No hay aprendices para exportar")
+        
+        # Las fechas salen del calendario de sesiones (más las de filas fuera de él)
+        matriz = sesiones.expandir_por_lotes(db, vigilancia.lotes(aprendices))
+    fechas = sorted(set().union(*matriz.values()))
     
     if not fechas:
         raise HTTPException(status_code=404, detail="No hay asistencias para exportar")
@@ -626,10 +729,10 @@ def exportar_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
         }
         
         total_presentes = 0
-        asist_dict = {a.fecha: a.presente for a in ap.asistencias}
+        celdas = matriz[ap.id]
         
         for f in fechas:
-            presente = asist_dict.get(f, False)
+            presente = f in celdas and celdas[f][0]
             row[f.strftime("%d/%m/%Y")] = "X" if presente else ""
             if presente:
                 total_presentes += 1
@@ -651,5 +754,103 @@ def exportar_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
     return StreamingResponse(
         io.StringIO(stream.getvalue()), 
         media_type="text/csv", 
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+        headers={"Content-Disposition": f"attachment; filename={filename}", **cache_headers}
+    )
+def _exportar_columnar(formato: str, db: Session, user, profesora_id: Optional[int],
+                       fecha_inicio: Optional[date], fecha_fin: Optional[date], cache_headers: dict):
+    if not exportacion.disponible():
+        raise HTTPException(status_code=501, detail="La exportación columnar requiere el paquete pyarrow")
+    if not getattr(user, 'is_admin', False):
+        profesora_id = user.id
+
+    batches = exportacion.lotes(db, profesora_id, fecha_inicio, fecha_fin)
+    if formato == "parquet":
+        contenido = exportacion.stream_parquet(batches)
+        media_type = "application/vnd.apache.parquet"
+    else:
+        contenido = exportacion.stream_arrow(batches)
+        media_type = "application/vnd.apache.arrow.stream"
+
+    filename = f"asistencia_{profesora_id or 'todas'}_{datetime.now().strftime('%Y%m%d')}.{formato}"
+    # Generador síncrono: Starlette lo recorre en el threadpool sin bloquear el loop
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}", **cache_headers}
+    )
+
+@router.get("/exportar.parquet")
+def exportar_parquet(
+    profesora_id: Optional[int] = Query(None),
+    fecha_inicio: Optional[date] = Query(None),
+    fecha_fin: Optional[date] = Query(None),
+    db: Session = Depends(get_heavy_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora)
+):
+    """Asistencia en forma larga (profesora_id, aprendiz_id, fecha, presente) como Parquet"""
+    return _exportar_columnar("parquet", db, user, profesora_id, fecha_inicio, fecha_fin, cache_headers)
+
+@router.get("/exportar.arrow")
+def exportar_arrow(
+    profesora_id: Optional[int] = Query(None),
+    fecha_inicio: Optional[date] = Query(None),
+    fecha_fin: Optional[date] = Query(None),
+    db: Session = Depends(get_heavy_db),
+    user=Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora)
+):
+    """Misma exportación en formato de streaming Arrow IPC"""
+    return _exportar_columnar("arrow", db, user, profesora_id, fecha_inicio, fecha_fin, cache_headers)
+
+# === AUTO-REGISTRO CON CÓDIGO QR ===
+
+@router.get("/qr/{clase_id}")
+def codigo_qr_clase(
+    clase_id: int,
+    db: Session = Depends(get_read_db),
+    user=Depends(get_current_user)
+):
+    """Token de vida corta para el QR de la clase; el frontend lo renueva antes de que venza"""
+    clase = db.query(Clase.id, Clase.profesora_id, Clase.fecha_inicio, Clase.activa).filter(
+        Clase.id == clase_id
+    ).first()
+    if not clase:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    if not getattr(user, 'is_admin', False) and clase.profesora_id != user.id:
+        raise HTTPException(status_code=403, detail="No tienes permisos para esta clase")
+    if not clase.activa:
+        raise HTTPException(status_code=400, detail="La clase está cancelada")
+
+    # El padrón queda en memoria para que el check-in no consulte la base
+    version_padron = checkin.cargar_padron(db, clase.profesora_id)
+    token, expira = checkin.emitir_token(clase.id, clase.profesora_id, clase.fecha_inicio.date(), version_padron)
+    return {"token": token, "expira": expira, "ttl": checkin.QR_TTL_SECONDS}
+
+@router.post("/checkin", status_code=202)
+async def registrar_checkin(datos: CheckinRequest):
+    """El aprendiz envía el token escaneado y su documento.
+
+    Sin JWT ni lecturas a la base: la firma y la ventana se validan con HMAC, el
+    documento se busca en el padrón en memoria y la marca se escribe por lotes.
+    """
+    try:
+        clase_id, profesora_id, fecha, version_padron = checkin.verificar_token(datos.token)
+    except checkin.CodigoInvalido as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    # Otro worker emitió el QR o el padrón cambió desde que este lo cargó
+    if not checkin.padron_al_dia(profesora_id, version_padron):
+        await run_in_threadpool(checkin.cargar_padron_nuevo, profesora_id)
+
+    encontrado = checkin.buscar_aprendiz(profesora_id, datos.documento)
+    if encontrado is None:
+        raise HTTPException(status_code=404, detail="Documento no inscrito con esta profesora")
+    aprendiz_id, nombre = encontrado
+    nuevo = checkin.registrar(aprendiz_id, fecha, profesora_id)
+    return {
+        "estado": "registrado" if nuevo else "duplicado",
+        "aprendiz": nombre,
+        "clase_id": clase_id,
+        "fecha": fecha.isoformat(),
+    }
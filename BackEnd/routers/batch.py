@@ -0,0 +1,145 @@
+from contextlib import AsyncExitStack
+from typing import List, Optional
+from urllib.parse import urlsplit
+import os
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from auth import get_current_user
+from database import get_read_db
+
+router = APIRouter(prefix="", tags=["batch"])
+
+# Máximo de sub-peticiones por lote
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10"))
+
+# Encabezados de la petición original que se pasan a cada sub-petición
+_HEADERS_REENVIADOS = (b"authorization", b"accept-language", b"user-agent")
+# Encabezados de la sub-respuesta que se devuelven al cliente
+_HEADERS_DEVUELTOS = ("etag", "last-modified", "cache-control", "content-type", "retry-after")
+
+
+class SubPeticion(BaseModel):
+    id: Optional[str] = None
+    path: str
+    if_none_match: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    peticiones: List[SubPeticion]
+
+
+async def _ejecutar(request: Request, sub: SubPeticion, user, db: Session):
+    """Ejecutar un GET contra el router, sin pasar otra vez por los middlewares.
+
+    Devuelve (status, headers, cuerpo). El usuario y la sesión del lote viajan en
+    scope["state"], donde los leen get_current_user y las dependencias get_*_db; la
+    petición del lote también, para que cancelacion.py vigile su desconexión.
+    """
+    path = sub.path
+    for _ in range(2):  # un solo redirect (barra final) como máximo
+        ruta, _, query = path.partition("?")
+        if not ruta.startswith("/") or ruta.rstrip("/") == "/batch":
+            return 400, {}, orjson.dumps({"detail": "Ruta inválida para un lote"})
+
+        headers = [(k, v) for k, v in request.scope["headers"] if k in _HEADERS_REENVIADOS]
+        if sub.if_none_match:
+            headers.append((b"if-none-match", sub.if_none_match.encode("latin-1")))
+        scope = {
+            "type": "http",
+            "asgi": request.scope.get("asgi", {"version": "3.0"}),
+            "http_version": request.scope.get("http_version", "1.1"),
+            "method": "GET",
+            "scheme": request.scope.get("scheme", "http"),
+            "server": request.scope.get("server"),
+            "client": request.scope.get("client"),
+            "root_path": request.scope.get("root_path", ""),
+            "path": ruta,
+            "raw_path": ruta.encode(),
+            "query_string": query.encode(),
+            "headers": headers,
+            "app": request.app,
+            "state": {"usuario_compartido": user, "db_compartida": db, "peticion_lote": request},
+        }
+
+        respuesta = {"status": 500, "headers": [], "body": []}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                respuesta["status"] = message["status"]
+                respuesta["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                respuesta["body"].append(message.get("body", b""))
+
+        try:
+            async with AsyncExitStack() as stack:
+                scope["fastapi_astack"] = stack
+                await request.app.router(scope, receive, send)
+        except StarletteHTTPException as e:
+            headers_error = {k.lower(): v for k, v in (e.headers or {}).items()}
+            return e.status_code, headers_error, (
+                b"" if e.status_code == 304 else orjson.dumps({"detail": e.detail})
+            )
+        except RequestValidationError as e:
+            return 422, {}, orjson.dumps({"detail": jsonable_encoder(e.errors())})
+        except Exception:
+            db.rollback()
+            return 500, {}, orjson.dumps({"detail": "Error interno en la sub-petición"})
+
+        headers_respuesta = {k.decode("latin-1"): v.decode("latin-1") for k, v in respuesta["headers"]}
+        if respuesta["status"] in (307, 308) and "location" in headers_respuesta:
+            destino = urlsplit(headers_respuesta["location"])
+            path = destino.path + (f"?{destino.query}" if destino.query else "")
+            continue
+        return respuesta["status"], headers_respuesta, b"".join(respuesta["body"])
+    return 508, {}, orjson.dumps({"detail": "Demasiadas redirecciones"})
+
+
+@router.post("/batch")
+async def batch(
+    datos: BatchRequest,
+    request: Request,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Varios GET en una sola petición: un JWT, una búsqueda del usuario y una sesión.
+
+    Las sub-peticiones se ejecutan en orden sobre la misma sesión; cada respuesta
+    lleva su status, ETag y cuerpo, y admite if_none_match para recibir 304.
+    """
+    if len(datos.peticiones) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {BATCH_MAX_REQUESTS} peticiones por lote"
+        )
+
+    partes = []
+    for sub in datos.peticiones:
+        status_code, headers, cuerpo = await _ejecutar(request, sub, current_user, db)
+        cabecera = orjson.dumps({
+            "id": sub.id if sub.id is not None else sub.path,
+            "status": status_code,
+            "headers": {k: v for k, v in headers.items() if k in _HEADERS_DEVUELTOS},
+        })
+        # Los cuerpos JSON se insertan tal cual, sin decodificarlos y volver a codificarlos
+        if not cuerpo:
+            cuerpo = b"null"
+        elif not headers.get("content-type", "application/json").startswith("application/json"):
+            cuerpo = orjson.dumps(cuerpo.decode("utf-8", errors="replace"))
+        partes.append(cabecera[:-1] + b',"body":' + cuerpo + b"}")
+
+    return Response(
+        content=b'{"respuestas":[' + b",".join(partes) + b"]}",
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"}
+    )
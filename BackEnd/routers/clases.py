@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+import heapq
 import pytz
 
-from database import get_db
-from models import Clase, Profesora
+from database import get_db, get_read_db
+from models import Clase, ExcepcionSerie, Profesora, SerieClase
 from auth import get_current_user
+from borrado import eliminar_clases, eliminar_series
+from serializacion import FAST_JSON, model_list_response, raw_json_response
+import proyeccion
+import calendario_ics
+import recurrencia
+import conflictos
+import versiones
+from versiones import etag_por_profesora
 
 router = APIRouter(prefix="/clases", tags=["clases"])
 
@@ -40,7 +50,7 @@ class ProfesoraResponse(BaseModel):
         from_attributes = True
 
 class ClaseResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None en ocurrencias de una serie
     profesora_id: int
     titulo: str
     fecha_inicio: datetime
@@ -49,14 +59,107 @@ class ClaseResponse(BaseModel):
     descripcion: Optional[str]
     activa: bool
     profesora: ProfesoraResponse
+    serie_id: Optional[int] = None
+    ocurrencia: Optional[datetime] = None  # inicio original de la ocurrencia en su serie
     
     class Config:
         from_attributes = True
 
+class SerieCreate(BaseModel):
+    profesora_id: int
+    titulo: str
+    fecha_inicio: datetime  # primera ocurrencia
+    fecha_fin: datetime
+    ubicacion: str
+    descripcion: Optional[str] = None
+    regla: str  # RRULE, p. ej. "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20270615"
+
+class SerieUpdate(BaseModel):
+    titulo: Optional[str] = None
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+    ubicacion: Optional[str] = None
+    descripcion: Optional[str] = None
+    regla: Optional[str] = None
+    activa: Optional[bool] = None
+
+class SerieResponse(BaseModel):
+    id: int
+    profesora_id: int
+    titulo: str
+    ubicacion: str
+    descripcion: Optional[str]
+    inicio: datetime
+    duracion_minutos: int
+    regla: str
+    hasta: datetime
+    activa: bool
+    
+    class Config:
+        from_attributes = True
+
+class ExcepcionUpdate(BaseModel):
+    cancelada: bool = False
+    titulo: Optional[str] = None
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+    ubicacion: Optional[str] = None
+    descripcion: Optional[str] = None
+
+# Columnas y relaciones que admite ?fields= / ?include= en el listado
+RECURSO_CLASE = proyeccion.Recurso(
+    columnas={
+        "id": Clase.id,
+        "profesora_id": Clase.profesora_id,
+        "titulo": Clase.titulo,
+        "fecha_inicio": Clase.fecha_inicio,
+        "fecha_fin": Clase.fecha_fin,
+        "ubicacion": Clase.ubicacion,
+        "descripcion": Clase.descripcion,
+        "activa": Clase.activa,
+    },
+    relaciones={
+        "profesora": proyeccion.Relacion(
+            Profesora,
+            Profesora.id == Clase.profesora_id,
+            {
+                "id": Profesora.id,
+                "nombre": Profesora.nombre,
+                "email": Profesora.email,
+                "especialidad": Profesora.especialidad,
+                "is_admin": Profesora.is_admin,
+                "activa": Profesora.activa,
+            }
+        )
+    }
+)
+
+class IntervaloPropuesto(BaseModel):
+    fecha_inicio: datetime
+    fecha_fin: datetime
+    titulo: Optional[str] = None
+
+class ValidarHorario(BaseModel):
+    profesora_id: int
+    clases: List[IntervaloPropuesto] = []
+    series: List[SerieCreate] = []
+
+def _sin_conflictos(choques: List[dict], ignorar_conflictos: bool):
+    """409 con los choques encontrados, salvo que se pida guardar igual"""
+    if choques and not ignorar_conflictos:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "mensaje": "El horario se cruza con otras clases de la profesora",
+                "conflictos": jsonable_encoder(choques)
+            }
+        )
+
 # Endpoints de clases (CRUD completo)
 @router.post("", response_model=ClaseResponse)
 async def crear_clase(
     clase_data: ClaseCreate,
+    ignorar_conflictos: bool = False,
     current_user: Profesora = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -75,10 +178,17 @@ async def crear_clase(
             detail="Profesora no encontrada"
         )
     
+    _sin_conflictos(conflictos.validar(db, clase_data.profesora_id, [
+        (clase_data.fecha_inicio, clase_data.fecha_fin, ("clase", None), clase_data.titulo)
+    ]), ignorar_conflictos)
+    
     clase = Clase(**clase_data.model_dump())
     db.add(clase)
     db.commit()
     db.refresh(clase)
+    versiones.bump(clase.profesora_id)
+    calendario_ics.invalidar(clase.profesora_id)
+    conflictos.clase_guardada(clase.profesora_id, clase.id, clase.fecha_inicio, clase.fecha_fin, clase.activa, clase.titulo)
     
     return ClaseResponse.model_validate(clase)
 
@@ -88,8 +198,11 @@ async def get_clases(
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
     activa: Optional[bool] = None,
+    incluir_series: bool = Query(False, description="Mezclar las ocurrencias de las series (sin id; se editan por /series)"),
+    campos: Optional[proyeccion.Proyeccion] = Depends(proyeccion.dependencia(RECURSO_CLASE)),
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     query = db.query(Clase)
     
@@ -108,14 +221,392 @@ async def get_clases(
     if activa is not None:
         query = query.filter(Clase.activa == activa)
     
-    clases = query.order_by(Clase.fecha_inicio).all()
+    query = query.order_by(Clase.fecha_inicio)
+    
+    # Ocurrencias de las series en la misma ventana, expandidas desde la caché mensual.
+    # Son opcionales: no tienen id y los clientes que editan por /clases/{id} no las esperan
+    ocurrencias = []
+    if incluir_series:
+        ocurrencias = [
+            o for o in recurrencia.ocurrencias(
+                db, current_user.id if not current_user.is_admin else profesora_id, fecha_inicio, fecha_fin
+            )
+            if (fecha_fin is None or o["fecha_fin"] <= recurrencia.local(fecha_fin))
+            and (activa is None or o["activa"] == activa)
+        ]
+    
+    if campos is not None:
+        filas = proyeccion.aplicar(query, RECURSO_CLASE, campos).add_columns(Clase.fecha_inicio.label("_orden")).all()
+        mezcla = heapq.merge(
+            zip([f._orden for f in filas], proyeccion.serializar(filas, campos)),
+            zip([o["fecha_inicio"] for o in ocurrencias], proyeccion.proyectar(ocurrencias, campos)),
+            key=lambda par: par[0]
+        )
+        return raw_json_response([item for _, item in mezcla], headers=cache_headers)
+    
+    clases = _mezclar(query.all(), ocurrencias)
+    if FAST_JSON:
+        # Las ocurrencias ya son dicts con la misma forma
+        return raw_json_response(
+            [c if isinstance(c, dict) else serialize_clase(c) for c in clases], headers=cache_headers
+        )
     return [ClaseResponse.model_validate(c) for c in clases]
 
+def serialize_clase(clase: Clase) -> dict:
+    """Convertir instancia SQLAlchemy Clase a dict con la forma de ClaseResponse."""
+    profesora = clase.profesora
+    return {
+        'id': clase.id,
+        'profesora_id': clase.profesora_id,
+        'titulo': clase.titulo,
+        'fecha_inicio': clase.fecha_inicio,
+        'fecha_fin': clase.fecha_fin,
+        'ubicacion': clase.ubicacion,
+        'descripcion': clase.descripcion,
+        'activa': clase.activa,
+        'profesora': {
+            'id': profesora.id,
+            'nombre': profesora.nombre,
+            'email': profesora.email,
+            'especialidad': profesora.especialidad,
+            'is_admin': profesora.is_admin,
+            'activa': profesora.activa
+        },
+        'serie_id': None,
+        'ocurrencia': None
+    }
+
+def _mezclar(clases: list, ocurrencias: List[dict]) -> list:
+    """Clases guardadas y ocurrencias de series, ambas ya ordenadas, en un solo orden por inicio."""
+    return list(heapq.merge(
+        clases, ocurrencias,
+        key=lambda c: c["fecha_inicio"] if isinstance(c, dict) else c.fecha_inicio
+    ))
+
+@router.get("/calendario/feed")
+async def get_feed_calendario(
+    request: Request,
+    todas: bool = False,
+    current_user: Profesora = Depends(get_current_user)
+):
+    """URL de suscripción .ics de la profesora (todas=true: todas las clases, solo admin)"""
+    if todas and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el admin puede suscribirse a todas las clases"
+        )
+    token = calendario_ics.token_feed(current_user, todas=todas)
+    return {"token": token, "url": f"{request.url_for('get_calendario_ics')}?token={token}"}
+
+@router.get("/calendario.ics")
+def get_calendario_ics(
+    request: Request,
+    token: str = Query(...),
+    db: Session = Depends(get_read_db)
+):
+    """Feed iCalendar autenticado por el token firmado de la URL (sin JWT)"""
+    alcance = calendario_ics.verificar_token(db, token)
+    if alcance is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de calendario inválido")
+    resultado = calendario_ics.feed(db, alcance)
+    if resultado is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendario no disponible")
+    etag, contenido = resultado
+    
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={calendario_ics.ICS_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [e.strip() for e in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=contenido, media_type="text/calendar", headers=headers)
+
+# Series recurrentes: una fila con la regla en lugar de una clase por sesión
+def _serie_propia(db: Session, serie_id: int, current_user: Profesora) -> SerieClase:
+    serie = db.query(SerieClase).filter(SerieClase.id == serie_id).first()
+    if not serie:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Serie no encontrada"
+        )
+    if not current_user.is_admin and serie.profesora_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para esta serie"
+        )
+    return serie
+
+def _validar_regla(regla: str, inicio: datetime):
+    try:
+        return recurrencia.normalizar_regla(regla, inicio)
+    except recurrencia.ReglaInvalida as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def _duracion_minutos(inicio: datetime, fin: datetime) -> int:
+    if fin <= inicio:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La fecha de fin debe ser posterior a la de inicio"
+        )
+    return int((fin - inicio).total_seconds() // 60)
+
+def _series_cambiaron(profesora_id: int):
+    versiones.bump(profesora_id)
+    calendario_ics.invalidar(profesora_id)
+    recurrencia.invalidar(profesora_id)
+    conflictos.invalidar(profesora_id)
+
+@router.post("/series", response_model=SerieResponse)
+async def crear_serie(
+    serie_data: SerieCreate,
+    ignorar_conflictos: bool = False,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not current_user.is_admin and serie_data.profesora_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo puedes crear series para ti mismo"
+        )
+    if not db.query(Profesora.id).filter(Profesora.id == serie_data.profesora_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profesora no encontrada"
+        )
+    
+    inicio = recurrencia.local(serie_data.fecha_inicio)
+    duracion = _duracion_minutos(inicio, recurrencia.local(serie_data.fecha_fin))
+    regla, hasta = _validar_regla(serie_data.regla, inicio)
+    # Todas las ocurrencias se validan en una pasada antes de guardar
+    _sin_conflictos(conflictos.validar(
+        db, serie_data.profesora_id, conflictos.expandir_serie(regla, inicio, duracion, titulo=serie_data.titulo)
+    ), ignorar_conflictos)
+    serie = SerieClase(
+        profesora_id=serie_data.profesora_id,
+        titulo=serie_data.titulo,
+        ubicacion=serie_data.ubicacion,
+        descripcion=serie_data.descripcion,
+        inicio=inicio,
+        duracion_minutos=duracion,
+        regla=regla,
+        hasta=hasta,
+        activa=True
+    )
+    db.add(serie)
+    db.commit()
+    db.refresh(serie)
+    _series_cambiaron(serie.profesora_id)
+    
+    return SerieResponse.model_validate(serie)
+
+@router.get("/series", response_model=List[SerieResponse])
+async def get_series(
+    profesora_id: Optional[int] = None,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
+):
+    query = db.query(SerieClase)
+    if not current_user.is_admin:
+        query = query.filter(SerieClase.profesora_id == current_user.id)
+    elif profesora_id:
+        query = query.filter(SerieClase.profesora_id == profesora_id)
+    
+    series = query.order_by(SerieClase.inicio).all()
+    if FAST_JSON:
+        return model_list_response(SerieResponse, series, headers=cache_headers)
+    return [SerieResponse.model_validate(s) for s in series]
+
+@router.put("/series/{serie_id}", response_model=SerieResponse)
+async def actualizar_serie(
+    serie_id: int,
+    serie_data: SerieUpdate,
+    ignorar_conflictos: bool = False,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Editar o cancelar (activa=false) todas las ocurrencias con un solo UPDATE"""
+    serie = _serie_propia(db, serie_id, current_user)
+    update_data = serie_data.model_dump(exclude_unset=True)
+    
+    inicio = recurrencia.local(update_data.pop("fecha_inicio", None)) or serie.inicio
+    fin = recurrencia.local(update_data.pop("fecha_fin", None))
+    if fin is not None or inicio != serie.inicio:
+        serie.duracion_minutos = _duracion_minutos(
+            inicio, fin or inicio + timedelta(minutes=serie.duracion_minutos)
+        )
+    regla = update_data.pop("regla", None)
+    horario_cambiado = regla is not None or fin is not None or inicio != serie.inicio or update_data.get("activa")
+    if regla is not None or inicio != serie.inicio:
+        serie.regla, serie.hasta = _validar_regla(regla or serie.regla, inicio)
+        serie.inicio = inicio
+        # Las excepciones de ocurrencias que la nueva regla ya no genera se descartan
+        huerfanas = [
+            e.id for e in db.query(ExcepcionSerie.id, ExcepcionSerie.ocurrencia)
+            .filter(ExcepcionSerie.serie_id == serie.id)
+            if not recurrencia.genera(serie, e.ocurrencia)
+        ]
+        if huerfanas:
+            db.query(ExcepcionSerie).filter(ExcepcionSerie.id.in_(huerfanas)).delete(synchronize_session=False)
+    for field, value in update_data.items():
+        setattr(serie, field, value)
+    
+    if serie.activa and horario_cambiado:
+        canceladas = {
+            o for (o,) in db.query(ExcepcionSerie.ocurrencia)
+            .filter(ExcepcionSerie.serie_id == serie.id, ExcepcionSerie.cancelada == True)
+        }
+        propuestas = conflictos.expandir_serie(
+            serie.regla, serie.inicio, serie.duracion_minutos, serie.id, serie.titulo
+        )
+        _sin_conflictos(conflictos.validar(
+            db, serie.profesora_id, [p for p in propuestas if p[0] not in canceladas],
+            ignorar=lambda clave: clave[:2] == ("serie", serie.id)
+        ), ignorar_conflictos)
+    
+    db.commit()
+    db.refresh(serie)
+    _series_cambiaron(serie.profesora_id)
+    
+    return SerieResponse.model_validate(serie)
+
+@router.delete("/series/{serie_id}")
+async def eliminar_serie(
+    serie_id: int,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    serie = _serie_propia(db, serie_id, current_user)
+    profesora_id = serie.profesora_id
+    eliminar_series(db, [serie.id])
+    db.commit()
+    _series_cambiaron(profesora_id)
+    
+    return {"message": "Serie eliminada exitosamente"}
+
+@router.put("/series/{serie_id}/ocurrencias/{ocurrencia}")
+async def modificar_ocurrencia(
+    serie_id: int,
+    ocurrencia: datetime,
+    excepcion_data: ExcepcionUpdate,
+    ignorar_conflictos: bool = False,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancelar o cambiar una sola ocurrencia (identificada por su inicio original)"""
+    serie = _serie_propia(db, serie_id, current_user)
+    ocurrencia = recurrencia.local(ocurrencia)
+    if not recurrencia.genera(serie, ocurrencia):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La serie no tiene una ocurrencia en esa fecha"
+        )
+    
+    datos = excepcion_data.model_dump()
+    datos["fecha_inicio"] = recurrencia.local(datos["fecha_inicio"])
+    datos["fecha_fin"] = recurrencia.local(datos["fecha_fin"])
+    excepcion = db.query(ExcepcionSerie).filter(
+        ExcepcionSerie.serie_id == serie.id,
+        ExcepcionSerie.ocurrencia == ocurrencia
+    ).first()
+    if excepcion is None:
+        excepcion = ExcepcionSerie(serie_id=serie.id, ocurrencia=ocurrencia)
+        db.add(excepcion)
+    for field, value in datos.items():
+        setattr(excepcion, field, value)
+    
+    # Una ocurrencia movida se valida en su nuevo horario
+    if serie.activa and not excepcion.cancelada and (excepcion.fecha_inicio or excepcion.fecha_fin):
+        nuevo_inicio = excepcion.fecha_inicio or ocurrencia
+        nuevo_fin = excepcion.fecha_fin or nuevo_inicio + timedelta(minutes=serie.duracion_minutos)
+        clave = ("serie", serie.id, ocurrencia)
+        _sin_conflictos(conflictos.validar(
+            db, serie.profesora_id, [(nuevo_inicio, nuevo_fin, clave, excepcion.titulo or serie.titulo)],
+            ignorar=lambda otra: otra == clave
+        ), ignorar_conflictos)
+    
+    db.commit()
+    _series_cambiaron(serie.profesora_id)
+    
+    return {"message": "Ocurrencia actualizada exitosamente"}
+
+@router.delete("/series/{serie_id}/ocurrencias/{ocurrencia}")
+async def restaurar_ocurrencia(
+    serie_id: int,
+    ocurrencia: datetime,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Quitar la excepción: la ocurrencia vuelve a seguir la serie"""
+    serie = _serie_propia(db, serie_id, current_user)
+    db.query(ExcepcionSerie).filter(
+        ExcepcionSerie.serie_id == serie.id,
+        ExcepcionSerie.ocurrencia == recurrencia.local(ocurrencia)
+    ).delete(synchronize_session=False)
+    db.commit()
+    _series_cambiaron(serie.profesora_id)
+    
+    return {"message": "Ocurrencia restaurada"}
+
+# Choques de horario
+@router.get("/conflictos")
+async def get_conflictos(
+    profesora_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Pares de clases u ocurrencias que se cruzan (por defecto desde hoy, 1 año)"""
+    if not current_user.is_admin:
+        profesoras = [current_user.id]
+    elif profesora_id:
+        profesoras = [profesora_id]
+    else:
+        profesoras = sorted(
+            {pid for (pid,) in db.query(Clase.profesora_id).distinct()}
+            | {pid for (pid,) in db.query(SerieClase.profesora_id).distinct()}
+        )
+    
+    desde = recurrencia.local(desde) or datetime.now(pytz.timezone(recurrencia.SERIES_TIMEZONE)).replace(
+        tzinfo=None, hour=0, minute=0, second=0, microsecond=0
+    )
+    hasta = recurrencia.local(hasta) or desde + timedelta(days=365)
+    pares = []
+    for pid in profesoras:
+        pares.extend(conflictos.reporte(db, pid, desde, hasta))
+    
+    return raw_json_response({"desde": desde, "hasta": hasta, "total": len(pares), "conflictos": pares})
+
+@router.post("/conflictos/validar")
+async def validar_horario(
+    horario: ValidarHorario,
+    current_user: Profesora = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Revisar un lote de clases y series propuestas en una pasada, sin guardar nada"""
+    if not current_user.is_admin and horario.profesora_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo puedes revisar tu propio horario"
+        )
+    
+    propuestas = [
+        (c.fecha_inicio, c.fecha_fin, ("lote", i), c.titulo) for i, c in enumerate(horario.clases)
+    ]
+    for serie_data in horario.series:
+        inicio = recurrencia.local(serie_data.fecha_inicio)
+        duracion = _duracion_minutos(inicio, recurrencia.local(serie_data.fecha_fin))
+        regla, _ = _validar_regla(serie_data.regla, inicio)
+        propuestas.extend(conflictos.expandir_serie(regla, inicio, duracion, titulo=serie_data.titulo))
+    
+    choques = conflictos.validar(db, horario.profesora_id, propuestas)
+    return raw_json_response({"total": len(choques), "conflictos": choques})
+
 @router.get("/{clase_id}", response_model=ClaseResponse)
 async def get_clase(
     clase_id: int,
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     clase = db.query(Clase).filter(Clase.id == clase_id).first()
     
@@ -138,6 +629,7 @@ async def get_clase(
 async def actualizar_clase(
     clase_id: int,
     clase_data: ClaseUpdate,
+    ignorar_conflictos: bool = False,
     current_user: Profesora = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -161,8 +653,18 @@ async def actualizar_clase(
     for field, value in update_data.items():
         setattr(clase, field, value)
     
+    # Solo se revisa si cambió el horario o la clase vuelve a estar activa
+    if clase.activa and update_data.keys() & {"fecha_inicio", "fecha_fin", "activa"}:
+        _sin_conflictos(conflictos.validar(
+            db, clase.profesora_id, [(clase.fecha_inicio, clase.fecha_fin, ("clase", clase.id), clase.titulo)],
+            ignorar=lambda clave: clave == ("clase", clase.id)
+        ), ignorar_conflictos)
+    
     db.commit()
     db.refresh(clase)
+    versiones.bump(clase.profesora_id)
+    calendario_ics.invalidar(clase.profesora_id)
+    conflictos.clase_guardada(clase.profesora_id, clase.id, clase.fecha_inicio, clase.fecha_fin, clase.activa, clase.titulo)
     
     return ClaseResponse.model_validate(clase)
 
@@ -187,8 +689,12 @@ async def eliminar_clase(
             detail="No tienes permisos para eliminar esta clase"
         )
     
-    db.delete(clase)
+    profesora_id = clase.profesora_id
+    eliminar_clases(db, [clase.id])
     db.commit()
+    versiones.bump(profesora_id)
+    calendario_ics.invalidar(profesora_id)
+    conflictos.clase_eliminada(profesora_id, clase_id)
     
     return {"message": "Clase eliminada exitosamente"}
 
@@ -197,7 +703,8 @@ async def get_calendario_clases(
     mes: Optional[int] = None,
     anio: Optional[int] = None,
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    cache_headers: dict = Depends(etag_por_profesora)
 ):
     tz = pytz.timezone('America/Bogota')
     if not mes or not anio:
@@ -222,6 +729,12 @@ async def get_calendario_clases(
     if not current_user.is_admin:
         query = query.filter(Clase.profesora_id == current_user.id)
     
-    clases = query.all()
+    clases = query.order_by(Clase.fecha_inicio).all()
+    ocurrencias = [
+        o for o in recurrencia.ocurrencias(
+            db, None if current_user.is_admin else current_user.id, primer_dia, ultimo_dia
+        )
+        if o["activa"]
+    ]
     
-    return [ClaseResponse.model_validate(c) for c in clases]
\ No newline at end of file
+    return [ClaseResponse.model_validate(c) for c in _mezclar(clases, ocurrencias)]
\ No newline at end of file
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends
+import os
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import FileResponse, ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, distinct
+from sqlalchemy import and_
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
-from database import get_db, test_connection
-from models import Profesora, Aprendiz, Clase, Asistencia
-from auth import get_current_user
+from database import get_read_db, pool_metrics
+from models import Profesora, Aprendiz, Clase, Asistencia, Sesion
+from auth import get_current_user, get_current_admin
+from cache import cache
+from compresion import compression_metrics
+import checkin
+import perfilado
+import salud
+import sesiones
 
 router = APIRouter(prefix="", tags=["estadisticas"])
 
+# El dashboard se calcula una vez por alcance y se comparte entre workers; las
+# escrituras lo invalidan por etiqueta y el TTL cubre el paso del tiempo
+# (mes actual, clases de los próximos 7 días)
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+
 class ProfesoraResponse(BaseModel):
     id: int
     nombre: str
@@ -37,18 +52,31 @@ class ClaseResponse(BaseModel):
 
 # Endpoints adicionales de estadísticas y reportes
 @router.get("/estadisticas/dashboard")
-async def get_estadisticas_dashboard(
+def get_estadisticas_dashboard(
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dashboard con estadísticas principales"""
-    
+    # Función síncrona: FastAPI la corre en el threadpool, donde memo puede esperar
+    # el recálculo de otro worker y las consultas no bloquean el event loop
+    if current_user.is_admin:
+        clave, etiqueta = "dashboard:global", "global"
+    else:
+        clave, etiqueta = f"dashboard:{current_user.id}", f"profesora:{current_user.id}"
+    contenido = cache().memo(
+        f"{clave}:{datetime.now().date().isoformat()}",
+        lambda: orjson.dumps(_dashboard(db, current_user)),
+        DASHBOARD_CACHE_TTL,
+        [etiqueta]
+    )
+    return Response(content=contenido, media_type="application/json")
+
+def _dashboard(db: Session, current_user: Profesora) -> dict:
     # Filtros base según permisos
     if current_user.is_admin:
         # Admin ve todo
         aprendices_query = db.query(Aprendiz)
         clases_query = db.query(Clase).filter(Clase.activa == True)
-        asistencias_query = db.query(Asistencia)
     else:
         # Profesora ve solo sus datos
         aprendices_query = db.query(Aprendiz).filter(Aprendiz.profesora_id == current_user.id)
@@ -56,23 +84,38 @@ async def get_estadisticas_dashboard(
             Clase.profesora_id == current_user.id,
             Clase.activa == True
         )
-        asistencias_query = db.query(Asistencia).filter(Asistencia.profesora_id == current_user.id)
+    
+    # Asistencia dispersa: las celdas son aprendiz x sesión de su profesora desde
+    # su asignación, más las filas guardadas fuera de esa zona (ver sesiones.py)
+    celdas_query = aprendices_query.join(
+        Sesion, and_(Sesion.profesora_id == Aprendiz.profesora_id, sesiones.en_asignacion(Sesion.fecha))
+    )
+    fuera_query = aprendices_query.join(Asistencia, Asistencia.aprendiz_id == Aprendiz.id).outerjoin(
+        Sesion,
+        and_(
+            Sesion.profesora_id == Aprendiz.profesora_id,
+            Sesion.fecha == Asistencia.fecha,
+            sesiones.en_asignacion(Sesion.fecha)
+        )
+    ).filter(Sesion.id.is_(None))
+    presentes_query = aprendices_query.join(Asistencia, Asistencia.aprendiz_id == Aprendiz.id).filter(
+        Asistencia.presente == True
+    )
     
     # Conteos básicos
     total_aprendices = aprendices_query.count()
     total_clases = clases_query.count()
-    total_asistencias = asistencias_query.count()
+    total_asistencias = celdas_query.count() + fuera_query.count()
     
     # Estadísticas de asistencia del mes actual
     now = datetime.now()
     primer_dia_mes = datetime(now.year, now.month, 1)
     
-    asistencias_mes = asistencias_query.filter(
-        Asistencia.fecha >= primer_dia_mes.date()
+    total_asistencias_mes = (
+        celdas_query.filter(Sesion.fecha >= primer_dia_mes.date()).count()
+        + fuera_query.filter(Asistencia.fecha >= primer_dia_mes.date()).count()
     )
-    
-    total_asistencias_mes = asistencias_mes.count()
-    presentes_mes = asistencias_mes.filter(Asistencia.presente == True).count()
+    presentes_mes = presentes_query.filter(Asistencia.fecha >= primer_dia_mes.date()).count()
     
     porcentaje_asistencia = 0
     if total_asistencias_mes > 0:
@@ -97,19 +140,89 @@ async def get_estadisticas_dashboard(
             "ausentes": total_asistencias_mes - presentes_mes,
             "porcentaje_asistencia": porcentaje_asistencia
         },
-        "clases_proximas": [ClaseResponse.model_validate(c) for c in clases_proximas]
+        "clases_proximas": [ClaseResponse.model_validate(c).model_dump() for c in clases_proximas]
     }
 
-# Endpoint de salud de la aplicación
+# Endpoints de salud de la aplicación (sirven el resultado cacheado por salud.py)
 @router.get("/health")
 async def health_check():
     """Verificar estado de la aplicación"""
     
-    db_status = "ok" if test_connection() else "error"
+    estado = salud.snapshot()
+    db_status = "ok" if salud.is_ready(estado) else "error"
     
     return {
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
         "database": db_status,
-        "version": "1.0.0"
-    }
\ No newline at end of file
+        "version": "1.0.0",
+        "detalle": salud.publico(estado)
+    }
+
+@router.get("/health/live")
+async def liveness_probe():
+    """El proceso responde (sin tocar la base de datos)"""
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+async def readiness_probe():
+    """Listo para recibir tráfico: último ping a la base exitoso y reciente"""
+    estado = salud.snapshot()
+    listo = salud.is_ready(estado)
+    return ORJSONResponse(
+        status_code=200 if listo else 503,
+        content={"status": "ok" if listo else "error", **salud.publico(estado)}
+    )
+
+@router.get("/estadisticas/compresion")
+async def get_metricas_compresion(current_admin: Profesora = Depends(get_current_admin)):
+    """Tasa de compresión y tiempo de CPU por codificación (solo admin)"""
+    return compression_metrics()
+
+
+@router.get("/estadisticas/pools")
+async def get_metricas_pools(current_admin: Profesora = Depends(get_current_admin)):
+    """Uso y saturación de cada pool de conexiones (solo admin)"""
+    return pool_metrics()
+
+
+@router.get("/estadisticas/salud")
+async def get_detalle_salud(current_admin: Profesora = Depends(get_current_admin)):
+    """Último resultado de salud con los errores de conexión y los pools (solo admin)"""
+    return {**salud.snapshot(), "pools": pool_metrics()}
+
+
+@router.get("/estadisticas/checkin")
+async def get_metricas_checkin(current_admin: Profesora = Depends(get_current_admin)):
+    """Escaneos QR aceptados, duplicados y lotes escritos por este worker (solo admin)"""
+    return checkin.metricas()
+
+
+@router.get("/estadisticas/cache")
+async def get_metricas_cache(current_admin: Profesora = Depends(get_current_admin)):
+    """Aciertos, recálculos y esperas de la caché compartida en este worker (solo admin)"""
+    return cache().metricas()
+
+
+@router.get("/estadisticas/perfiles")
+async def listar_perfiles(current_admin: Profesora = Depends(get_current_admin)):
+    """Capturas de perfilado recientes (solo admin)"""
+    return perfilado.listar()
+
+
+@router.get("/estadisticas/perfiles/{captura_id}")
+async def descargar_perfil(captura_id: str, current_admin: Profesora = Depends(get_current_admin)):
+    """Pilas en formato folded, para speedscope o flamegraph.pl (solo admin)"""
+    ruta = perfilado.ruta_captura(captura_id)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Captura no encontrada")
+    return FileResponse(ruta, media_type="text/plain", filename=f"{captura_id}.folded")
+
+
+@router.get("/estadisticas/perfiles/{captura_id}/resumen")
+async def resumen_perfil(captura_id: str, current_admin: Profesora = Depends(get_current_admin)):
+    """Funciones con más muestras propias y acumuladas (solo admin)"""
+    resultado = perfilado.resumen(captura_id)
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="Captura no encontrada")
+    return resultado
@@ -4,9 +4,16 @@ from typing import List, Optional
 from pydantic import BaseModel
 from passlib.context import CryptContext
 
-from database import get_db
+from database import get_db, get_read_db, get_global_read_db
 from models import Profesora
-from auth import get_current_admin, get_current_user
+from auth import get_current_admin, get_current_user, revoke_refresh_tokens
+from borrado import eliminar_profesora_con_datos
+from serializacion import FAST_JSON, raw_json_response
+import calendario_ics
+import conflictos
+import recurrencia
+import versiones
+from versiones import etag_global
 
 router = APIRouter(prefix="/admin/profesoras", tags=["admin-profesoras"])
 
@@ -33,7 +40,8 @@ class ProfesoraCreate(BaseModel):
 @router.get("/")
 async def listar_profesoras_admin(
     current_admin: Profesora = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_global_read_db),
+    cache_headers: dict = Depends(etag_global)
 ):
     """
     Listar todas las profesoras (incluye inactivas). Solo accesible por admin.
@@ -49,6 +57,8 @@ async def listar_profesoras_admin(
             "is_admin": getattr(p, 'is_admin', False),
             "activa": getattr(p, 'activa', True)
         })
+    if FAST_JSON:
+        return raw_json_response(result, headers=cache_headers)
     return result
 
 # CRUD adicional para profesoras (solo admin)
@@ -81,8 +91,17 @@ async def actualizar_profesora(
     for field, value in update_data.items():
         setattr(profesora, field, value)
     
+    # Al desactivar la cuenta sus dispositivos ya no pueden renovar el access token
+    # y sus URLs de calendario dejan de servir
+    if update_data.get("activa") is False:
+        revoke_refresh_tokens(db, profesora_id=profesora.id)
+        profesora.feed_generacion = (profesora.feed_generacion or 0) + 1
+    
     db.commit()
     db.refresh(profesora)
+    versiones.bump(profesora.id)
+    calendario_ics.invalidar(profesora.id)
+    recurrencia.invalidar(profesora.id)
     
     return {"message": "Profesora actualizada exitosamente"}
 
@@ -103,8 +122,13 @@ async def cambiar_password_profesora(
     
     # Hashear nueva contraseña
     profesora.hashed_password = pwd_context.hash(password_data.nueva_password)
+    # Cambiar la contraseña cierra las sesiones abiertas en otros dispositivos
+    # y revoca las URLs de calendario emitidas
+    revoke_refresh_tokens(db, profesora_id=profesora.id)
+    profesora.feed_generacion = (profesora.feed_generacion or 0) + 1
     
     db.commit()
+    versiones.bump(profesora.id)
     
     return {"message": "Contraseña actualizada exitosamente"}
 
@@ -129,10 +153,15 @@ async def eliminar_profesora(
             detail="No puedes eliminar tu propia cuenta"
         )
     
-    db.delete(profesora)
+    # Aprendices, historial y clases se borran por conjuntos, sin cargarlos
+    eliminados = eliminar_profesora_con_datos(db, profesora.id)
     db.commit()
+    versiones.bump(profesora_id)
+    calendario_ics.invalidar(profesora_id)
+    recurrencia.invalidar(profesora_id)
+    conflictos.invalidar(profesora_id)
     
-    return {"message": "Profesora eliminada exitosamente"}
+    return {"message": "Profesora eliminada exitosamente", "eliminados": eliminados}
 
 
 @router.post("/")
@@ -161,5 +190,6 @@ async def crear_profesora_admin(
     db.add(profesora)
     db.commit()
     db.refresh(profesora)
+    versiones.bump(profesora.id)
 
     return {"message": "Profesora creada exitosamente", "id": profesora.id}
\ No newline at end of file
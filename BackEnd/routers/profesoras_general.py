@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from passlib.context import CryptContext
 
-from database import get_db
+from database import get_db, get_read_db, get_global_read_db
 from models import Profesora
-from auth import get_current_user, create_access_token
+from auth import (
+    get_current_user, create_access_token, create_refresh_token, rotate_refresh_token, revoke_refresh_token
+)
+from serializacion import FAST_JSON, model_list_response, raw_json_response
+import proyeccion
+import admision
+import versiones
+from versiones import etag_global, etag_por_profesora
 
 router = APIRouter(prefix="", tags=["profesoras"])
 
@@ -35,12 +42,19 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 # Endpoints de autenticación
 @router.post("/login")
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, request: Request, db: Session = Depends(get_db)):
+    # Límite por IP y por email antes de consultar la base o calcular bcrypt
+    admision.admitir(request, login_data.email)
     profesora = db.query(Profesora).filter(Profesora.email == login_data.email).first()
     
-    if not profesora or not pwd_context.verify(login_data.password, profesora.hashed_password):
+    if not profesora or not await admision.verificar_password(
+        pwd_context, login_data.email, login_data.password, profesora.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos"
@@ -52,15 +66,37 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             detail="Cuenta inactiva"
         )
     
-    access_token = create_access_token(data={"sub": profesora.email})
+    access_token = create_access_token(data={"sub": profesora.email, "pid": profesora.id})
+    refresh_token = create_refresh_token(db, profesora.id)
+    db.commit()
+    db.refresh(profesora)
     return {
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "profesora": ProfesoraResponse.model_validate(profesora)
     }
 
+@router.post("/token/refresh")
+async def refresh_token(data: RefreshRequest, db: Session = Depends(get_db)):
+    """Nuevo access token a partir de un refresh token (rota el refresh token, sin bcrypt)"""
+    profesora, nuevo_refresh = rotate_refresh_token(db, data.refresh_token)
+    return {
+        "access_token": create_access_token(data={"sub": profesora.email, "pid": profesora.id}),
+        "refresh_token": nuevo_refresh,
+        "token_type": "bearer"
+    }
+
+@router.post("/logout")
+async def logout(data: RefreshRequest, db: Session = Depends(get_db)):
+    """Revocar el refresh token del dispositivo (y los que se rotaron a partir de él)"""
+    if revoke_refresh_token(db, data.refresh_token):
+        db.commit()
+    return {"message": "Sesión cerrada"}
+
 @router.post("/register", response_model=ProfesoraResponse)
-async def register(profesora_data: ProfesoraCreate, db: Session = Depends(get_db)):
+async def register(profesora_data: ProfesoraCreate, request: Request, db: Session = Depends(get_db)):
+    admision.admitir(request)
     # Verificar si el email ya existe
     existing_profesora = db.query(Profesora).filter(Profesora.email == profesora_data.email).first()
     if existing_profesora:
@@ -70,7 +106,7 @@ async def register(profesora_data: ProfesoraCreate, db: Session = Depends(get_db
         )
     
     # Crear nueva profesora
-    hashed_password = pwd_context.hash(profesora_data.password)
+    hashed_password = await admision.hash_password(pwd_context, profesora_data.password)
     profesora = Profesora(
         nombre=profesora_data.nombre,
         email=profesora_data.email,
@@ -81,18 +117,40 @@ async def register(profesora_data: ProfesoraCreate, db: Session = Depends(get_db
     db.add(profesora)
     db.commit()
     db.refresh(profesora)
+    versiones.bump(profesora.id)
     
     return ProfesoraResponse.model_validate(profesora)
 
+# Columnas que admite ?fields= en el listado
+RECURSO_PROFESORA = proyeccion.Recurso(columnas={
+    "id": Profesora.id,
+    "nombre": Profesora.nombre,
+    "email": Profesora.email,
+    "especialidad": Profesora.especialidad,
+    "is_admin": Profesora.is_admin,
+    "activa": Profesora.activa,
+})
+
 # Endpoints de profesoras
 @router.get("/profesoras", response_model=List[ProfesoraResponse])
 async def get_profesoras(
+    campos: Optional[proyeccion.Proyeccion] = Depends(proyeccion.dependencia(RECURSO_PROFESORA)),
     current_user: Profesora = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_global_read_db),
+    cache_headers: dict = Depends(etag_global)
 ):
-    profesoras = db.query(Profesora).filter(Profesora.activa == True).all()
+    query = db.query(Profesora).filter(Profesora.activa == True)
+    if campos is not None:
+        filas = proyeccion.aplicar(query, RECURSO_PROFESORA, campos).all()
+        return raw_json_response(proyeccion.serializar(filas, campos), headers=cache_headers)
+    profesoras = query.all()
+    if FAST_JSON:
+        return model_list_response(ProfesoraResponse, profesoras, headers=cache_headers)
     return [ProfesoraResponse.model_validate(p) for p in profesoras]
 
 @router.get("/me", response_model=ProfesoraResponse)
-async def get_current_profesora(current_user: Profesora = Depends(get_current_user)):
+async def get_current_profesora(
+    current_user: Profesora = Depends(get_current_user),
+    cache_headers: dict = Depends(etag_por_profesora)
+):
     return ProfesoraResponse.model_validate(current_user)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import engine, read_engine, REPLICA_DATABASE_URL
+
+# El ping a la base de datos corre en un hilo de fondo cada HEALTH_INTERVAL
+# segundos; los probes solo leen el último resultado guardado en memoria. Los
+# probes públicos no muestran los mensajes de error (pueden llevar hosts y
+# usuarios de la base); el detalle completo es solo para admin.
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "5"))
+# Un resultado más viejo que esto se considera vencido (el hilo está atascado)
+HEALTH_MAX_AGE = float(os.getenv("HEALTH_MAX_AGE", str(HEALTH_INTERVAL * 3)))
+
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread = None
+_estado = None
+
+
+def _ping(db_engine) -> dict:
+    """SELECT 1 sobre una conexión del pool, midiendo checkout y consulta."""
+    inicio = time.perf_counter()
+    try:
+        with db_engine.connect() as connection:
+            checkout = time.perf_counter()
+            connection.execute(text("SELECT 1"))
+            fin = time.perf_counter()
+        return {
+            "ok": True,
+            "checkout_ms": round((checkout - inicio) * 1000, 3),
+            "consulta_ms": round((fin - checkout) * 1000, 3),
+        }
+    except Exception as e:
+        return {
+            "ok": False,
+            "checkout_ms": round((time.perf_counter() - inicio) * 1000, 3),
+            "error": str(e),
+        }
+
+
+def _replica_lag():
+    """Segundos de retraso de la réplica MySQL (None si no hay réplica o no aplica)."""
+    if not REPLICA_DATABASE_URL or read_engine.dialect.name != "mysql":
+        return None
+    with read_engine.connect() as connection:
+        for consulta, columna in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+        ):
+            try:
+                row = connection.execute(text(consulta)).mappings().first()
+            except Exception:
+                continue
+            if row is not None:
+                return row.get(columna)
+    return None
+
+
+def check_now() -> dict:
+    """Ejecutar una verificación completa y guardar el resultado."""
+    global _estado
+    principal = _ping(engine)
+    bases = {"principal": principal}
+    # Sin réplica el pool de lectura apunta a la misma base: no se hace otro ping
+    if read_engine.url != engine.url:
+        bases["lectura"] = _ping(read_engine)
+
+    try:
+        lag = _replica_lag()
+    except Exception:
+        lag = None
+
+    estado = {
+        "ok": all(b["ok"] for b in bases.values()),
+        "verificado_en": time.time(),
+        "bases": bases,
+        "replica_lag_segundos": lag,
+    }
+    with _lock:
+        _estado = estado
+    return estado
+
+
+def _loop():
+    while True:
+        try:
+            check_now()
+        except Exception as e:  # pragma: no cover - el hilo nunca debe morir
+            print(f"❌ Error en verificación de salud: {e}")
+        if _stop.wait(HEALTH_INTERVAL):
+            break
+
+
+def start():
+    """Arrancar el hilo de verificación (idempotente)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="health-check", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+
+
+def snapshot() -> dict:
+    """Último resultado guardado, con su antigüedad y si está vencido."""
+    with _lock:
+        estado = _estado
+    if estado is None:
+        # Sin hilo de fondo (p.ej. scripts o pruebas): verificar una vez
+        estado = check_now()
+
+    edad = time.time() - estado["verificado_en"]
+    return {
+        **estado,
+        "verificado_en": datetime.fromtimestamp(estado["verificado_en"]).isoformat(),
+        "edad_segundos": round(edad, 3),
+        "vencido": edad > HEALTH_MAX_AGE,
+    }
+
+
+def ultimo_lag():
+    """Retraso de la réplica de la última verificación, sin hacer una nueva."""
+    with _lock:
+        estado = _estado
+    return estado["replica_lag_segundos"] if estado is not None else None
+
+
+def publico(estado: dict) -> dict:
+    """El snapshot sin los mensajes de error, para los probes sin autenticación."""
+    return {
+        **estado,
+        "bases": {
+            nombre: {k: v for k, v in base.items() if k != "error"}
+            for nombre, base in estado["bases"].items()
+        },
+    }
+
+
+def is_ready(estado: dict) -> bool:
+    return estado["ok"] and not estado["vencido"]
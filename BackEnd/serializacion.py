@@ -0,0 +1,42 @@
+import os
+from typing import Any, Dict, List, Optional, Type
+
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+# Ruta rápida de serialización para listados grandes.
+# Activar con FAST_JSON=true en .env: los handlers devuelven la respuesta ya
+# codificada y FastAPI omite la segunda validación contra response_model.
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+
+# TypeAdapters precompilados por esquema (el esquema se compila una sola vez)
+_adapters: Dict[Type[BaseModel], TypeAdapter] = {}
+
+
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """Obtener (o compilar) el TypeAdapter de List[model]."""
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = TypeAdapter(List[model])
+        _adapters[model] = adapter
+    return adapter
+
+
+def model_list_response(
+    model: Type[BaseModel],
+    items: List[Any],
+    headers: Optional[dict] = None
+) -> Response:
+    """Validar objetos ORM una sola vez y codificarlos directamente en pydantic-core."""
+    adapter = list_adapter(model)
+    validated = adapter.validate_python(items, from_attributes=True)
+    return Response(
+        content=adapter.dump_json(validated),
+        media_type="application/json",
+        headers=headers
+    )
+
+
+def raw_json_response(data: Any, headers: Optional[dict] = None) -> Response:
+    """Codificar con orjson dicts ya construidos desde columnas (sin validación)."""
+    return ORJSONResponse(content=data, headers=headers)
@@ -0,0 +1,336 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, case, delete, false, func, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+import archivado
+from models import Aprendiz, Asistencia, Sesion
+
+# Almacenamiento disperso de asistencia.
+#
+# `sesiones` guarda qué días dictó clase cada profesora y `asistencias` solo las
+# marcas de presente. Un aprendiz sin marca en una sesión de su profesora actual,
+# desde su fecha_asignacion (ingreso o última reasignación), está ausente. Las
+# lecturas reconstruyen la matriz completa aprendiz x sesión con tres consultas
+# (aprendices, sesiones, marcas) sin importar cuántas celdas haya.
+#
+# Fuera de esa zona implícita las ausencias se guardan como filas presente=False:
+# al reasignar un aprendiz se materializan las ausencias que tenía con la
+# profesora anterior, y una ausencia marcada antes de la asignación queda como
+# fila. Asistencia.profesora_id es siempre la profesora de la sesión (la del
+# aprendiz en esa fecha). Las filas de ausencia dentro de la zona que existían
+# antes de este esquema se siguen leyendo; `python mantenimiento.py compactar`
+# las elimina.
+
+
+def en_asignacion(fecha):
+    """Condición SQL: `fecha` cae en la zona implícita del aprendiz (usa la tabla Aprendiz)."""
+    return or_(Aprendiz.fecha_asignacion.is_(None), fecha >= Aprendiz.fecha_asignacion)
+
+
+def dentro_de_asignacion(fecha_asignacion: Optional[date], fecha: date) -> bool:
+    """Lo mismo que `en_asignacion`, para un aprendiz ya leído."""
+    return fecha_asignacion is None or fecha >= fecha_asignacion
+
+
+def _insert_ignorando_duplicados(db: Session, tabla):
+    """INSERT que no falla si otra petición ya insertó la misma fila."""
+    dialecto = db.get_bind().dialect.name
+    if dialecto == "mysql":
+        return insert(tabla).prefix_with("IGNORE")
+    if dialecto == "sqlite":
+        return insert(tabla).prefix_with("OR IGNORE")
+    return insert(tabla)
+
+
+def registrar_sesiones(db: Session, pares: Iterable[Tuple[int, date]]) -> Set[Tuple[int, date]]:
+    """Asegurar las sesiones (profesora_id, fecha); devuelve las que no existían."""
+    pares = {(p, f) for p, f in pares if p is not None}
+    if not pares:
+        return set()
+    existentes = set(
+        db.query(Sesion.profesora_id, Sesion.fecha).filter(
+            Sesion.profesora_id.in_({p for p, _ in pares}),
+            Sesion.fecha.in_({f for _, f in pares})
+        )
+    )
+    nuevas = pares - existentes
+    if nuevas:
+        db.execute(
+            _insert_ignorando_duplicados(db, Sesion),
+            [{"profesora_id": p, "fecha": f} for p, f in nuevas]
+        )
+    return nuevas
+
+
+def sesiones_existentes(db: Session, profesora_id: int, fechas: Iterable[date]) -> Set[date]:
+    fechas = set(fechas)
+    if not fechas:
+        return set()
+    return {
+        f for (f,) in db.query(Sesion.fecha).filter(Sesion.profesora_id == profesora_id, Sesion.fecha.in_(fechas))
+    }
+
+
+def fechas_sesion(
+    db: Session,
+    profesora_ids: Iterable[int],
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> Dict[int, List[date]]:
+    """Fechas de sesión por profesora (lectura por el índice único profesora_id, fecha)."""
+    profesora_ids = set(profesora_ids)
+    if not profesora_ids:
+        return {}
+    query = db.query(Sesion.profesora_id, Sesion.fecha).filter(Sesion.profesora_id.in_(profesora_ids))
+    if desde:
+        query = query.filter(Sesion.fecha >= desde)
+    if hasta:
+        query = query.filter(Sesion.fecha <= hasta)
+    resultado = defaultdict(list)
+    for profesora_id, fecha in query.order_by(Sesion.fecha):
+        resultado[profesora_id].append(fecha)
+    return resultado
+
+
+def marcas_guardadas(
+    db: Session,
+    aprendiz_ids: Iterable[int],
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> Dict[Tuple[int, date], Tuple[bool, int, Optional[int]]]:
+    """{(aprendiz_id, fecha): (presente, asistencia_id, profesora_id)} de las filas guardadas.
+
+    Tras compactar solo hay marcas de presente; antes, las filas de ausencia
+    también cuentan (así las fechas anteriores a las sesiones no se pierden).
+    """
+    aprendiz_ids = set(aprendiz_ids)
+    if not aprendiz_ids:
+        return {}
+    query = db.query(
+        Asistencia.aprendiz_id, Asistencia.fecha, Asistencia.presente, Asistencia.id, Asistencia.profesora_id
+    ).filter(Asistencia.aprendiz_id.in_(aprendiz_ids))
+    if desde:
+        query = query.filter(Asistencia.fecha >= desde)
+    if hasta:
+        query = query.filter(Asistencia.fecha <= hasta)
+    return {(aid, f): (bool(presente), asistencia_id, pid) for aid, f, presente, asistencia_id, pid in query}
+
+
+def aplicar_marcas(db: Session, marcas: Dict[Tuple[int, date], Tuple[int, bool]]) -> Tuple[int, int]:
+    """Guardar marcas {(aprendiz_id, fecha): (profesora_del_aprendiz, presente)}.
+
+    Registra las sesiones, inserta las marcas de presente que faltan y, si la
+    celda es implícita, borra las que pasan a ausente; fuera de la zona implícita
+    la ausencia se guarda como fila. Un presente retirado libera la clave de
+    check-in del día. Devuelve (creadas, actualizadas): una celda es nueva si no
+    tenía marca y su sesión no existía. Sin commit.
+    """
+    if not marcas:
+        return 0, 0
+    sesiones_nuevas = registrar_sesiones(db, {(p, f) for (_, f), (p, _) in marcas.items()})
+
+    aprendiz_ids = {aid for aid, _ in marcas}
+    fechas = {f for _, f in marcas}
+    asignaciones = {
+        aid: (profesora_id, fecha_asignacion)
+        for aid, profesora_id, fecha_asignacion in db.query(
+            Aprendiz.id, Aprendiz.profesora_id, Aprendiz.fecha_asignacion
+        ).filter(Aprendiz.id.in_(aprendiz_ids))
+    }
+    actuales = {
+        (aid, f): (asistencia_id, presente)
+        for aid, f, asistencia_id, presente in db.query(
+            Asistencia.aprendiz_id, Asistencia.fecha, Asistencia.id, Asistencia.presente
+        ).filter(Asistencia.aprendiz_id.in_(aprendiz_ids), Asistencia.fecha.in_(fechas))
+    }
+
+    nuevas, a_cambiar, a_borrar, retiradas = [], [], [], []
+    creadas = actualizadas = 0
+    for (aprendiz_id, fecha), (profesora_id, presente) in marcas.items():
+        actual = actuales.get((aprendiz_id, fecha))
+        if actual is not None and actual[1] and not presente:
+            retiradas.append((aprendiz_id, fecha))
+        if actual is None and (profesora_id, fecha) in sesiones_nuevas:
+            creadas += 1
+        else:
+            actualizadas += 1
+        profesora_actual, fecha_asignacion = asignaciones.get(aprendiz_id, (None, None))
+        implicita = profesora_actual == profesora_id and dentro_de_asignacion(fecha_asignacion, fecha)
+        if actual is None:
+            if presente or not implicita:
+                nuevas.append({
+                    "aprendiz_id": aprendiz_id,
+                    "fecha": fecha,
+                    "presente": presente,
+                    "profesora_id": profesora_id
+                })
+        elif not presente and implicita:
+            a_borrar.append(actual[0])
+        elif bool(actual[1]) != presente:
+            a_cambiar.append({"id": actual[0], "presente": presente})
+
+    if nuevas:
+        db.execute(_insert_ignorando_duplicados(db, Asistencia), nuevas)
+    if a_cambiar:
+        db.execute(update(Asistencia), a_cambiar)
+    if a_borrar:
+        db.execute(
+            delete(Asistencia).where(Asistencia.id.in_(a_borrar)).execution_options(synchronize_session=False)
+        )
+    if retiradas:
+        import checkin  # checkin importa este módulo
+        checkin.olvidar(retiradas)
+    return creadas, actualizadas
+
+
+def reasignar(db: Session, cambios: Dict[int, int]) -> Set[int]:
+    """Pasar aprendices a otra profesora {aprendiz_id: profesora_id} sin reescribir su historial.
+
+    Antes del cambio, las ausencias implícitas en las sesiones de la profesora
+    anterior se guardan como filas (un INSERT ... SELECT); así el aprendiz no
+    pierde esas ausencias ni hereda las sesiones previas de la nueva profesora,
+    que cuentan desde hoy. Devuelve las profesoras anteriores. Sin commit.
+    """
+    anteriores = dict(db.query(Aprendiz.id, Aprendiz.profesora_id).filter(Aprendiz.id.in_(set(cambios))))
+    movidos = {aid: pid for aid, pid in cambios.items() if aid in anteriores and anteriores[aid] != pid}
+    if not movidos:
+        return set()
+
+    guardada = aliased(Asistencia)
+    ausencias = (
+        select(Aprendiz.id, Sesion.fecha, false(), Sesion.profesora_id)
+        .select_from(Aprendiz)
+        .join(Sesion, and_(Sesion.profesora_id == Aprendiz.profesora_id, en_asignacion(Sesion.fecha)))
+        .outerjoin(guardada, and_(guardada.aprendiz_id == Aprendiz.id, guardada.fecha == Sesion.fecha))
+        .where(Aprendiz.id.in_(set(movidos)), guardada.id.is_(None))
+    )
+    db.execute(
+        _insert_ignorando_duplicados(db, Asistencia).from_select(
+            ["aprendiz_id", "fecha", "presente", "profesora_id"], ausencias
+        )
+    )
+
+    por_profesora = defaultdict(list)
+    for aid, pid in movidos.items():
+        por_profesora[pid].append(aid)
+    for pid, ids in por_profesora.items():
+        db.execute(
+            update(Aprendiz)
+            .where(Aprendiz.id.in_(ids))
+            .values(profesora_id=pid, fecha_asignacion=date.today())
+            .execution_options(synchronize_session=False)
+        )
+    return {anteriores[aid] for aid in movidos}
+
+
+def expandir(
+    db: Session,
+    aprendices: List[Aprendiz],
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    incluir_archivo: bool = True
+) -> Dict[int, Dict[date, Tuple[bool, Optional[int], Optional[int]]]]:
+    """Matriz completa {aprendiz_id: {fecha: (presente, asistencia_id, profesora_id)}}.
+
+    Cada aprendiz recibe las sesiones de su profesora desde su fecha_asignacion
+    (ausente por defecto) más las filas que tenga guardadas en otras fechas
+    (p.ej. antes de reasignarlo). `aprendices` puede ser una proyección con
+    id, profesora_id y fecha_asignacion.
+    Los años escolares archivados se unen desde Parquet; si una fecha está en
+    ambos lados gana la tabla caliente.
+    """
+    sesiones = fechas_sesion(db, {a.profesora_id for a in aprendices}, desde, hasta)
+    guardadas = marcas_guardadas(db, [a.id for a in aprendices], desde, hasta)
+
+    matriz = {}
+    for aprendiz in aprendices:
+        celdas = {
+            fecha: (False, None, aprendiz.profesora_id)
+            for fecha in sesiones.get(aprendiz.profesora_id, ())
+            if dentro_de_asignacion(aprendiz.fecha_asignacion, fecha)
+        }
+        matriz[aprendiz.id] = celdas
+    if incluir_archivo:
+        for aprendiz_id, fecha, presente, profesora_id in archivado.leer_celdas(matriz.keys(), desde, hasta):
+            matriz[aprendiz_id].setdefault(fecha, (presente, None, profesora_id))
+    for (aprendiz_id, fecha), celda in guardadas.items():
+        matriz[aprendiz_id][fecha] = celda
+    return matriz
+
+
+def compactar(db: Session, lote: int = 10000) -> dict:
+    """Migrar datos densos: fijar la fecha de asignación de los aprendices,
+    crear las sesiones a partir de las filas existentes y borrar las filas de
+    ausencia que pasan a ser implícitas (por lotes, con commit por lote).
+
+    Solo se borra una ausencia si su celda queda cubierta por una sesión de la
+    profesora actual del aprendiz dentro de su zona: el resultado se lee igual.
+    """
+    asignadas = asignar_fechas(db)
+    pares = set(
+        db.query(func.coalesce(Asistencia.profesora_id, Aprendiz.profesora_id), Asistencia.fecha)
+        .join(Aprendiz, Aprendiz.id == Asistencia.aprendiz_id)
+        .distinct()
+    )
+    creadas = registrar_sesiones(db, pares)
+    db.commit()
+
+    borradas = 0
+    while True:
+        ids = [i for (i,) in (
+            db.query(Asistencia.id)
+            .join(Aprendiz, Aprendiz.id == Asistencia.aprendiz_id)
+            .join(Sesion, and_(Sesion.profesora_id == Aprendiz.profesora_id, Sesion.fecha == Asistencia.fecha))
+            .filter(Asistencia.presente == False, en_asignacion(Asistencia.fecha))
+            .limit(lote)
+        )]
+        if not ids:
+            break
+        db.execute(delete(Asistencia).where(Asistencia.id.in_(ids)).execution_options(synchronize_session=False))
+        db.commit()
+        borradas += len(ids)
+    return {"aprendices_asignados": asignadas, "sesiones_creadas": len(creadas), "ausencias_borradas": borradas}
+
+
+def asignar_fechas(db: Session) -> int:
+    """Completar fecha_asignacion en los aprendices anteriores a la columna.
+
+    Se toma la primera fila guardada con su profesora actual (o la primera fila
+    si no hay ninguna); los aprendices sin filas quedan en NULL (todas las
+    sesiones de su profesora). Con commit.
+    """
+    propia = func.coalesce(Asistencia.profesora_id, Aprendiz.profesora_id) == Aprendiz.profesora_id
+    primeras = (
+        db.query(Aprendiz.id, func.min(case((propia, Asistencia.fecha))), func.min(Asistencia.fecha))
+        .join(Asistencia, Asistencia.aprendiz_id == Aprendiz.id)
+        .filter(Aprendiz.fecha_asignacion.is_(None))
+        .group_by(Aprendiz.id)
+        .all()
+    )
+    filas = [{"id": aid, "fecha_asignacion": con_profesora or primera} for aid, con_profesora, primera in primeras]
+    if filas:
+        db.execute(update(Aprendiz), filas)
+    db.commit()
+    return len(filas)
+
+
+def expandir_por_lotes(
+    db: Session,
+    lotes: Iterable[List[Aprendiz]],
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+) -> Dict[int, Dict[date, Tuple[bool, Optional[int], Optional[int]]]]:
+    """Como `expandir`, con una lectura de la base por lote de aprendices.
+
+    Entre lotes el llamador puede cortar (ver cancelacion.py); los años
+    archivados se unen una sola vez al final, con la misma precedencia.
+    """
+    matriz = {}
+    for lote in lotes:
+        matriz.update(expandir(db, lote, desde, hasta, incluir_archivo=False))
+    for aprendiz_id, fecha, presente, profesora_id in archivado.leer_celdas(matriz.keys(), desde, hasta):
+        matriz[aprendiz_id].setdefault(fecha, (presente, None, profesora_id))
+    return matriz
@@ -0,0 +1,99 @@
+"""Sustituto mínimo de un servidor RESP (Redis) en el proceso, para las pruebas.
+
+Implementa solo lo que usa cache.BackendRESP: AUTH, SELECT, GET, MGET, SET
+(PX/NX), DEL e INCR. Un comando desconocido responde con error, como Redis.
+`respuestas_fijas` permite devolver bytes crudos a un comando para probar el
+parser del cliente.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Manejador(socketserver.StreamRequestHandler):
+    def handle(self):
+        servidor = self.server
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            args = []
+            for _ in range(int(linea[1:-2])):
+                largo = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(largo + 2)[:-2])
+            with servidor.lock:
+                servidor.comandos.append(args)
+                respuesta = servidor.responder(args)
+            self.wfile.write(respuesta)
+
+
+class ServidorRESP(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Manejador)
+        self.lock = threading.Lock()
+        self.datos = {}  # clave -> (valor, vence)
+        self.comandos = []
+        self.respuestas_fijas = {}  # comando (str) -> bytes crudos
+
+    @property
+    def url(self) -> str:
+        host, puerto = self.server_address
+        return f"redis://{host}:{puerto}/0"
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+
+    def _vigente(self, clave):
+        guardado = self.datos.get(clave)
+        if guardado is None:
+            return None
+        if guardado[1] is not None and guardado[1] < time.time():
+            del self.datos[clave]
+            return None
+        return guardado[0]
+
+    @staticmethod
+    def _bulk(valor) -> bytes:
+        return b"$-1\r\n" if valor is None else b"$%d\r\n%s\r\n" % (len(valor), valor)
+
+    def responder(self, args) -> bytes:
+        comando = args[0].upper().decode()
+        if comando in self.respuestas_fijas:
+            return self.respuestas_fijas[comando]
+        if comando in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if comando == "GET":
+            return self._bulk(self._vigente(args[1]))
+        if comando == "MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self._vigente(c)) for c in args[1:])
+        if comando == "SET":
+            clave, valor = args[1], args[2]
+            opciones = [a.upper() for a in args[3:]]
+            vence = None
+            if b"PX" in opciones:
+                vence = time.time() + int(opciones[opciones.index(b"PX") + 1]) / 1000
+            if b"NX" in opciones and self._vigente(clave) is not None:
+                return b"$-1\r\n"
+            self.datos[clave] = (valor, vence)
+            return b"+OK\r\n"
+        if comando == "DEL":
+            borradas = sum(1 for c in args[1:] if self.datos.pop(c, None) is not None)
+            return b":%d\r\n" % borradas
+        if comando == "INCR":
+            actual = self._vigente(args[1])
+            try:
+                nuevo = int(actual or 0) + 1
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            vence = self.datos[args[1]][1] if actual is not None else None  # INCR conserva el vencimiento
+            self.datos[args[1]] = (str(nuevo).encode(), vence)
+            return b":%d\r\n" % nuevo
+        return b"-ERR unknown command '%s'\r\n" % args[0]
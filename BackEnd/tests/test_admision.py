@@ -0,0 +1,82 @@
+import ipaddress
+import time
+
+import pytest
+from starlette.requests import Request
+
+import admision
+from cache import BackendCompartido, BackendMemoria, BackendRESP, Cache, set_backend
+from resp_local import ServidorRESP
+
+
+def _peticion(cliente: str, *forwarded: str) -> Request:
+    return Request({
+        "type": "http",
+        "client": (cliente, 50000),
+        "headers": [(b"x-forwarded-for", f.encode()) for f in forwarded],
+    })
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    redes = [ipaddress.ip_network("10.0.0.0/8"), ipaddress.ip_network("127.0.0.1/32")]
+    monkeypatch.setattr(admision, "TRUSTED_PROXIES", redes)
+
+
+def test_ip_sin_proxies_confiables_ignora_forwarded():
+    assert admision._ip_cliente(_peticion("10.0.0.5", "1.2.3.4")) == "10.0.0.5"
+
+
+def test_ip_de_proxy_no_confiable_ignora_forwarded(proxies):
+    assert admision._ip_cliente(_peticion("8.8.8.8", "1.2.3.4")) == "8.8.8.8"
+
+
+def test_ip_tras_proxies_confiables(proxies):
+    # El cliente puede anteponer cualquier cosa: vale el primer salto no confiable desde la derecha
+    peticion = _peticion("127.0.0.1", "6.6.6.6, 1.2.3.4", "10.1.1.1")
+    assert admision._ip_cliente(peticion) == "1.2.3.4"
+
+
+def test_ip_solo_proxies_en_la_cadena(proxies):
+    assert admision._ip_cliente(_peticion("127.0.0.1", "10.0.0.9, 10.0.0.8")) == "10.0.0.9"
+    assert admision._ip_cliente(_peticion("127.0.0.1", "no-es-ip")) == "no-es-ip"
+    assert admision._ip_cliente(_peticion("127.0.0.1")) == "127.0.0.1"
+
+
+@pytest.fixture(params=["memoria", "compartida", "resp"])
+def backend(request, tmp_path):
+    if request.param == "memoria":
+        yield BackendMemoria()
+    elif request.param == "compartida":
+        yield BackendCompartido(str(tmp_path / "cache.sqlite"))
+    else:
+        servidor = ServidorRESP().iniciar()
+        yield BackendRESP(servidor.url)
+        servidor.detener()
+    set_backend(BackendMemoria())
+
+
+def test_cache_bucket_store_compartido_entre_workers(backend):
+    set_backend(backend)
+    workers = [admision.CacheBucketStore(), admision.CacheBucketStore()]
+    esperas = [workers[i % 2].tomar("ip:1.2.3.4", 5, 5 / 60) for i in range(6)]
+    assert esperas[:5] == [0.0] * 5
+    assert 0 < esperas[5] <= 60
+    assert workers[0].tomar("ip:5.6.7.8", 5, 5 / 60) == 0.0
+
+
+def test_cache_bucket_store_sin_backend_cuenta_el_proceso():
+    set_backend(BackendRESP("redis://127.0.0.1:1/0"))
+    try:
+        store = admision.CacheBucketStore()
+        assert [store.tomar("ip:x", 2, 1 / 60) == 0.0 for _ in range(3)] == [True, True, False]
+    finally:
+        set_backend(BackendMemoria())
+
+
+def test_incr_con_vencimiento(backend):
+    c = Cache(backend)
+    assert c.incr("n", ttl=0.05) == 1
+    assert c.incr("n", ttl=0.05) == 2
+    time.sleep(0.1)
+    assert c.incr("n", ttl=0.05) == 1
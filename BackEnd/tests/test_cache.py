@@ -0,0 +1,249 @@
+import io
+import threading
+import time
+
+import pytest
+
+from cache import BackendCompartido, BackendMemoria, BackendRESP, Cache, ErrorCache, _ErrorRespuesta
+from resp_local import ServidorRESP
+
+
+@pytest.fixture
+def servidor():
+    servidor = ServidorRESP().iniciar()
+    yield servidor
+    servidor.detener()
+
+
+@pytest.fixture
+def resp(servidor):
+    return BackendRESP(servidor.url)
+
+
+@pytest.fixture
+def compartido(tmp_path):
+    return BackendCompartido(str(tmp_path / "cache.sqlite"))
+
+
+class Contador:
+    """calcular() para memo que cuenta sus llamadas y devuelve v1, v2, ..."""
+
+    def __init__(self, espera: float = 0, durante=None):
+        self.llamadas = 0
+        self.espera = espera
+        self.durante = durante
+        self._lock = threading.Lock()
+
+    def __call__(self) -> bytes:
+        with self._lock:
+            self.llamadas += 1
+            numero = self.llamadas
+        if self.durante is not None:
+            self.durante()
+        time.sleep(self.espera)
+        return b"v%d" % numero
+
+
+# === memo ===
+
+@pytest.mark.parametrize("backend", ["memoria", "resp"])
+def test_memo_reutiliza_hasta_invalidar(backend, request):
+    c = Cache(BackendMemoria() if backend == "memoria" else request.getfixturevalue("resp"))
+    calcular = Contador()
+
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v1"
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v1"
+    assert calcular.llamadas == 1
+
+    c.invalidar("t")
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v2"
+    assert calcular.llamadas == 2
+
+
+def test_memo_invalidar_otra_etiqueta_no_afecta():
+    c = Cache(BackendMemoria())
+    calcular = Contador()
+    c.memo("k", calcular, etiquetas=["a"])
+    c.invalidar("b")
+    assert c.memo("k", calcular, etiquetas=["a"]) == b"v1"
+    assert calcular.llamadas == 1
+
+
+def test_memo_invalidacion_durante_el_recalculo():
+    c = Cache(BackendMemoria())
+    # Una escritura llega mientras se calcula: el valor se entrega, pero nace vencido
+    calcular = Contador(durante=lambda: c.invalidar("t"))
+
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v1"
+    calcular.durante = None
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v2"
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v2"
+    assert calcular.llamadas == 2
+
+
+def test_memo_un_solo_recalculo_por_proceso():
+    c = Cache(BackendMemoria())
+    calcular = Contador(espera=0.2)
+    resultados = []
+
+    def leer():
+        resultados.append(c.memo("k", calcular, etiquetas=["t"]))
+
+    hilos = [threading.Thread(target=leer) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert resultados == [b"v1"] * 8
+    assert calcular.llamadas == 1
+    assert c.metricas()["en_vuelo"] == 0
+
+
+def test_memo_otro_worker_espera_el_resultado(servidor):
+    # Dos fachadas sobre el mismo servidor hacen de dos workers
+    lider, seguidor = Cache(BackendRESP(servidor.url)), Cache(BackendRESP(servidor.url))
+    calcular_lider = Contador(espera=0.3)
+    calcular_seguidor = Contador()
+    hilo = threading.Thread(target=lider.memo, args=("k", calcular_lider), kwargs={"etiquetas": ["t"]})
+    hilo.start()
+    time.sleep(0.1)  # el líder ya tomó el candado
+
+    assert seguidor.memo("k", calcular_seguidor, etiquetas=["t"]) == b"v1"
+    hilo.join()
+    assert calcular_lider.llamadas == 1
+    assert calcular_seguidor.llamadas == 0
+    assert seguidor.metricas()["esperas"] == 1
+    assert lider.get("candado:k") is None
+
+
+def test_memo_sin_backend_calcula_sin_fallar():
+    c = Cache(BackendRESP("redis://127.0.0.1:1/0"))
+    calcular = Contador()
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v1"
+    assert c.memo("k", calcular, etiquetas=["t"]) == b"v2"
+    assert c.metricas()["errores"] >= 2
+
+
+# === BackendCompartido ===
+
+def test_compartido_add_solo_si_no_existe(compartido):
+    assert compartido.add("k", b"a") is True
+    assert compartido.add("k", b"b") is False
+    assert compartido.get("k") == b"a"
+
+
+def test_compartido_add_reemplaza_una_entrada_vencida(compartido):
+    assert compartido.add("k", b"a", ttl=0.05) is True
+    assert compartido.add("k", b"b", ttl=0.05) is False
+    time.sleep(0.1)
+    assert compartido.get("k") is None
+    assert compartido.add("k", b"b") is True
+    assert compartido.get("k") == b"b"
+
+
+def test_compartido_incr(compartido):
+    assert compartido.incr("n") == 1
+    assert compartido.incr("n") == 2
+    assert compartido.get_many(["n", "falta"]) == [2, None]
+
+
+def test_compartido_incr_entre_workers_e_hilos(tmp_path):
+    ruta = str(tmp_path / "cache.sqlite")
+    workers = [BackendCompartido(ruta), BackendCompartido(ruta)]
+
+    def sumar(backend):
+        for _ in range(50):
+            backend.incr("n")
+
+    hilos = [threading.Thread(target=sumar, args=(workers[i % 2],)) for i in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert workers[0].incr("n") == 201
+
+
+def test_compartido_etiquetas_con_cache(compartido):
+    c = Cache(compartido)
+    assert c.etiquetas(["t"]) == [0]
+    assert c.invalidar("t", "t") == {"t": 1}
+    assert c.etiquetas(["t"]) == [1]
+
+
+# === BackendRESP ===
+
+def _leer(datos: bytes):
+    return BackendRESP("redis://127.0.0.1:1/0")._leer(io.BytesIO(datos))
+
+
+@pytest.mark.parametrize("datos, esperado", [
+    (b"+OK\r\n", "OK"),
+    (b":42\r\n", 42),
+    (b"$-1\r\n", None),
+    (b"*-1\r\n", None),
+    (b"$0\r\n\r\n", b""),
+    (b"$4\r\na\r\nb\r\n", b"a\r\nb"),
+    (b"*0\r\n", []),
+    (b"*3\r\n$1\r\na\r\n$-1\r\n*1\r\n:5\r\n", [b"a", None, [5]]),
+])
+def test_leer(datos, esperado):
+    assert _leer(datos) == esperado
+
+
+def test_leer_error_del_servidor():
+    with pytest.raises(_ErrorRespuesta, match="ERR boom"):
+        _leer(b"-ERR boom\r\n")
+    with pytest.raises(_ErrorRespuesta):
+        _leer(b"*2\r\n:1\r\n-ERR en el arreglo\r\n")
+
+
+def test_leer_conexion_cerrada_o_respuesta_invalida():
+    with pytest.raises(ErrorCache, match="cerrada"):
+        _leer(b"")
+    with pytest.raises(ErrorCache, match="inesperada"):
+        _leer(b"?raro\r\n")
+
+
+def test_resp_operaciones(resp):
+    assert resp.get("falta") is None
+    resp.set("k", b"v")
+    assert resp.get("k") == b"v"
+    assert resp.get_many(["k", "falta"]) == [b"v", None]
+    assert resp.add("k", b"otro") is False
+    assert resp.add("nuevo", b"x", ttl=0.05) is True
+    time.sleep(0.1)
+    assert resp.get("nuevo") is None
+    assert resp.incr("n") == 1
+    assert resp.incr("n") == 2
+    resp.delete("k", "n")
+    assert resp.get_many(["k", "n"]) == [None, None]
+
+
+def test_resp_error_del_servidor_conserva_la_conexion(servidor, resp):
+    with pytest.raises(_ErrorRespuesta, match="unknown command"):
+        resp.comando("NOEXISTE")
+    assert len(resp._libres) == 1
+    assert resp.get("k") is None
+    assert len(resp._libres) == 1
+
+
+def test_resp_error_en_incr_se_reporta_por_etiqueta(servidor, resp):
+    c = Cache(resp, prefijo="")
+    resp.set("etiqueta:t", b"no-numero")
+    assert c.invalidar("t", "u") == {"t": None, "u": 1}
+    assert c.metricas()["errores"] == 1
+
+
+def test_resp_respuesta_nula_en_set_nx(servidor, resp):
+    servidor.respuestas_fijas["SET"] = b"$-1\r\n"
+    assert resp.add("k", b"v") is False
+
+
+def test_resp_sin_respuesta_descarta_la_conexion(servidor, resp):
+    resp.set("k", b"v")
+    servidor.respuestas_fijas["GET"] = b""  # el servidor no contesta: vence CACHE_TIMEOUT_MS
+    with pytest.raises(ErrorCache):
+        resp.get("k")
+    assert resp._libres == []
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import cache
+import idempotencia
+from cache import BackendCompartido
+from idempotencia import IdempotencyMiddleware
+
+
+class App:
+    """Endpoint ASGI que cuenta sus ejecuciones y tarda `espera` segundos."""
+
+    def __init__(self, espera: float = 0, status: int = 200):
+        self.llamadas = 0
+        self.espera = espera
+        self.status = status
+
+    async def __call__(self, scope, receive, send):
+        self.llamadas += 1
+        numero = self.llamadas
+        await receive()
+        await asyncio.sleep(self.espera)
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"n": %d}' % numero})
+
+
+async def _post(app, cuerpo: bytes, clave: str = "k1"):
+    scope = {
+        "type": "http", "method": "POST", "path": "/asistencia/",
+        "headers": [(b"authorization", b"Bearer t"), (b"idempotency-key", clave.encode())],
+    }
+    mensajes = [{"type": "http.request", "body": cuerpo, "more_body": False}]
+
+    async def receive():
+        return mensajes.pop(0) if mensajes else {"type": "http.disconnect"}
+
+    enviados = []
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    await app(scope, receive, send)
+    inicio = enviados[0]
+    cuerpo = b"".join(m.get("body", b"") for m in enviados[1:])
+    return inicio["status"], dict(inicio["headers"]), cuerpo
+
+
+@pytest.fixture
+def compartida(tmp_path, monkeypatch):
+    # Dos middlewares sobre la misma caché compartida hacen de dos workers
+    anterior = cache._cache
+    cache.set_backend(BackendCompartido(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(idempotencia, "CACHE_BACKEND", "compartida")
+    monkeypatch.setattr(idempotencia, "store", idempotencia.IdempotencyStore())
+    yield
+    cache._cache = anterior
+
+
+def test_duplicado_en_otro_worker_espera_y_reproduce(compartida):
+    app = App(espera=0.3)
+    worker1, worker2 = IdempotencyMiddleware(app), IdempotencyMiddleware(app)
+
+    async def ambos():
+        primera = asyncio.create_task(_post(worker1, b"{}"))
+        await asyncio.sleep(0.1)
+        return await primera, await _post(worker2, b"{}")
+
+    (s1, h1, b1), (s2, h2, b2) = asyncio.run(ambos())
+    assert app.llamadas == 1
+    assert (s1, b1) == (s2, b2) == (200, b'{"n": 1}')
+    assert b"idempotent-replayed" not in h1
+    assert h2[b"idempotent-replayed"] == b"true"
+    assert not idempotencia.store._entries
+
+
+def test_otra_peticion_con_la_misma_clave_se_rechaza(compartida):
+    app = App()
+    asyncio.run(_post(IdempotencyMiddleware(app), b'{"a": 1}'))
+    status, _, _ = asyncio.run(_post(IdempotencyMiddleware(app), b'{"a": 2}'))
+    assert status == 422
+    assert app.llamadas == 1
+
+
+def test_error_libera_la_clave(compartida):
+    app = App(status=503)
+    asyncio.run(_post(IdempotencyMiddleware(app), b"{}"))
+    asyncio.run(_post(IdempotencyMiddleware(app), b"{}"))
+    assert app.llamadas == 2
+
+
+def test_sin_backend_usa_el_almacen_del_proceso(monkeypatch):
+    anterior = cache._cache
+    cache.set_backend(cache.BackendRESP("redis://127.0.0.1:1/0"))
+    monkeypatch.setattr(idempotencia, "CACHE_BACKEND", "resp")
+    monkeypatch.setattr(idempotencia, "store", idempotencia.IdempotencyStore())
+    try:
+        app = App()
+        asyncio.run(_post(IdempotencyMiddleware(app), b"{}"))
+        status, headers, _ = asyncio.run(_post(IdempotencyMiddleware(app), b"{}"))
+    finally:
+        cache._cache = anterior
+    assert app.llamadas == 1
+    assert headers[b"idempotent-replayed"] == b"true"
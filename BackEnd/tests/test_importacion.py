@@ -0,0 +1,96 @@
+import io
+import zipfile
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import importacion
+from importacion import ArchivoInvalido, expandir_archivos, importar_hoja, leer_hoja
+from models import Aprendiz, Asistencia, Base, Profesora, Sesion
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'prueba.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _claves_foraneas(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+    sesion.add(Profesora(id=1, nombre="Ana", email="ana@x.com", hashed_password="x", especialidad="y"))
+    sesion.add(Aprendiz(id=1, nombre="E1", profesora_id=1, fecha_asignacion=date(2026, 1, 1)))
+    sesion.commit()
+    yield sesion
+    sesion.close()
+    engine.dispose()
+
+
+def _importar(db, csv: str, simular: bool, chunk_size: int = 1) -> dict:
+    hoja = leer_hoja(io.BytesIO(csv.encode()), "lista.csv", chunk_size=chunk_size)
+    return importar_hoja(db, 1, hoja, simular=simular)
+
+
+@pytest.mark.parametrize("csv", [
+    # Un aprendiz nuevo crea la sesión; la ausencia de E1 en el bloque siguiente es implícita
+    "Nombre,2026-03-02\nNUEVO,1\nE1,0\n",
+    # El mismo aprendiz nuevo repetido en otro bloque: se crea una sola vez y gana la última fila
+    "Nombre,DOCUMENTO,2026-03-02,2026-03-03\nNUEVO,77,1,0\nE1,,1,1\nNUEVO,77,0,0\nOTRO,,0,1\n",
+    "Nombre,2026-03-02,2026-03-03\nE1,1,1\nE1,0,1\nE1,1,0\n",
+])
+@pytest.mark.parametrize("chunk_size", [1, 2, 500])
+def test_simulacion_y_importacion_dan_el_mismo_plan(db, csv, chunk_size):
+    simulacion = _importar(db, csv, simular=True, chunk_size=chunk_size)
+    assert db.query(Aprendiz).count() == 1
+    assert db.query(Sesion).count() == 0
+
+    importacion = _importar(db, csv, simular=False, chunk_size=chunk_size)
+    db.commit()
+    assert importacion == simulacion
+
+    # Otra vez sobre los datos ya importados (las filas repetidas vuelven a cambiar celdas)
+    simulacion = _importar(db, csv, simular=True, chunk_size=chunk_size)
+    importacion = _importar(db, csv, simular=False, chunk_size=chunk_size)
+    assert importacion == simulacion
+    assert importacion["aprendices_creados"] == 0
+
+
+def test_aprendiz_repetido_entre_bloques(db):
+    csv = "Nombre,DOCUMENTO,2026-03-02\nNUEVO,77,1\nE1,,0\nNUEVO,77,0\n"
+    simulacion = _importar(db, csv, simular=True)
+    importacion = _importar(db, csv, simular=False)
+    db.commit()
+    assert simulacion["aprendices_creados"] == importacion["aprendices_creados"] == 1
+    nuevo = db.query(Aprendiz).filter(Aprendiz.documento == "77").one()
+    # La última fila deja la celda ausente: implícita, sin fila guardada
+    assert db.query(Asistencia).filter(Asistencia.aprendiz_id == nuevo.id).count() == 0
+
+
+def _zip(**miembros) -> io.BytesIO:
+    contenido = io.BytesIO()
+    with zipfile.ZipFile(contenido, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nombre, datos in miembros.items():
+            zf.writestr(nombre, datos)
+    return contenido
+
+
+def test_expandir_lee_cada_hoja_al_pedirla():
+    entradas = expandir_archivos([("lote.zip", _zip(**{"1_a.csv": b"a", "1_b.csv": b"b"})), ("2_c.csv", io.BytesIO(b"c"))])
+    assert [(nombre, leer()) for nombre, leer in entradas] == [("1_a.csv", b"a"), ("1_b.csv", b"b"), ("2_c.csv", b"c")]
+
+
+def test_expandir_rechaza_miembros_y_lotes_grandes_sin_descomprimir(monkeypatch):
+    monkeypatch.setattr(importacion, "IMPORT_MAX_BYTES", 100)
+    with pytest.raises(ArchivoInvalido) as error:
+        expandir_archivos([("lote.zip", _zip(**{"1_a.csv": b"0" * 101}))])
+    assert error.value.status_code == 413
+    with pytest.raises(ArchivoInvalido):
+        expandir_archivos([("1_a.csv", io.BytesIO(b"0" * 101))])
+
+    monkeypatch.setattr(importacion, "IMPORT_MAX_UNCOMPRESSED_BYTES", 150)
+    with pytest.raises(ArchivoInvalido) as error:
+        expandir_archivos([("lote.zip", _zip(**{"1_a.csv": b"0" * 80})), ("1_b.csv", io.BytesIO(b"0" * 80))])
+    assert "lote" in error.value.detail
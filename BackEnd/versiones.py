@@ -0,0 +1,137 @@
+import hashlib
+import secrets
+import threading
+import time
+from datetime import date
+from email.utils import formatdate
+
+from fastapi import Depends, HTTPException, Request, Response, status
+
+from auth import get_current_user
+from cache import cache
+
+# Contadores de versión de datos por alcance: "global" y "profesora:<id>".
+# Toda escritura en los routers incrementa "global" y los alcances de las
+# profesoras afectadas; las lecturas derivan su ETag de esos contadores y
+# responden 304 sin ejecutar la consulta cuando el cliente ya tiene la versión.
+#
+# Los contadores son etiquetas de cache.py: viven en el backend compartido, así
+# que todos los workers ven la misma versión, y la misma escritura invalida las
+# entradas de caché etiquetadas con esos alcances. El epoch se fija una vez en el
+# backend (con la caché en memoria, uno por proceso): un ETag emitido contra otros
+# contadores nunca coincide por accidente.
+_EPOCH_LOCAL = secrets.token_hex(8)
+_INICIO = time.time()
+
+_lock = threading.Lock()
+_epoch = None
+
+
+def _epoch_compartido() -> str:
+    global _epoch
+    if _epoch is None:
+        cache().add("versiones:epoch", _EPOCH_LOCAL.encode())
+        valor = cache().get("versiones:epoch")
+        if valor is None:
+            return _EPOCH_LOCAL  # backend caído: se reintenta en la próxima petición
+        with _lock:
+            _epoch = valor.decode()
+    return _epoch
+
+
+def _alcance_profesora(profesora_id: int) -> str:
+    return f"profesora:{profesora_id}"
+
+
+def bump(*profesora_ids):
+    """Registrar una escritura: incrementa el alcance global y el de cada profesora afectada."""
+    alcances = ["global"] + [_alcance_profesora(pid) for pid in set(profesora_ids) if pid is not None]
+    cache().invalidar(*alcances)
+    ahora = repr(time.time()).encode()
+    for alcance in alcances:
+        cache().set(f"modificado:{alcance}", ahora, ttl=None)
+
+
+def version(alcance: str):
+    """Versión actual y fecha de última modificación de un alcance.
+
+    Si el backend de caché no responde, la versión es única por llamada: ningún
+    ETag coincide y las lecturas se ejecutan completas.
+    """
+    numeros = cache().etiquetas([alcance])
+    if numeros is None:
+        return f"x{secrets.token_hex(4)}", time.time()
+    modificado = cache().get(f"modificado:{alcance}")
+    return numeros[0], float(modificado) if modificado is not None else _INICIO
+
+
+def escrito_hace(alcance: str):
+    """Segundos desde la última escritura del alcance (None si no se conoce)."""
+    modificado = cache().get(f"modificado:{alcance}")
+    if modificado is None:
+        return None
+    return time.time() - float(modificado)
+
+
+def _resolver_alcance(request: Request, user, alcance: str) -> str:
+    if alcance == "global":
+        return "global"
+    if not getattr(user, 'is_admin', False):
+        return _alcance_profesora(user.id)
+    profesora_id = request.query_params.get("profesora_id")
+    if profesora_id and profesora_id.isdigit():
+        return _alcance_profesora(int(profesora_id))
+    return "global"
+
+
+def _etag_coincide(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    valor = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == valor:
+            return True
+    return False
+
+
+def conditional_get(alcance: str = "profesora"):
+    """Dependencia de GET condicional.
+
+    Calcula el ETag a partir del contador del alcance, el usuario y la URL,
+    y lanza 304 antes de que se ejecute el handler si coincide con If-None-Match.
+    Devuelve los encabezados de caché para los handlers que construyen su
+    propia Response (ruta rápida, StreamingResponse).
+    """
+    def dependencia(
+        request: Request,
+        response: Response,
+        current_user=Depends(get_current_user)
+    ) -> dict:
+        clave = _resolver_alcance(request, current_user, alcance)
+        numero, modificado = version(clave)
+
+        # La fecha del día entra en la huella: algunas vistas dependen de "hoy"
+        raw = f"{_epoch_compartido()}:{clave}:{numero}:{current_user.id}:{date.today().isoformat()}:{request.url.path}?{request.url.query}"
+        etag = 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24]
+
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(modificado, usegmt=True),
+            "Cache-Control": "private, no-cache",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_coincide(if_none_match, etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response.headers.update(headers)
+        return headers
+
+    return dependencia
+
+
+etag_por_profesora = conditional_get("profesora")
+etag_global = conditional_get("global")
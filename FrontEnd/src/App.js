@@ -7,6 +7,7 @@ import AprendicesManagement from './components/AprendicesManagement';
 import Calendario from './components/Calendario';
 import Navbar from './components/Navbar';
 import AsistenciaModule from './components/AsistenciaModule';
+import { revokeRefreshToken } from './utils/api';
 import './App.css';
 
 function App() {
@@ -32,7 +33,9 @@ function App() {
   };
 
   const handleLogout = () => {
+    revokeRefreshToken();
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
     setUser(null);
     setToken(null);
@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Users, Edit, Trash2, UserPlus, Search, FileText } from 'lucide-react';
-import { authenticatedFetch } from '../utils/api';
+import { authenticatedFetch, batchGet } from '../utils/api';
 
 const AprendicesManagement = ({ user }) => {
   const [aprendices, setAprendices] = useState([]);
@@ -19,11 +19,50 @@ const AprendicesManagement = ({ user }) => {
   });
   const [errors, setErrors] = useState({});
 
+  const montado = useRef(false);
+
+  useEffect(() => {
+    cargarInicial();
+  }, []);
+
   useEffect(() => {
+    // Al montar, los aprendices llegan en el lote de cargarInicial; las profesoras
+    // no dependen del filtro y no se vuelven a pedir
+    if (!montado.current) {
+      montado.current = true;
+      return;
+    }
     fetchAprendices();
-    fetchProfesoras();
   }, [selectedProfesora]);
 
+  // Aprendices y profesoras en una sola petición
+  const cargarInicial = async () => {
+    try {
+      setLoading(true);
+      const respuestas = await batchGet({
+        aprendices: '/aprendices',
+        profesoras: user?.is_admin ? '/admin/profesoras/' : '/profesoras'
+      });
+      if (respuestas.aprendices.status === 200) {
+        setAprendices(respuestas.aprendices.body);
+      } else {
+        console.error('Error fetching aprendices:', respuestas.aprendices.body);
+      }
+      if (respuestas.profesoras.status === 200) {
+        setProfesoras(respuestas.profesoras.body);
+      } else {
+        console.error('Error fetching profesoras:', respuestas.profesoras.body);
+      }
+    } catch (error) {
+      // Sin /batch (p. ej. un backend anterior): una petición por recurso
+      console.error('Error en la carga inicial:', error);
+      fetchAprendices();
+      fetchProfesoras();
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const fetchAprendices = async () => {
     try {
       setLoading(true);
@@ -261,7 +261,7 @@ const AsistenciaList = ({ token }) => {
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
                 {asistencias.map((asistencia) => (
-                  <tr key={asistencia.id} className="hover:bg-gray-50">
+                  <tr key={`${asistencia.aprendiz_id}-${asistencia.fecha}`} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div className="flex items-center">
                         <div className="bg-indigo-100 h-10 w-10 rounded-full flex items-center justify-center">
@@ -289,8 +289,9 @@ const AsistenciaList = ({ token }) => {
                         onChange={async (e) => {
                           const nuevoEstado = e.target.checked;
                           try {
-                            const response = await fetch(`${API_BASE_URL}/asistencia/${asistencia.id}`, {
-                              method: 'PATCH',
+                            // Por celda: las ausencias implícitas no tienen id
+                            const response = await fetch(`${API_BASE_URL}/asistencia/celda/${asistencia.aprendiz_id}/${asistencia.fecha}`, {
+                              method: 'PUT',
                               headers: {
                                 'Content-Type': 'application/json',
                                 'Authorization': `Bearer ${token}`,
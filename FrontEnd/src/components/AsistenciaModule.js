@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Plus, CheckCircle, XCircle, Search, Filter } from 'lucide-react';
-import { authenticatedFetch } from '../utils/api';
+import { authenticatedFetch, batchGet } from '../utils/api';
 import { formatDate } from '../utils/dateUtils';
 import AsistenciaForm from './AsistenciaForm';
 import { asistenciaService } from './AsistenciaService';
@@ -24,16 +24,56 @@ const AsistenciaModule = ({ token }) => {
   const [file, setFile] = useState(null);
   const [nombreLista, setNombreLista] = useState("");
 
+  const montado = useRef(false);
+
   useEffect(() => {
-    fetchAsistencias();
-    fetchProfesoras();
-    cargarResumen();
+    cargarInicial();
   }, []);
 
   useEffect(() => {
+    // Al montar, las asistencias llegan en el lote de cargarInicial
+    if (!montado.current) {
+      montado.current = true;
+      return;
+    }
     fetchAsistencias();
   }, [filters]);
 
+  // Asistencias, profesoras y resumen de aprendices en una sola petición
+  const cargarInicial = async () => {
+    try {
+      setLoading(true);
+      const respuestas = await batchGet({
+        asistencias: '/asistencia/',
+        profesoras: '/profesoras',
+        resumen: '/asistencia/listas/'
+      });
+      if (respuestas.asistencias.status === 200) {
+        setAsistencias(respuestas.asistencias.body || []);
+      } else {
+        console.error('Error fetching asistencias:', respuestas.asistencias.body);
+      }
+      if (respuestas.profesoras.status === 200) {
+        setProfesoras(respuestas.profesoras.body || []);
+      } else {
+        console.error('Error fetching profesoras:', respuestas.profesoras.body);
+      }
+      if (respuestas.resumen.status === 200) {
+        setAprendices(respuestas.resumen.body || []);
+      } else {
+        console.error('Error fetching resumen:', respuestas.resumen.body);
+      }
+    } catch (error) {
+      // Sin /batch (p. ej. un backend anterior): una petición por recurso
+      console.error('Error en la carga inicial:', error);
+      fetchAsistencias();
+      fetchProfesoras();
+      cargarResumen();
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const fetchAsistencias = async () => {
     try {
       setLoading(true);
@@ -312,7 +352,7 @@ const AsistenciaModule = ({ token }) => {
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
                 {asistencias.map((asistencia) => (
-                  <tr key={asistencia.id} className="hover:bg-gray-50">
+                  <tr key={`${asistencia.aprendiz_id}-${asistencia.fecha}`} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div className="flex items-center">
                         <div className="bg-indigo-100 h-10 w-10 rounded-full flex items-center justify-center">
@@ -352,8 +392,8 @@ const AsistenciaModule = ({ token }) => {
                             // Llamar al servicio para togglear y actualizar estado local
                             try {
                               await asistenciaService.toggleAsistencia(asistencia.aprendiz_id || asistencia.aprendiz?.id, asistencia.fecha, !asistencia.presente);
-                              // Actualizar lista de asistencias
-                              setAsistencias(prev => prev.map(a => a.id === asistencia.id ? { ...a, presente: !a.presente } : a));
+                              // Actualizar lista de asistencias (las ausencias no tienen id: se identifican por aprendiz y fecha)
+                              setAsistencias(prev => prev.map(a => a.aprendiz_id === asistencia.aprendiz_id && a.fecha === asistencia.fecha ? { ...a, presente: !a.presente } : a));
                               // Actualizar resumen de aprendices si corresponde
                               setAprendices(prev => prev.map(p => {
                                 if (p.id === (asistencia.aprendiz_id || asistencia.aprendiz?.id)) {
@@ -88,11 +88,23 @@ const Calendario = ({ token, user }) => {
     }
   };
 
-  const handleCreateClase = async (claseData) => {
+  // Las ocurrencias de series no tienen id: se identifican por la serie y su inicio original
+  const claveClase = (clase) => (
+    clase.id != null ? `clase-${clase.id}` : `serie-${clase.serie_id}-${clase.ocurrencia}`
+  );
+
+  const urlClase = (clase) => (
+    clase.id != null
+      ? `${API_BASE_URL}/clases/${clase.id}`
+      : `${API_BASE_URL}/clases/series/${clase.serie_id}/ocurrencias/${encodeURIComponent(clase.ocurrencia)}`
+  );
+
+  const handleCreateClase = async (claseData, ignorarConflictos = false) => {
     try {
-      const url = editingClase 
-        ? `${API_BASE_URL}/clases/${editingClase.id}` 
+      const base = editingClase 
+        ? urlClase(editingClase) 
         : `${API_BASE_URL}/clases`;
+      const url = ignorarConflictos ? `${base}?ignorar_conflictos=true` : base;
       
       const method = editingClase ? 'PUT' : 'POST';
 
@@ -113,6 +125,17 @@ const Calendario = ({ token, user }) => {
         
         // Mostrar mensaje de éxito
         alert(editingClase ? 'Clase actualizada exitosamente' : 'Clase creada exitosamente');
+      } else if (response.status === 409) {
+        // Choque de horario: mostrar con qué clases se cruza y permitir guardar igual
+        const { detail } = await response.json();
+        const choques = (detail.conflictos || []).map(({ existente }) => {
+          const inicio = new Date(existente.fecha_inicio).toLocaleString('es-CO');
+          const fin = new Date(existente.fecha_fin).toLocaleTimeString('es-CO', { hour: '2-digit', minute: '2-digit' });
+          return `• ${existente.titulo || 'Clase'}: ${inicio} - ${fin}`;
+        });
+        if (window.confirm(`${detail.mensaje}:\n\n${choques.join('\n')}\n\n¿Guardar de todas formas?`)) {
+          await handleCreateClase(claseData, true);
+        }
       } else {
         const errorData = await response.json();
         alert(`Error al ${editingClase ? 'actualizar' : 'crear'} clase: ` + (errorData.detail || 'Error desconocido'));
@@ -132,7 +155,16 @@ const Calendario = ({ token, user }) => {
     if (!selectedClase) return;
 
     try {
-      const response = await fetch(`${API_BASE_URL}/clases/${selectedClase.id}`, {
+      // Una ocurrencia de serie se cancela sola; la serie sigue igual
+      const esOcurrencia = selectedClase.id == null;
+      const response = await fetch(urlClase(selectedClase), esOcurrencia ? {
+        method: 'PUT',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`,
+        },
+        body: JSON.stringify({ cancelada: true }),
+      } : {
         method: 'DELETE',
         headers: {
           'Authorization': `Bearer ${token}`,
@@ -314,7 +346,7 @@ const Calendario = ({ token, user }) => {
                 <div className="space-y-1">
                   {clasesDelDia.slice(0, 2).map((clase) => (
                     <div
-                      key={clase.id}
+                      key={claveClase(clase)}
                       className={`text-xs p-1 rounded text-white truncate cursor-pointer ${
                         clase.ubicacion === 'Colegio' ? 'bg-green-500 hover:bg-green-600' : 'bg-purple-500 hover:bg-purple-600'
                       } transition-colors`}
@@ -385,7 +417,7 @@ const Calendario = ({ token, user }) => {
                   
                   return (
                     <div 
-                      key={clase.id} 
+                      key={claveClase(clase)} 
                       className={`flex items-start space-x-4 p-4 bg-gray-50 rounded-lg transition-opacity ${
                         isClasePast ? 'opacity-60' : ''
                       }`}
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Users, Calendar, CheckCircle, XCircle, MapPin, Clock, AlertTriangle } from 'lucide-react';
-import { getDashboardStats, authenticatedFetch } from '../utils/api';
+import { batchGet } from '../utils/api';
 import { formatDate, formatDateTime } from '../utils/dateUtils';
 
 const Dashboard = ({ user }) => {
@@ -29,23 +29,24 @@ const Dashboard = ({ user }) => {
       setError(null);
       console.log('Fetching dashboard data...');
       
-      // Obtener estadísticas del dashboard
-      const dashboardStats = await getDashboardStats();
+      // Estadísticas y asistencias recientes (últimos 30 días) en una sola petición
+      const desde = new Date(Date.now() - 30 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
+      const respuestas = await batchGet({
+        dashboard: '/estadisticas/dashboard',
+        recientes: `/asistencia/?fecha_inicio=${desde}`
+      });
+      if (respuestas.dashboard.status !== 200) {
+        throw new Error('Error al obtener estadísticas del dashboard');
+      }
+      const dashboardStats = respuestas.dashboard.body;
       console.log('Dashboard stats received:', dashboardStats);
 
-      // Obtener asistencias recientes (últimas 5)
+      // Asistencias recientes (últimas 5); no es crítico si fallan
       let recentAsistenciasData = [];
-      try {
-        const recentResponse = await authenticatedFetch('/asistencia?fecha_inicio=' + 
-          new Date(Date.now() - 30 * 24 * 60 * 60 * 1000).toISOString().split('T')[0] // Últimos 30 días
-        );
-        if (recentResponse.ok) {
-          const allRecent = await recentResponse.json();
-          recentAsistenciasData = allRecent.slice(0, 5); // Tomar solo los primeros 5
-        }
-      } catch (asistenciasError) {
-        console.warn('Error fetching recent asistencias:', asistenciasError);
-        // No es crítico, continuar sin asistencias recientes
+      if (respuestas.recientes.status === 200) {
+        recentAsistenciasData = respuestas.recientes.body.slice(0, 5);
+      } else {
+        console.warn('Error fetching recent asistencias:', respuestas.recientes.body);
       }
 
       // Procesar datos del dashboard
@@ -26,6 +26,7 @@ const LoginForm = ({ onLogin }) => {
       if (response.ok) {
         const data = await response.json();
         localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refresh_token', data.refresh_token);
         localStorage.setItem('user', JSON.stringify(data.profesora));
         onLogin(data.profesora);
       } else {
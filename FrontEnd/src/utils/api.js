@@ -1,8 +1,45 @@
 // utils/api.js
 export const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
+// Renovar el access token con el refresh token guardado (sin volver a pedir la contraseña).
+// Las peticiones que fallan a la vez comparten una sola renovación: el refresh token rota en cada uso.
+let refreshEnCurso = null;
+
+export const refreshAccessToken = () => {
+  if (!refreshEnCurso) {
+    refreshEnCurso = (async () => {
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken) return false;
+      const response = await fetch(`${API_BASE_URL}/token/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+      });
+      if (!response.ok) return false;
+      const data = await response.json();
+      localStorage.setItem('token', data.access_token);
+      localStorage.setItem('refresh_token', data.refresh_token);
+      return true;
+    })().catch(() => false).finally(() => {
+      refreshEnCurso = null;
+    });
+  }
+  return refreshEnCurso;
+};
+
+// Cerrar la sesión del dispositivo en el servidor
+export const revokeRefreshToken = () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) return Promise.resolve();
+  return fetch(`${API_BASE_URL}/logout`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ refresh_token: refreshToken })
+  }).catch(() => {});
+};
+
 // Función para hacer fetch con autenticación
-export const authenticatedFetch = async (endpoint, options = {}) => {
+export const authenticatedFetch = async (endpoint, options = {}, reintento = true) => {
   const token = localStorage.getItem('token');
   
   const defaultHeaders = {
@@ -30,9 +67,13 @@ export const authenticatedFetch = async (endpoint, options = {}) => {
   try {
     const response = await fetch(`${API_BASE_URL}${endpoint}`, config);
     
-    // Si el token ha expirado, redirigir al login
+    // Si el token ha expirado, renovarlo una vez; si no se puede, redirigir al login
     if (response.status === 401) {
+      if (reintento && await refreshAccessToken()) {
+        return authenticatedFetch(endpoint, options, false);
+      }
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       localStorage.removeItem('user');
       window.location.href = '/login';
       throw new Error('Token expirado');
@@ -177,6 +218,47 @@ export const deleteAprendiz = async (aprendizId) => {
   return response.json();
 };
 
+// Operaciones masivas: una sola petición para toda la lista
+export const createAprendicesBulk = async (aprendices) => {
+  const response = await authenticatedFetch('/aprendices/bulk', {
+    method: 'POST',
+    body: JSON.stringify({ aprendices })
+  });
+  if (!response.ok) throw new Error('Error al crear aprendices');
+  return response.json();
+};
+
+export const updateAprendicesBulk = async (aprendices) => {
+  const response = await authenticatedFetch('/aprendices/bulk', {
+    method: 'PUT',
+    body: JSON.stringify({ aprendices })
+  });
+  if (!response.ok) throw new Error('Error al actualizar aprendices');
+  return response.json();
+};
+
+export const reasignarAprendices = async (ids, profesoraId) => {
+  const response = await authenticatedFetch('/aprendices/bulk/reasignar', {
+    method: 'POST',
+    body: JSON.stringify({ ids, profesora_id: profesoraId })
+  });
+  if (!response.ok) throw new Error('Error al reasignar aprendices');
+  return response.json();
+};
+
+// Varios GET en una sola petición: devuelve { id: { status, headers, body } }
+export const batchGet = async (peticiones) => {
+  const response = await authenticatedFetch('/batch', {
+    method: 'POST',
+    body: JSON.stringify({
+      peticiones: Object.entries(peticiones).map(([id, path]) => ({ id, path }))
+    })
+  });
+  if (!response.ok) throw new Error('Error al cargar los datos');
+  const { respuestas } = await response.json();
+  return Object.fromEntries(respuestas.map((r) => [r.id, r]));
+};
+
 // Estadísticas y Dashboard
 export const getDashboardStats = async () => {
   const response = await authenticatedFetch('/estadisticas/dashboard');
@@ -266,7 +348,9 @@ export const isTokenValid = () => {
 
 // Función para logout
 export const logout = () => {
+  revokeRefreshToken();
   localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
   localStorage.removeItem('user');
   window.location.href = '/login';
 };
\ No newline at end of file